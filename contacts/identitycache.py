@@ -64,6 +64,8 @@ from p2p import p2p_stats
 
 _CachingTasks = {}
 _OverriddenIdentities = {}
+# idurl -> (ETag, Last-Modified, XML source) of the last downloaded valid copy
+_FetchedSources = {}
 
 #-------------------------------------------------------------------------------
 
@@ -85,6 +87,7 @@ def init():
 def shutdown():
     if _Debug:
         lg.out(4, 'identitycache.shutdown')
+    _FetchedSources.clear()
 
 #------------------------------------------------------------------------------
 
@@ -93,6 +96,9 @@ def Clear(excludeList=None):
     """
     Clear all cached identities.
     """
+    for idurl in _FetchedSources.keys():
+        if not excludeList or idurl not in excludeList:
+            _FetchedSources.pop(idurl, None)
     identitydb.clear(excludeList)
 
 
@@ -209,6 +215,7 @@ def Remove(idurl):
     """
     Remove an item from cache.
     """
+    _FetchedSources.pop(idurl, None)
     return identitydb.remove(idurl)
 
 
@@ -218,6 +225,10 @@ def UpdateAfterChecking(idurl, xml_src):
     changed.
     """
     #out(12, 'identitycache.UpdateAfterChecking ' + url)
+    fetched = _FetchedSources.get(idurl)
+    if fetched and fetched[2] != xml_src:
+        # identity source was received in another way, do not use conditional request next time
+        _FetchedSources.pop(idurl, None)
     return identitydb.update(idurl, xml_src)
 
 
@@ -297,12 +308,51 @@ def ReadOverriddenIdentityXMLSource(idurl):
 #------------------------------------------------------------------------------
 
 
-def getPageSuccess(src, idurl):
+def fetch(idurl, timeout=0):
+    """
+    Download identity source and update the cache.
+
+    If that identity was downloaded before a conditional request is sent,
+    so identity server can reply with "304 Not Modified" and we do not
+    need to parse and verify same identity again.
+    Result is a tuple: (XML source, True if identity is valid).
+    """
+    etag, last_modified, known_src = _FetchedSources.get(idurl, (None, None, None, ))
+    if known_src and not identitydb.has_idurl(idurl):
+        # was removed from memory, must be downloaded and verified again
+        _FetchedSources.pop(idurl, None)
+        etag, last_modified, known_src = None, None, None
+    d = net_misc.getPageConditional(idurl, timeout, etag=etag, last_modified=last_modified)
+    d.addCallback(_on_fetched, idurl, known_src)
+    return d
+
+
+def _on_fetched(response, idurl, known_src):
+    code, src, etag, last_modified = response
+    if code == 304:
+        if not known_src:
+            raise Exception('identity %s was not modified, but it is not cached' % idurl)
+        if _Debug:
+            lg.out(14, '    [not modified] %s' % idurl)
+        identitydb.touch(idurl)
+        p2p_stats.count_identity_cache_not_modified(idurl)
+        return known_src, True
+    if not UpdateAfterChecking(idurl, src):
+        _FetchedSources.pop(idurl, None)
+        return src, False
+    if etag or last_modified:
+        _FetchedSources[idurl] = (etag, last_modified, src, )
+    else:
+        _FetchedSources.pop(idurl, None)
+    p2p_stats.count_identity_cache(idurl, len(src))
+    return src, True
+
+
+def getPageSuccess(result, idurl):
     """
     This is called when requested identity source gets received.
     """
-    UpdateAfterChecking(idurl, src)
-    p2p_stats.count_identity_cache(idurl, len(src))
+    src, _ = result
     return src
 
 
@@ -320,7 +370,7 @@ def pageRequestTwisted(idurl, timeout=0):
     """
     Request an HTML page - this can be an user identity.
     """
-    d = net_misc.getPageTwisted(idurl, timeout)
+    d = fetch(idurl, timeout)
     d.addCallback(getPageSuccess, idurl)
     d.addErrback(getPageFail, idurl)
     return d
@@ -343,18 +393,18 @@ def immediatelyCaching(idurl, timeout=0):
     if idurl in _CachingTasks:
         return _CachingTasks[idurl]
 
-    def _getPageSuccess(src, idurl):
+    def _getPageSuccess(fetched, idurl):
         global _CachingTasks
+        src, valid = fetched
         result = _CachingTasks.pop(idurl, None)
         if not result:
             lg.warn('caching task for %s was not found' % idurl)
             return src
-        if UpdateAfterChecking(idurl, src):
+        if valid:
             if result:
                 result.callback(src)
             if _Debug:
                 lg.out(14, '    [cached] %s' % idurl)
-            p2p_stats.count_identity_cache(idurl, len(src))
         else:
             if result:
                 result.errback(Exception(src))
@@ -376,7 +426,7 @@ def immediatelyCaching(idurl, timeout=0):
         return None
 
     _CachingTasks[idurl] = Deferred()
-    d = net_misc.getPageTwisted(idurl, timeout)
+    d = fetch(idurl, timeout)
     d.addCallback(_getPageSuccess, idurl)
     d.addErrback(_getPageFail, idurl)
     if _Debug:
@@ -48,6 +48,8 @@ from lib import nameurl
 
 from userid import identity
 
+from crypt import key
+
 #------------------------------------------------------------------------------
 
 # Dictionary cache of identities - lookup by primary url
@@ -117,6 +119,7 @@ def clear(exclude_list=None):
     _Contact2IDURL.clear()
     _IPPort2IDURL.clear()
     _IDURL2Contacts.clear()
+    key.ClearPublicKeysCache()
     iddir = settings.IdentityCacheDir()
     if not os.path.exists(iddir):
         return
@@ -175,6 +178,9 @@ def idset(idurl, id_obj):
     global _IdentityCacheModifiedTime
     if not has_idurl(idurl):
         lg.out(6, 'identitydb.idset new identity: ' + idurl)
+    elif _IdentityCache[idurl].signature != id_obj.signature:
+        # new revision of that identity, cached public key object must be refreshed
+        key.ForgetPublicKey(_IdentityCache[idurl].publickey)
     _IdentityCache[idurl] = id_obj
     _IdentityCacheModifiedTime[idurl] = time.time()
     identid = _IdentityCacheIDs.get(idurl, None)
@@ -227,6 +233,7 @@ def idremove(url):
     _IdentityCacheModifiedTime.pop(url, None)
     _IDURL2Contacts.pop(url, None)
     if idobj is not None:
+        key.ForgetPublicKey(idobj.publickey)
         for contact in idobj.getContacts():
             _Contact2IDURL.pop(contact, None)
             try:
@@ -331,10 +338,12 @@ def update(url, xml_src):
         return False
 
     filename = os.path.join(settings.IdentityCacheDir(), nameurl.UrlFilename(url))
-    if os.path.exists(filename):
+    oldidentity = idget(url)
+    if oldidentity is None and os.path.exists(filename):
         oldidentityxml = bpio.ReadTextFile(filename)
         oldidentity = identity.identity(xmlsrc=oldidentityxml)
 
+    if oldidentity is not None:
         if oldidentity.publickey != newid.publickey:
             lg.out(1, "identitydb.update ERROR new publickey does not match old : SECURITY VIOLATION " + url)
             return False
@@ -342,6 +351,8 @@ def update(url, xml_src):
         if oldidentity.signature != newid.signature:
             lg.out(6, 'identitydb.update have new data for ' + nameurl.GetName(url))
         else:
+            if not os.path.exists(filename):
+                bpio.WriteFile(filename, xml_src)
             idset(url, newid)
             return True
 
@@ -408,6 +419,17 @@ def get_last_modified_time(idurl):
     global _IdentityCacheModifiedTime
     return _IdentityCacheModifiedTime.get(idurl, None)
 
+
+def touch(idurl):
+    """
+    Mark cached identity as fresh, when we checked that source was not changed.
+    """
+    global _IdentityCacheModifiedTime
+    if not has_idurl(idurl):
+        return False
+    _IdentityCacheModifiedTime[idurl] = time.time()
+    return True
+
 #------------------------------------------------------------------------------
 
 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# benchmark.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (benchmark.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: benchmark.
+
+Measure speed of packets serialization in different formats
+and the cost of packet hash calculation.
+
+    python crypt/benchmark.py
+"""
+
+import os
+import sys
+import time
+import types
+
+if __name__ == '__main__':
+    dirpath = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sys.path.insert(0, os.path.abspath(os.path.join(dirpath, '..')))
+
+from crypt import key
+from crypt import signed
+
+#------------------------------------------------------------------------------
+
+PAYLOAD_SIZES = [
+    1024,
+    64 * 1024,
+    1024 * 1024,
+    8 * 1024 * 1024,
+]
+
+#------------------------------------------------------------------------------
+
+
+def _make_packet(payload_size):
+    # packet is created without calling __init__(), so no keys are needed to sign it
+    return types.InstanceType(signed.Packet, {
+        'Command': 'Data',
+        'OwnerID': 'http://somehost.net/alice.xml',
+        'CreatorID': 'http://somehost.net/alice.xml',
+        'PacketID': 'master$alice@somehost.net:0/F20180101010101AM/1-2-Data',
+        'Date': '2018/01/01 01:01:01 AM',
+        'Payload': os.urandom(payload_size),
+        'RemoteID': 'http://otherhost.net/bob.xml',
+        'KeyID': 'master$alice@somehost.net',
+        'Signature': str(2 ** 2047 + 12345),
+        'Packets': [],
+    })
+
+
+def _measure(func, arg, total_bytes):
+    count = max(1, int(32 * 1024 * 1024 / total_bytes))
+    t = time.time()
+    for _ in xrange(count):
+        result = func(arg)
+    dt = (time.time() - t) / count
+    return result, total_bytes / max(dt, 0.000001) / (1024.0 * 1024.0)
+
+
+def bench_serialize():
+    print '%10s %16s %16s %16s %16s  %s' % (
+        'payload', 'pickle ser MB/s', 'pickle uns MB/s', 'binary ser MB/s', 'binary uns MB/s', 'same')
+    for payload_size in PAYLOAD_SIZES:
+        p = _make_packet(payload_size)
+        src_pickle, pickle_ser = _measure(lambda x: x.Serialize(), p, payload_size)
+        p_pickle, pickle_uns = _measure(signed.Unserialize, src_pickle, payload_size)
+        src_binary, binary_ser = _measure(lambda x: x.Serialize(binary=True), p, payload_size)
+        p_binary, binary_uns = _measure(signed.Unserialize, src_binary, payload_size)
+        same = True
+        for field in signed.BINARY_FORMAT_FIELDS + ('Payload', ):
+            if getattr(p_pickle, field) != getattr(p_binary, field):
+                same = False
+        print '%10d %16.1f %16.1f %16.1f %16.1f  %s' % (
+            payload_size, pickle_ser, pickle_uns, binary_ser, binary_uns, same)
+
+
+def bench_hash():
+    print '%10s %14s %14s %22s %22s  %s' % (
+        'payload', 'joined MB/s', 'parts MB/s', 'joined extra bytes', 'parts extra bytes', 'same')
+    for payload_size in PAYLOAD_SIZES:
+        p = _make_packet(payload_size)
+        hash_joined, joined_speed = _measure(lambda x: key.Hash(x.GenerateHashBase()), p, payload_size)
+        hash_parts, parts_speed = _measure(lambda x: x.GenerateHash(), p, payload_size)
+        # joined string is allocated as a whole, with parts only the small header is allocated
+        joined_extra = len(p.GenerateHashBase())
+        parts_extra = sum([len(part) for part in p.GenerateHashParts() if part is not p.Payload])
+        print '%10d %14.1f %14.1f %22d %22d  %s' % (
+            payload_size, joined_speed, parts_speed, joined_extra, parts_extra, hash_joined == hash_parts)
+
+
+def main():
+    bench_serialize()
+    bench_hash()
+
+
+if __name__ == "__main__":
+    main()
@@ -90,6 +90,8 @@ class Block:
                            into packets
     Length                 real length of data when cleartext (encrypted may be padded)
     LastBlock              should now be "True" or "False" - careful in using
+    Reference              "True" if data is only a reference to same block in older version,
+                           see ``storage.dedup_index``
     SessionKeyType         which crypto is used for session key
     EncryptedSessionKey    encrypted with our public key so only we can read this
     Other                  could be be for professional timestamp company or other future features
@@ -105,7 +107,8 @@ class Block:
                  LastBlock=True,
                  Data='',
                  EncryptKey=None,
-                 DecryptKey=None, ):
+                 DecryptKey=None,
+                 Reference=False, ):
         self.CreatorID = CreatorID
         if not self.CreatorID:
             self.CreatorID = my_id.getLocalID()
@@ -122,6 +125,7 @@ class Block:
             self.SessionKeyType = key.SessionKeyType()
         self.Length = len(Data)
         self.LastBlock = bool(LastBlock)
+        self.Reference = bool(Reference)
         self.EncryptedData = key.EncryptWithSessionKey(SessionKey, Data)  # DataLonger
         self.Signature = None
         self.Sign()
@@ -152,22 +156,33 @@ class Block:
         Generate a single string with all data fields, used to create a hash
         for that ``encrypted_block``.
         """
+        return ''.join(self.GenerateHashParts())
+
+    def GenerateHashParts(self):
+        """
+        Return a list of strings which together are equal to ``GenerateHashBase()``,
+        EncryptedData is not copied.
+        """
         sep = "::::"
-        StringToHash = self.CreatorID
-        StringToHash += sep + self.BackupID
-        StringToHash += sep + str(self.BlockNumber)
-        StringToHash += sep + self.SessionKeyType
-        StringToHash += sep + self.EncryptedSessionKey
-        StringToHash += sep + str(self.Length)
-        StringToHash += sep + str(self.LastBlock)
-        StringToHash += sep + self.EncryptedData
-        return StringToHash
+        return [
+            self.CreatorID +
+            sep + self.BackupID +
+            sep + str(self.BlockNumber) +
+            sep + self.SessionKeyType +
+            sep + self.EncryptedSessionKey +
+            sep + str(self.Length) +
+            sep + str(self.LastBlock) +
+            # blocks created before references were introduced do not have that field
+            (sep + 'Reference' if getattr(self, 'Reference', False) else '') +
+            sep,
+            self.EncryptedData,
+        ]
 
     def GenerateHash(self):
         """
-        Create a hash for that ``encrypted_block`` using ``crypt.key.Hash()``.
+        Create a hash for that ``encrypted_block`` using ``crypt.key.HashParts()``.
         """
-        return key.Hash(self.GenerateHashBase())
+        return key.HashParts(self.GenerateHashParts())
 
     def Sign(self):
         """
@@ -56,3 +56,16 @@ def sha256(inp, hexdigest=False):
     if hexdigest:
         return h.hexdigest()
     return h.digest()
+
+
+def sha1_parts(parts, hexdigest=False):
+    """
+    Same as ``sha1()``, but input strings are fed into the hash one by one,
+    so they do not need to be joined into one big string first.
+    """
+    h = SHA1.new()
+    for part in parts:
+        h.update(part)
+    if hexdigest:
+        return h.hexdigest()
+    return h.digest()
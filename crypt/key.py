@@ -42,6 +42,9 @@ _DebugLevel = 4
 import os
 import sys
 import gc
+import threading
+
+from collections import OrderedDict
 
 #------------------------------------------------------------------------------
 
@@ -65,6 +68,12 @@ from crypt import aes_cbc
 
 _MyKeyObject = None
 
+_PublicKeysCache = OrderedDict()
+_PublicKeysCacheLock = threading.Lock()
+_PublicKeysCacheMaxSize = 500
+_PublicKeysCacheHits = 0
+_PublicKeysCacheMisses = 0
+
 #------------------------------------------------------------------------------
 
 
@@ -209,8 +218,7 @@ def VerifySignature(pubkeystring, hashcode, signature):
 
     Return True if signature is correct, otherwise False.
     """
-    pub_key = rsa_key.RSAKey()
-    pub_key.fromString(pubkeystring)
+    pub_key = GetPublicKeyObject(pubkeystring)
     result = pub_key.verify(signature, hashcode)
     return result
 
@@ -259,6 +267,14 @@ def Hash(inp, hexdigest=False):
     """
     return HashSHA(inp, hexdigest=hexdigest)
 
+
+def HashParts(parts, hexdigest=False):
+    """
+    Calculate same hash as ``Hash()`` does for ``''.join(parts)``, but
+    without allocating the joined string.
+    """
+    return hashes.sha1_parts(parts, hexdigest=hexdigest)
+
 #------------------------------------------------------------------------------
 
 
@@ -305,8 +321,7 @@ def EncryptOpenSSHPublicKey(pubkeystring, inp):
     """
     Encrypt ``inp`` string with given Public Key.
     """
-    pub_key = rsa_key.RSAKey()
-    pub_key.fromString(pubkeystring)
+    pub_key = GetPublicKeyObject(pubkeystring)
     result = pub_key.encrypt(inp)
     return result
 
@@ -347,6 +362,67 @@ def DecryptLocalPrivateKey(inp):
 #------------------------------------------------------------------------------
 
 
+def GetPublicKeyObject(pubkeystring):
+    """
+    Return ``rsa_key.RSAKey`` object for given Public Key in openssh format.
+
+    Imported key objects are kept in a bounded LRU cache, so the same
+    Public Key is not parsed again for every incoming packet.
+    This method can be called from multiple threads.
+    """
+    global _PublicKeysCacheHits
+    global _PublicKeysCacheMisses
+    with _PublicKeysCacheLock:
+        pub_key = _PublicKeysCache.pop(pubkeystring, None)
+        if pub_key is not None:
+            _PublicKeysCache[pubkeystring] = pub_key
+            _PublicKeysCacheHits += 1
+            return pub_key
+        _PublicKeysCacheMisses += 1
+    pub_key = rsa_key.RSAKey()
+    pub_key.fromString(pubkeystring)
+    with _PublicKeysCacheLock:
+        _PublicKeysCache[pubkeystring] = pub_key
+        while len(_PublicKeysCache) > _PublicKeysCacheMaxSize:
+            _PublicKeysCache.popitem(last=False)
+    return pub_key
+
+
+def ForgetPublicKey(pubkeystring):
+    """
+    Remove cached key object for given Public Key, if exists.
+    """
+    with _PublicKeysCacheLock:
+        return _PublicKeysCache.pop(pubkeystring, None) is not None
+
+
+def ClearPublicKeysCache():
+    """
+    Remove all cached Public Key objects and reset counters.
+    """
+    global _PublicKeysCacheHits
+    global _PublicKeysCacheMisses
+    with _PublicKeysCacheLock:
+        _PublicKeysCache.clear()
+        _PublicKeysCacheHits = 0
+        _PublicKeysCacheMisses = 0
+
+
+def PublicKeysCacheStats():
+    """
+    Return a dictionary with current state of the Public Keys cache.
+    """
+    with _PublicKeysCacheLock:
+        return {
+            'size': len(_PublicKeysCache),
+            'max_size': _PublicKeysCacheMaxSize,
+            'hits': _PublicKeysCacheHits,
+            'misses': _PublicKeysCacheMisses,
+        }
+
+#------------------------------------------------------------------------------
+
+
 def SpeedTest():
     """
     Some tests to check the performance.
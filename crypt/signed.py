@@ -40,6 +40,16 @@ Packet Fields are all strings (no integers, objects, etc)
     - RemoteID : want full IDURL for other party so troublemaker could not
                 use his packets to mess up other nodes by sending it to them
     - Signature : signature on Hash is always by CreatorID
+
+Packets are serialized with ``pickle`` by default. Nodes which put ``BINARY_FORMAT_TAG``
+into the "version" field of their identity also accept a compact binary format:
+
+    magic "BDPK", 1 byte format version,
+    then every field as 4 bytes big-endian length (0xFFFFFFFF means None) followed by field value,
+    fields order is: Command, OwnerID, CreatorID, PacketID, Date, RemoteID, KeyID, Signature, Payload.
+
+Payload goes last, so it is not copied when the packet is written out in parts.
+``Unserialize()`` detects the format automatically.
 """
 
 #------------------------------------------------------------------------------
@@ -50,6 +60,7 @@ _DebugLevel = 10
 #------------------------------------------------------------------------------
 
 import sys
+import struct
 
 import types
 
@@ -75,6 +86,12 @@ from crypt import my_keys
 
 from userid import my_id
 
+BINARY_FORMAT_MAGIC = 'BDPK'
+BINARY_FORMAT_VERSION = 1
+BINARY_FORMAT_TAG = 'packet-format:binary%d' % BINARY_FORMAT_VERSION
+BINARY_FORMAT_FIELDS = ('Command', 'OwnerID', 'CreatorID', 'PacketID', 'Date', 'RemoteID', 'KeyID', 'Signature', )
+BINARY_FORMAT_NONE = 0xFFFFFFFF
+
 #------------------------------------------------------------------------------
 
 
@@ -151,35 +168,37 @@ class Packet:
 
         Just to be able to generate a hash of the whole packet .
         """
+        return ''.join(self.GenerateHashParts())
+
+    def GenerateHashParts(self):
+        """
+        Return a list of strings which together are equal to ``GenerateHashBase()``,
+        Payload is not copied.
+        """
         sep = "-"
-        stufftosum = ""
         try:
-            stufftosum += str(self.Command)
-            stufftosum += sep
-            stufftosum += str(self.OwnerID)
-            stufftosum += sep
-            stufftosum += str(self.CreatorID)
-            stufftosum += sep
-            stufftosum += str(self.PacketID)
-            stufftosum += sep
-            stufftosum += str(self.Date)
-            stufftosum += sep
-            stufftosum += self.Payload
-            stufftosum += sep
-            stufftosum += str(self.RemoteID)
+            parts = [
+                str(self.Command) + sep +
+                str(self.OwnerID) + sep +
+                str(self.CreatorID) + sep +
+                str(self.PacketID) + sep +
+                str(self.Date) + sep,
+                self.Payload,
+                sep + str(self.RemoteID),
+            ]
             if self.KeyID:
-                stufftosum += sep
-                stufftosum += str(self.KeyID)
+                parts.append(sep + str(self.KeyID))
         except Exception as exc:
             lg.exc()
             raise exc
-        return stufftosum
+        return parts
 
     def GenerateHash(self):
         """
-        Call ``crypt.key.Hash`` to create a hash code for that ``packet``.
+        Call ``crypt.key.HashParts`` to create a hash code for that ``packet``,
+        fields are fed into the hash one by one.
         """
-        return key.Hash(self.GenerateHashBase())
+        return key.HashParts(self.GenerateHashParts())
 
     def GenerateSignature(self):
         """
@@ -257,12 +276,16 @@ class Packet:
         """
         return packetid.SupplierNumber(self.PacketID)
 
-    def Serialize(self):
+    def Serialize(self, binary=False):
         """
         Create a string from packet object using ``lib.misc.ObjectToString``.
 
         This is useful when need to save the packet on disk.
+        If ``binary`` is True the compact binary format is used instead,
+        see ``SerializeParts()``.
         """
+        if binary:
+            return ''.join(self.SerializeParts())
         if hasattr(self, 'Packets'):
             currentPackets = getattr(self, 'Packets')
             delattr(self, 'Packets')
@@ -273,6 +296,25 @@ class Packet:
         # lg.out(10, 'signed.Serialize %d bytes, type is %s' % (len(src), str(type(src))))
         return src
 
+    def SerializeParts(self):
+        """
+        Create a list of strings with packet in binary format: a header with
+        all fields and the Payload itself, which is not copied.
+
+        Parts can be written to a file or socket one by one.
+        """
+        header = [BINARY_FORMAT_MAGIC, chr(BINARY_FORMAT_VERSION), ]
+        for field in BINARY_FORMAT_FIELDS:
+            value = getattr(self, field, None)
+            if value is None:
+                header.append(struct.pack('>I', BINARY_FORMAT_NONE))
+            else:
+                value = str(value)
+                header.append(struct.pack('>I', len(value)))
+                header.append(value)
+        header.append(struct.pack('>I', len(self.Payload)))
+        return [''.join(header), self.Payload, ]
+
     def __len__(self):
         """
         Return a length of serialized packet .
@@ -300,6 +342,8 @@ def Unserialize(data):
     """
     if data is None:
         return None
+    if data.startswith(BINARY_FORMAT_MAGIC):
+        return UnserializeBinary(data)
     # lg.out(10, 'signed.Unserialize %d bytes, type is %s' % (len(data), str(type(data))))
     newobject = misc.StringToObject(data)
     if newobject is None:
@@ -318,6 +362,57 @@ def Unserialize(data):
     return newobject
 
 
+def UnserializeBinary(data):
+    """
+    Create a packet object from a string in binary format, see ``Packet.SerializeParts()``.
+
+    No code is executed while reading the data, only known fields are loaded.
+    """
+    if not data.startswith(BINARY_FORMAT_MAGIC) or len(data) < len(BINARY_FORMAT_MAGIC) + 1:
+        lg.warn("not a binary packet")
+        return None
+    offset = len(BINARY_FORMAT_MAGIC)
+    version = ord(data[offset])
+    if version != BINARY_FORMAT_VERSION:
+        lg.warn("unknown binary packet format version: %d" % version)
+        return None
+    offset += 1
+    values = {}
+    try:
+        for field in BINARY_FORMAT_FIELDS + ('Payload', ):
+            length, = struct.unpack_from('>I', data, offset)
+            offset += 4
+            if length == BINARY_FORMAT_NONE:
+                values[field] = None
+                continue
+            if offset + length > len(data):
+                lg.warn("binary packet is too short, field %s is truncated" % field)
+                return None
+            values[field] = data[offset:offset + length]
+            offset += length
+    except struct.error:
+        lg.warn("binary packet header is broken")
+        return None
+    if offset != len(data):
+        lg.warn("binary packet has %d extra bytes" % (len(data) - offset))
+        return None
+    if values['Payload'] is None:
+        values['Payload'] = ''
+    # create an instance without calling __init__(), it will try to sign the packet
+    newobject = types.InstanceType(Packet, values)
+    newobject.Packets = []
+    return newobject
+
+
+def SupportsBinaryFormat(ident):
+    """
+    Return True if remote node with given identity is able to read packets in binary format.
+    """
+    if ident is None:
+        return False
+    return BINARY_FORMAT_TAG in (ident.version or '').split(' ')
+
+
 def MakePacket(Command, OwnerID, CreatorID, PacketID, Payload, RemoteID):
     """
     Just calls the constructor of packet class.
@@ -275,6 +275,7 @@ class DataSender(automat.Automat):
                 return
         count = 0
         from storage import backup_matrix
+        from storage import local_manifest
         from storage import restore_monitor
         from storage import backup_rebuilder
         if _Debug:
@@ -317,6 +318,7 @@ class DataSender(automat.Automat):
                         lg.exc()
                         continue
                     count += 1
+                local_manifest.piece_removed(packetID)
         if _Debug:
             lg.out(_DebugLevel, '    %d files were removed' % count)
         backup_matrix.ReadLocalFiles()
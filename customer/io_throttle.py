@@ -54,6 +54,9 @@ _DebugLevel = 12
 import os
 import sys
 import time
+import heapq
+
+from collections import OrderedDict
 
 #------------------------------------------------------------------------------
 
@@ -337,12 +340,22 @@ class SupplierQueue:
         # self.fileSendQueueMaxLength = 32
         # active files
         self.fileSendMaxLength = 4
-        # an array of packetId, preserving first in first out,
-        # of which the first maxLength are the "active" sends
-        self.fileSendQueue = []
+        # all queued packetIDs, preserving first in first out
+        self.fileSendQueue = OrderedDict()
         # dictionary of FileToSend's using packetId as index,
         # hold onto stuff sent and acked for some period as a history?
         self.fileSendDict = {}
+        # packets waiting to be sent, first in first out,
+        # small packets are also listed separately - they can go without waiting
+        self.fileSendReady = OrderedDict()
+        self.fileSendReadySmall = OrderedDict()
+        # packets already sent and waiting for Ack
+        self.fileSendInFlight = set()
+        # packets acked or failed after last RunSend() call, will be removed from the queue
+        self.fileSendFinished = set()
+        self.fileSendFailed = OrderedDict()
+        # heap of (deadline, packetID) for packets in flight
+        self.fileSendTimeouts = []
 
         # all requests we'll hold on to,
         # only several will be active, but will hold onto the next ones to be sent
@@ -359,7 +372,6 @@ class SupplierQueue:
         self.ackedCount = 0
         self.failedCount = 0
 
-        self.sendFailedPacketIDs = []
         self.requestFailedPacketIDs = []
 
         self._runSend = False
@@ -417,14 +429,18 @@ class SupplierQueue:
             if callOnFail is not None:
                 reactor.callLater(0, callOnFail, self.remoteID, packetID, 'in queue')
             return False
-        self.fileSendQueue.append(packetID)
-        self.fileSendDict[packetID] = FileToSend(
+        fileToSend = FileToSend(
             fileName,
             packetID,
             self.remoteID,
             ownerID,
             callOnAck,
             callOnFail,)
+        self.fileSendQueue[packetID] = None
+        self.fileSendDict[packetID] = fileToSend
+        self.fileSendReady[packetID] = None
+        if fileToSend.fileSize <= 1024 * 10:
+            self.fileSendReadySmall[packetID] = None
         if _Debug:
             lg.out(_DebugLevel, "io_throttle.SupplierSendFile %s to %s, %d queued items" % (
                 packetID, self.remoteName, len(self.fileSendQueue)))
@@ -437,66 +453,57 @@ class SupplierQueue:
             return
         self._runSend = True
         #out(6, 'io_throttle.RunSend')
-        packetsFialed = {}
         packetsToRemove = set()
         packetsSent = 0
-        # let's check all packets in the queue
-        for i in xrange(len(self.fileSendQueue)):
-            try:
-                packetID = self.fileSendQueue[i]
-            except:
-                lg.warn("item at position %d not exist in send queue" % i)
-                continue
-            fileToSend = self.fileSendDict[packetID]
-            # we got notify that this packet was failed to send
-            if packetID in self.sendFailedPacketIDs:
-                self.sendFailedPacketIDs.remove(packetID)
-                packetsFialed[packetID] = 'failed'
+        # packets sent some time ago and still not acked are failed because no response on them
+        now = time.time()
+        while self.fileSendTimeouts and self.fileSendTimeouts[0][0] <= now:
+            _, packetID, sendTime = heapq.heappop(self.fileSendTimeouts)
+            if packetID not in self.fileSendInFlight:
+                # already acked or failed
                 continue
-            # we already sent the file
-            if fileToSend.sendTime is not None:
-                packetsSent += 1
-                # and we got ack
-                if fileToSend.ackTime is not None:
-                    # deltaTime = fileToSend.ackTime - fileToSend.sendTime
-                    # so remove it from queue
-                    packetsToRemove.add(packetID)
-                # if we do not get an ack ...
-                else:
-                    # ... we do not want to wait to long
-                    if time.time() - fileToSend.sendTime > fileToSend.sendTimeout:
-                        # so this packet is failed because no response on it
-                        packetsFialed[packetID] = 'timeout'
-                # we sent this packet already - check next one
+            if self.fileSendDict[packetID].sendTime != sendTime:
                 continue
-            # the data file to send no longer exists - it is failed situation
-            if not os.path.exists(fileToSend.fileName):
-                lg.warn("file %s not exist" % (fileToSend.fileName))
-                packetsFialed[packetID] = 'not exist'
+            self._markSendFailed(packetID, 'timeout')
+        # process failed packets
+        while self.fileSendFailed:
+            packetID, why = self.fileSendFailed.popitem(last=False)
+            if packetID not in self.fileSendDict:
                 continue
+            self.OnFileSendFailReceived(self.fileSendDict[packetID].remoteID, packetID, why)
+            packetsToRemove.add(packetID)
+        # acked packets are done
+        packetsToRemove.update(self.fileSendFinished)
+        self.fileSendFinished.clear()
+        # remove finished packets
+        for packetID in packetsToRemove:
+            self._removeSendItem(packetID)
+            if _Debug:
+                lg.out(_DebugLevel, "io_throttle.RunSend removed %s from %s sending queue, %d more items" % (
+                    packetID, self.remoteName, len(self.fileSendQueue)))
+        # send next packets from the queue
+        while self.fileSendReady:
             # do not send too many packets, need to wait for ack
             # hold other packets in the queue and may be send next time
-            if packetsSent > self.fileSendMaxLength:
+            if len(self.fileSendInFlight) > self.fileSendMaxLength:
                 # if we sending big file - we want to wait
                 # other packets must go without waiting in the queue
                 # 10K seems fine, because we need to filter only Data and Parity packets here
-                try:
-                    if os.path.getsize(fileToSend.fileName) > 1024 * 10:
-                        continue
-                except:
-                    lg.exc()
-                    continue
+                if not self.fileSendReadySmall:
+                    break
+                packetID, _ = self.fileSendReadySmall.popitem(last=False)
+                del self.fileSendReady[packetID]
+            else:
+                packetID, _ = self.fileSendReady.popitem(last=False)
+                self.fileSendReadySmall.pop(packetID, None)
+            fileToSend = self.fileSendDict[packetID]
             # prepare the packet
-            # dt = time.time()
             Payload = str(bpio.ReadBinaryFile(fileToSend.fileName))
-            # newpacket = signed.Packet(
-            #     commands.Data(),
-            #     fileToSend.ownerID,
-            #     self.creatorID,
-            #     fileToSend.packetID,
-            #     Payload,
-            #     fileToSend.remoteID,
-            # )
+            if not Payload and not os.path.isfile(fileToSend.fileName):
+                # the data file to send no longer exists - it is failed situation
+                lg.warn("file %s not exist" % (fileToSend.fileName))
+                self._markSendFailed(packetID, 'not exist')
+                continue
             p2p_service.SendData(
                 raw_data=Payload,
                 ownerID=fileToSend.ownerID,
@@ -510,48 +517,45 @@ class SupplierQueue:
             )
             # outbox will not resend, because no ACK, just data,
             # need to handle resends on own
-            # transport_control.outboxNoAck(newpacket)
-            # gateway.outbox(newpacket, callbacks={
-            #     commands.Ack(): self.OnFileSendAckReceived,
-            #     commands.Fail(): self.OnFileSendAckReceived,
-            # })
-
-            # str(bpio.ReadBinaryFile(fileToSend.fileName))
-            # {commands.Ack(): self.OnFileSendAckReceived,
-            # commands.Fail(): self.OnFileSendAckReceived}
-
-            # transport_control.RegisterInterest(
-            #     self.OnFileSendAckReceived,
-            #     fileToSend.remoteID,
-            #     fileToSend.packetID)
-            # callback.register_interest(self.OnFileSendAckReceived, fileToSend.remoteID, fileToSend.packetID)
-            # lg.out(12, 'io_throttle.RunSend %s to %s, dt=%s' % (
-            #     str(newpacket), nameurl.GetName(fileToSend.remoteID), str(time.time()-dt)))
             # mark file as been sent
             fileToSend.sendTime = time.time()
+            self.fileSendInFlight.add(packetID)
+            heapq.heappush(self.fileSendTimeouts, (
+                fileToSend.sendTime + fileToSend.sendTimeout, packetID, fileToSend.sendTime, ))
             packetsSent += 1
-        # process failed packets
-        for packetID, why in packetsFialed.items():
-            self.OnFileSendFailReceived(self.fileSendDict[packetID].remoteID, packetID, why)
-            packetsToRemove.add(packetID)
-        # remove finished packets
-        for packetID in packetsToRemove:
-            self.fileSendQueue.remove(packetID)
-            del self.fileSendDict[packetID]
-            if _Debug:
-                lg.out(_DebugLevel, "io_throttle.RunSend removed %s from %s sending queue, %d more items" % (
-                    packetID, self.remoteName, len(self.fileSendQueue)))
-        # if sending queue is empty - remove all records about packets failed to send
+        # if sending queue is empty - forget all outdated timeouts
         if len(self.fileSendQueue) == 0:
-            del self.sendFailedPacketIDs[:]
+            del self.fileSendTimeouts[:]
         # remember results
-        result = max(len(packetsToRemove), packetsSent)
+        result = max(len(packetsToRemove), packetsSent, len(self.fileSendInFlight))
         # erase temp lists
-        del packetsFialed
         del packetsToRemove
         self._runSend = False
         return result
 
+    def _markSendFailed(self, packetID, why):
+        """
+        Move packet into the failed state, it will be reported and removed
+        from the queue during next ``RunSend()`` call.
+        """
+        self.fileSendInFlight.discard(packetID)
+        self.fileSendReady.pop(packetID, None)
+        self.fileSendReadySmall.pop(packetID, None)
+        if packetID not in self.fileSendFailed:
+            self.fileSendFailed[packetID] = why
+
+    def _removeSendItem(self, packetID):
+        """
+        Erase packet from the sending queue whatever state it is in.
+        """
+        self.fileSendQueue.pop(packetID, None)
+        self.fileSendDict.pop(packetID, None)
+        self.fileSendReady.pop(packetID, None)
+        self.fileSendReadySmall.pop(packetID, None)
+        self.fileSendInFlight.discard(packetID)
+        self.fileSendFinished.discard(packetID)
+        self.fileSendFailed.pop(packetID, None)
+
     def SendingTask(self):
         sends = self.RunSend()
         self.sendTaskDelay = misc.LoopAttenuation(
@@ -710,8 +714,7 @@ class SupplierQueue:
                 packetsToRemove.add(packetID)
         for packetID in packetsToRemove:
             if packetID in self.fileSendDict:
-                self.fileSendQueue.remove(packetID)
-                del self.fileSendDict[packetID]
+                self._removeSendItem(packetID)
                 if _Debug:
                     lg.out(_DebugLevel, "io_throttle.DeleteBackupSendings removed %s from %s sending queue, %d more items" % (
                         packetID, self.remoteName, len(self.fileSendQueue)))
@@ -751,7 +754,7 @@ class SupplierQueue:
         if status != 'finished':
             if packetID in self.fileSendQueue:
                 lg.warn('packet %s status is %s in sending queue for %s' % (packetID, status, self.remoteName))
-                self.sendFailedPacketIDs.append(packetID)
+                self._markSendFailed(packetID, 'failed')
                 # reactor.callLater(0, self.DoSend)
                 self.DoSend()
             if packetID in self.fileRequestQueue:
@@ -790,10 +793,13 @@ class SupplierQueue:
         if packetID not in self.fileSendQueue:
             lg.warn("packet %s not in sending queue for %s" % (newpacket.PacketID, self.remoteName))
             return
-        if packetID not in self.fileSendDict.keys():
+        if packetID not in self.fileSendDict:
             lg.warn("packet %s not in sending dict for %s" % (newpacket.PacketID, self.remoteName))
             return
         self.fileSendDict[packetID].ackTime = time.time()
+        if packetID not in self.fileSendFailed:
+            self.fileSendInFlight.discard(packetID)
+            self.fileSendFinished.add(packetID)
         if newpacket.Command == commands.Ack():
             self.fileSendDict[packetID].result = 'acked'
             if self.fileSendDict[packetID].callOnAck:
@@ -825,7 +831,7 @@ class SupplierQueue:
                 lg.out(_DebugLevel, "io_throttle.OnFileSendFailReceived finishing to %s, shutdown is True" % self.remoteName)
             return
         self.failedCount += 1
-        if PacketID not in self.fileSendDict.keys():
+        if PacketID not in self.fileSendDict:
             lg.warn("packet %s not in send dict" % PacketID)
             return
         self.fileSendDict[PacketID].result = why
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# benchmark.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (benchmark.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: benchmark.
+
+Compare expiration and republishing of DHT records stored in
+``SQLiteExpiredDataStore`` (every record is read one by one)
+and ``SQLiteIndexedDataStore`` (single query using an index).
+
+    python dht/benchmark.py [number of records]
+
+Old datastore has no index on the key column, so every record lookup is a
+full table scan and the old loops are O(N^2). Old datastore is measured only
+for up to OLD_STORE_MAX_RECORDS records.
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+from entangled.kademlia import constants
+from entangled.kademlia.datastore import SQLiteExpiredDataStore, SQLiteIndexedDataStore
+
+#------------------------------------------------------------------------------
+
+MY_NODE_ID = 'a' * 20
+
+OLD_STORE_MAX_RECORDS = 10000
+
+#------------------------------------------------------------------------------
+
+
+def _fill(store, db, count, now):
+    random.seed(count)
+    db.execute('BEGIN')
+    for i in xrange(count):
+        if i % 10 == 0:
+            publisher = MY_NODE_ID
+        else:
+            publisher = chr(random.randint(98, 122)) * 20
+        expireSeconds = random.choice([60, 600, 3600, constants.dataExpireSecondsDefaut])
+        originallyPublished = now - random.randint(0, constants.dataExpireSecondsDefaut)
+        lastPublished = originallyPublished + random.randint(0, now - originallyPublished)
+        store.setItem('%020d' % i, 'value %d' % i, lastPublished, originallyPublished, publisher, expireSeconds)
+    db.execute('COMMIT')
+    return count
+
+
+def _old_expire(store, now):
+    # same loop DHTNode.expire() did before
+    expired_keys = []
+    for key in store.keys():
+        if key == 'nodeState':
+            continue
+        item_data = store.getItem(key)
+        if item_data:
+            originaly_published = item_data.get('originallyPublished')
+            expireSeconds = item_data.get('expireSeconds')
+            if expireSeconds and originaly_published:
+                age = now - originaly_published
+                if age > expireSeconds:
+                    expired_keys.append(key)
+    for key in expired_keys:
+        del store[key]
+    return len(expired_keys)
+
+
+def _old_republish(store, now):
+    # same loop Node._threadedRepublishData() does, but only counts records
+    count = 0
+    for key in store:
+        if key == 'nodeState':
+            continue
+        itemData = store.getItem(key)
+        age = now - itemData['originallyPublished']
+        if itemData['originalPublisherID'] == MY_NODE_ID:
+            if age >= constants.dataExpireTimeout:
+                store[key]
+                count += 1
+        else:
+            if age < constants.dataExpireTimeout and now - itemData['lastPublished'] >= constants.replicateInterval:
+                store[key]
+                count += 1
+    return count
+
+
+def _new_expire(store, now):
+    return len(store.removeExpired(now))
+
+
+def _new_republish(store, now):
+    store.removeNotRepublished(MY_NODE_ID, now - constants.dataExpireTimeout)
+    return len(store.itemsToRepublish(
+        MY_NODE_ID, now - constants.dataExpireTimeout, now - constants.replicateInterval))
+
+
+def _measure(func, *args):
+    t = time.time()
+    result = func(*args)
+    return result, time.time() - t
+
+
+def _run(store, db, count, now, expire_func, republish_func):
+    result = {}
+    result['fill'] = _measure(_fill, store, db, count, now)
+    result['republish scan'] = _measure(republish_func, store, now)
+    result['expire'] = _measure(expire_func, store, now)
+    # second run, nothing to expire now
+    result['expire, nothing to do'] = _measure(expire_func, store, now)
+    return result
+
+
+def main():
+    count = 100000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    now = int(time.time())
+    tmpdir = tempfile.mkdtemp()
+    try:
+        old_result = {}
+        if count <= OLD_STORE_MAX_RECORDS:
+            old_store = SQLiteExpiredDataStore(os.path.join(tmpdir, 'old'))
+            old_result = _run(old_store, old_store._db, count, now, _old_expire, _old_republish)
+            old_result['records left'] = len(old_store.keys())
+            old_store._db.close()
+        new_store = SQLiteIndexedDataStore(os.path.join(tmpdir, 'new'))
+        new_result = _run(new_store, new_store._db, count, now, _new_expire, _new_republish)
+        new_result['records left'] = len(new_store)
+        new_store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+    print '%d records' % count
+    print '%-22s %10s %10s %12s %12s' % ('', 'old', 'indexed', 'old sec', 'indexed sec')
+    for name in ['fill', 'republish scan', 'expire', 'expire, nothing to do', ]:
+        new_count, new_time = new_result[name]
+        if name in old_result:
+            old_count, old_time = old_result[name]
+            print '%-22s %10s %10s %12.3f %12.3f' % (name, old_count, new_count, old_time, new_time)
+        else:
+            print '%-22s %10s %10s %12s %12.3f' % (name, '-', new_count, '-', new_time)
+    print '%-22s %10s %10s' % ('records left', old_result.get('records left', '-'), new_result['records left'])
+
+if __name__ == "__main__":
+    main()
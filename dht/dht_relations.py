@@ -27,6 +27,13 @@
 """
 .. module:: dht_relations
 
+Customer-supplier relations are stored in DHT under a sequence of keys:
+``customer_supplier:<customer ID>:0``, ``customer_supplier:<customer ID>:1``, ...
+
+``RelationsLookup`` reads that sequence to find all suppliers of given customer.
+Several indexes are requested at once (see ``parallel_lookups`` argument),
+but the results are always processed one by one in the order of indexes,
+so the scan stops at the same position as if keys were read sequentially.
 """
 
 #------------------------------------------------------------------------------
@@ -36,6 +43,8 @@ _DebugLevel = 8
 
 #------------------------------------------------------------------------------
 
+import time
+
 from twisted.internet import reactor
 from twisted.internet.defer import Deferred
 
@@ -53,12 +62,41 @@ from contacts import contactsdb
 from dht import dht_service
 from dht import dht_records
 
+_LookupsStats = {
+    'lookups': 0,
+    'requests': 0,
+    'wasted': 0,
+    'latency_total': 0.0,
+    'latency_max': 0.0,
+    'duration_total': 0.0,
+    'duration_max': 0.0,
+}
+
+#------------------------------------------------------------------------------
+
+def lookups_stats():
+    """
+    Returns a dictionary with summary about all finished relations lookups:
+    number of DHT requests made, how many of them were not needed in the end,
+    latency of single DHT request and total duration of the lookup.
+    """
+    global _LookupsStats
+    result = dict(_LookupsStats)
+    result['latency_avg'] = 0.0
+    if result['requests']:
+        result['latency_avg'] = result['latency_total'] / float(result['requests'])
+    result['duration_avg'] = 0.0
+    if result['lookups']:
+        result['duration_avg'] = result['duration_total'] / float(result['lookups'])
+    return result
+
 #------------------------------------------------------------------------------
 
 class RelationsLookup(object):
 
     def __init__(self, customer_idurl, new_data=None, publish=False,
-                 limit_lookups=100, max_misses_in_row=3, prefix='customer_supplier'):
+                 limit_lookups=100, max_misses_in_row=3, prefix='customer_supplier',
+                 parallel_lookups=4):
         self.customer_idurl = customer_idurl
         self.customer_id = global_id.UrlToGlobalID(self.customer_idurl)
         self._result_defer = Deferred()
@@ -74,15 +112,46 @@ class RelationsLookup(object):
         self._missed = 0
         self._result = {}
         self._meta = {}
+        self._parallel_lookups = max(1, parallel_lookups)
+        self._next_read_index = 0
+        self._in_flight = {}
+        self._received = {}
+        self._requesting = False
+        self._finished = False
+        self._started = None
+        self._latencies = []
 
     def start(self):
+        self._started = time.time()
         reactor.callLater(0, self.do_read)
         return self._result_defer
 
+    def stats(self):
+        """
+        Latency statistics of DHT requests made by that lookup so far.
+        """
+        result = {
+            'requests': len(self._latencies),
+            'in_flight': len(self._in_flight),
+            'latency_min': 0.0,
+            'latency_avg': 0.0,
+            'latency_max': 0.0,
+            'duration': 0.0,
+        }
+        if self._latencies:
+            result['latency_min'] = min(self._latencies)
+            result['latency_avg'] = sum(self._latencies) / float(len(self._latencies))
+            result['latency_max'] = max(self._latencies)
+        if self._started:
+            result['duration'] = time.time() - self._started
+        return result
+
     #------------------------------------------------------------------------------
 
     def do_read(self):
         # TODO: build more smart and fault sensitive method
+        if self._finished:
+            return None
         if self._index >= self._limit_lookups:
             if _Debug:
                 lg.out(_DebugLevel, 'dht_relations.do_read STOP %s, limit lookups riched' % self.customer_id)
@@ -94,20 +163,56 @@ class RelationsLookup(object):
                     self.customer_id, self._last_missed_index))
             self.do_report_success()
             return None
-        target_dht_key = dht_service.make_key(
-            key=self.customer_id,
-            index=self._index,
-            prefix=self._prefix,
-        )
-        if _Debug:
-            lg.out(_DebugLevel, 'dht_relations.do_read %s:%d missed:%d' % (
-                self.customer_id, self._index, self._missed))
-        d = dht_records.get_relation(target_dht_key)
-        d.addCallback(self.do_verify)
-        d.addErrback(self.do_verify)
-        return d
+        self.do_request_more()
+        if self._index in self._received:
+            # result for current position is already here, process it right away
+            return self.do_verify(self._received.pop(self._index))
+        return None
+
+    def do_request_more(self):
+        """
+        Keep up to ``parallel_lookups`` DHT requests in flight or waiting to be processed
+        starting from current position.
+        """
+        if self._requesting:
+            return
+        self._requesting = True
+        while self._next_read_index - self._index < self._parallel_lookups and not self._finished:
+            index = self._next_read_index
+            if index >= self._limit_lookups:
+                break
+            if self._last_missed_index >= 0 and index - self._last_missed_index > self._max_misses_in_row:
+                # we already know the scan will stop before that position
+                break
+            self._next_read_index += 1
+            target_dht_key = dht_service.make_key(
+                key=self.customer_id,
+                index=index,
+                prefix=self._prefix,
+            )
+            if _Debug:
+                lg.out(_DebugLevel, 'dht_relations.do_request_more %s:%d in flight:%d missed:%d' % (
+                    self.customer_id, index, len(self._in_flight), self._missed))
+            self._in_flight[index] = time.time()
+            d = dht_records.get_relation(target_dht_key)
+            d.addBoth(self._on_read_finished, index)
+        self._requesting = False
+
+    def _on_read_finished(self, dht_value, index):
+        started = self._in_flight.pop(index, None)
+        if self._finished:
+            # lookup was already finished, this result is not needed anymore
+            _LookupsStats['wasted'] += 1
+            return None
+        if started is not None:
+            self._latencies.append(time.time() - started)
+        self._received[index] = dht_value
+        if index == self._index and not self._requesting:
+            self.do_read()
+        return None
 
     def do_erase(self):
+        self._finished = True
         if _Debug:
             lg.out(_DebugLevel, 'dht_relations.do_erase %s:%s' % (
                 self.customer_id, self._index, ))
@@ -122,6 +227,7 @@ class RelationsLookup(object):
         return 3
 
     def do_write(self):
+        self._finished = True
         if _Debug:
             lg.out(_DebugLevel, 'dht_relations.do_write %s:%s' % (
                 self.customer_id, self._index, ))
@@ -240,6 +346,24 @@ class RelationsLookup(object):
         self._missed = 0
         self._result = {}
         self._meta = {}
+        self._received = {}
+        self._latencies = []
+
+    def do_update_stats(self):
+        global _LookupsStats
+        self._finished = True
+        stats = self.stats()
+        _LookupsStats['lookups'] += 1
+        _LookupsStats['requests'] += stats['requests']
+        _LookupsStats['wasted'] += len(self._received)
+        _LookupsStats['latency_total'] += sum(self._latencies)
+        _LookupsStats['latency_max'] = max(_LookupsStats['latency_max'], stats['latency_max'])
+        _LookupsStats['duration_total'] += stats['duration']
+        _LookupsStats['duration_max'] = max(_LookupsStats['duration_max'], stats['duration'])
+        if _Debug:
+            lg.out(_DebugLevel, 'dht_relations.do_update_stats %s : %d requests, %d in flight, latency min/avg/max %.3f/%.3f/%.3f sec, took %.3f sec' % (
+                self.customer_id, stats['requests'], stats['in_flight'], stats['latency_min'],
+                stats['latency_avg'], stats['latency_max'], stats['duration'], ))
 
     def do_report_success(self, x=None):
         result_list = []
@@ -255,12 +379,14 @@ class RelationsLookup(object):
             lg.out(_DebugLevel, 'dht_relations.do_report_success customer_id=%s:' % (
                 self.customer_id))
             lg.out(_DebugLevel, '    %s' % result_list)
+        self.do_update_stats()
         self._result_defer.callback(result_list)
         self.do_close()
         return None
 
     def do_report_failed(self, err):
         lg.warn(err)
+        self.do_update_stats()
         self._result_defer.errback(err)
         self.do_close()
         return None
@@ -42,17 +42,21 @@ import random
 import base64
 import optparse
 import json
+import cPickle as pickle
+
+from collections import OrderedDict, deque
 
 #------------------------------------------------------------------------------
 
 from twisted.internet import reactor
+from twisted.internet import threads
 from twisted.internet.task import LoopingCall
 from twisted.internet.defer import Deferred, fail
 
 #------------------------------------------------------------------------------
 
 from entangled.dtuple import DistributedTupleSpacePeer
-from entangled.kademlia.datastore import SQLiteExpiredDataStore
+from entangled.kademlia.datastore import SQLiteIndexedDataStore
 from entangled.kademlia.node import rpcmethod
 from entangled.kademlia.protocol import KademliaProtocol, encoding, msgformat
 from entangled.kademlia import constants
@@ -80,6 +84,12 @@ from lib import utime
 KEY_EXPIRE_MIN_SECONDS = 60
 KEY_EXPIRE_MAX_SECONDS = constants.dataExpireSecondsDefaut
 
+CACHE_MAX_ITEMS = 1000
+CACHE_MAX_BYTES = 10 * 1024 * 1024
+
+# how long incoming datagrams can be processed in one reactor iteration
+RECEIVING_BATCH_SECONDS = 0.02
+
 #------------------------------------------------------------------------------
 
 _MyNode = None
@@ -99,13 +109,15 @@ def init(udp_port, db_file_path=None):
         db_file_path = settings.DHTDBFile()
     dbPath = bpio.portablePath(db_file_path)
     try:
-        dataStore = SQLiteExpiredDataStore(dbFile=dbPath)
+        dataStore = SQLiteIndexedDataStore(dbFile=dbPath)
         # dataStore.setItem('not_exist_key', 'not_exist_value', time.time(), time.time(), None, 60)
         # del dataStore['not_exist_key']
     except:
         lg.warn('failed reading DHT records, removing %s and starting clean DB' % dbPath)
-        os.remove(dbPath)
-        dataStore = SQLiteExpiredDataStore(dbFile=dbPath)
+        for path in [dbPath, dbPath + '-wal', dbPath + '-shm', ]:
+            if os.path.isfile(path):
+                os.remove(path)
+        dataStore = SQLiteIndexedDataStore(dbFile=dbPath)
     networkProtocol = KademliaProtocolConveyor
     _MyNode = DHTNode(udp_port, dataStore, networkProtocol=networkProtocol)
     if _Debug:
@@ -115,7 +127,8 @@ def init(udp_port, db_file_path=None):
 def shutdown():
     global _MyNode
     if _MyNode is not None:
-        _MyNode._dataStore._db.close()
+        _MyNode._dataStore.close()
+        _MyNode._protocol.stop_processing()
         _MyNode._protocol.node = None
         del _MyNode
         _MyNode = None
@@ -467,6 +480,24 @@ def delete_node_data(key):
         lg.out(_DebugLevel, 'dht_service.delete_node_data key=[%s]' % key)
     return True
 
+
+def cache_stats():
+    """
+    Returns a dictionary with current state of the DHT records cache.
+    """
+    if not node():
+        return {}
+    return node().cache_stats()
+
+
+def receiving_stats():
+    """
+    Returns a dictionary with counters of incoming DHT datagrams.
+    """
+    if not node():
+        return {}
+    return node()._protocol.receiving_stats()
+
 #------------------------------------------------------------------------------
 
 class DHTNode(DistributedTupleSpacePeer):
@@ -474,26 +505,125 @@ class DHTNode(DistributedTupleSpacePeer):
     def __init__(self, udpPort=4000, dataStore=None, routingTable=None, networkProtocol=None):
         super(DHTNode, self).__init__(udpPort, dataStore, routingTable, networkProtocol)
         self.data = {}
+        # key -> (value, expire time, size), least recently used first
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evicted = 0
+        self.cache_invalidated = 0
         self.expire_task = LoopingCall(self.expire)
 
+    def cache_get(self, key):
+        """
+        Returns cached value of the record or None if it is not cached or already expired.
+        """
+        item = self.cache.pop(key, None)
+        if item is None:
+            self.cache_misses += 1
+            return None
+        if item[1] is not None and item[1] <= utime.get_sec1970():
+            self.cache_bytes -= item[2]
+            self.cache_misses += 1
+            return None
+        self.cache[key] = item
+        self.cache_hits += 1
+        return item[0]
+
+    def cache_put(self, key, value, expire_time):
+        """
+        Remember the value of the record until ``expire_time``,
+        the least recently used records are evicted to keep cache bounded.
+        """
+        self.cache_forget(key)
+        if expire_time is not None and expire_time <= utime.get_sec1970():
+            return False
+        size = len(value) if isinstance(value, str) else len(str(value))
+        if size > CACHE_MAX_BYTES:
+            return False
+        self.cache[key] = (value, expire_time, size, )
+        self.cache_bytes += size
+        while len(self.cache) > CACHE_MAX_ITEMS or self.cache_bytes > CACHE_MAX_BYTES:
+            _, item = self.cache.popitem(last=False)
+            self.cache_bytes -= item[2]
+            self.cache_evicted += 1
+        return True
+
+    def cache_forget(self, key):
+        item = self.cache.pop(key, None)
+        if item is None:
+            return False
+        self.cache_bytes -= item[2]
+        self.cache_invalidated += 1
+        return True
+
+    def cache_stats(self):
+        return {
+            'size': len(self.cache),
+            'max_size': CACHE_MAX_ITEMS,
+            'bytes': self.cache_bytes,
+            'max_bytes': CACHE_MAX_BYTES,
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit_rate': round(self.cache_hits / float(max(1, self.cache_hits + self.cache_misses)), 3),
+            'evicted': self.cache_evicted,
+            'invalidated': self.cache_invalidated,
+        }
+
     def expire(self):
-        now = utime.get_sec1970()
-        expired_keys = []
-        for key in self._dataStore.keys():
-            if key == 'nodeState':
-                continue
-            item_data = self._dataStore.getItem(key)
-            if item_data:
-                originaly_published = item_data.get('originallyPublished')
-                expireSeconds = item_data.get('expireSeconds')
-                if expireSeconds and originaly_published:
-                    age = now - originaly_published
-                    if age > expireSeconds:
-                        expired_keys.append(key)
+        """
+        Remove expired records from DB in a thread.
+        """
+        d = threads.deferToThread(self._dataStore.removeExpired, utime.get_sec1970())
+        d.addCallback(self._on_expired)
+        d.addErrback(self._on_expire_failed)
+        return d
+
+    def _on_expired(self, expired_keys):
         for key in expired_keys:
+            self.cache_forget(key)
             if _Debug:
                 lg.out(_DebugLevel, 'dht_service.expire   [%s] removed' % base64.b32encode(key))
-            del self._dataStore[key]
+        return len(expired_keys)
+
+    def _on_expire_failed(self, err):
+        # do not stop the LoopingCall, just try again next time
+        lg.err('failed removing expired DHT records: %s' % err)
+        return 0
+
+    def _threadedRepublishData(self, *args):
+        """
+        Republishes and expires stored records, must run in a thread.
+
+        Only records which must be republished or replicated right now
+        are selected from DB.
+        """
+        now = int(time.time())
+        for key in self._dataStore.removeNotRepublished(self.id, now - constants.dataExpireTimeout):
+            reactor.callFromThread(self.cache_forget, key)
+            if _Debug:
+                lg.out(_DebugLevel, 'dht_service._threadedRepublishData   [%s] removed' % base64.b32encode(key))
+        for item in self._dataStore.itemsToRepublish(
+            self.id, now - constants.dataExpireTimeout, now - constants.replicateInterval,
+        ):
+            if item['originalPublisherID'] == self.id:
+                # this node is the original publisher, it has to republish the data before it expires
+                reactor.callFromThread(
+                    self.iterativeStore,
+                    key=item['key'],
+                    value=item['value'],
+                    expireSeconds=item['expireSeconds'],
+                )
+            else:
+                # need to replicate the data without changing the metadata
+                reactor.callFromThread(
+                    self.iterativeStore,
+                    key=item['key'],
+                    value=item['value'],
+                    originalPublisherID=item['originalPublisherID'],
+                    age=now - item['originallyPublished'],
+                    expireSeconds=item['expireSeconds'],
+                )
 
     @rpcmethod
     def store(self, key, value, originalPublisherID=None,
@@ -502,6 +632,7 @@ class DHTNode(DistributedTupleSpacePeer):
         if _Debug:
             lg.out(_DebugLevel, 'dht_service.DHTNode.store key=[%s] with %d bytes for %d seconds' % (
                 base64.b32encode(key), len(str(value)), expireSeconds, ))
+        self.cache_forget(key)
         try:
             return super(DHTNode, self).store(
                 key=key,
@@ -515,12 +646,34 @@ class DHTNode(DistributedTupleSpacePeer):
             lg.exc()
             return 'OK'
 
+    @rpcmethod
+    def delete(self, key, **kwargs):
+        self.cache_forget(key)
+        return super(DHTNode, self).delete(key, **kwargs)
+
+    def iterativeDelete(self, key):
+        self.cache_forget(key)
+        return super(DHTNode, self).iterativeDelete(key)
+
     @rpcmethod
     def request(self, key):
         value = self.data.get(key)
-        if value is None and key in self._dataStore:
-            value = self._dataStore[key]
-            self.data[key] = value
+        if value is None:
+            value = self.cache_get(key)
+        if value is None:
+            item = self._dataStore.getItem(key)
+            if item:
+                # value is already selected from DB together with other fields, no need to query again
+                try:
+                    value = pickle.loads(item['value'])
+                except:
+                    lg.exc()
+                    value = None
+            if value is not None:
+                expire_time = None
+                if item['expireSeconds']:
+                    expire_time = item['originallyPublished'] + item['expireSeconds']
+                self.cache_put(key, value, expire_time)
         if _Debug:
             lg.out(_DebugLevel, 'dht_service.DHTNode.request key=[%s] read %d bytes' % (
                 base64.b32encode(key), len(str(value))))
@@ -543,29 +696,83 @@ class DHTNode(DistributedTupleSpacePeer):
 
 
 class KademliaProtocolConveyor(KademliaProtocol):
+    """
+    Incoming datagrams are queued and processed in batches, each batch takes
+    no more than ``RECEIVING_BATCH_SECONDS`` and then control is returned to the reactor.
+
+    Responses are processed before requests, so our own lookups are not
+    timed out because of the incoming traffic. When a queue is full
+    new datagrams of that kind are dropped.
+    """
 
     def __init__(self, node, msgEncoder=encoding.Bencode(), msgTranslator=msgformat.DefaultFormat()):
         KademliaProtocol.__init__(self, node, msgEncoder, msgTranslator)
-        self.datagrams_queue = []
+        self.requests_queue = deque()
+        self.responses_queue = deque()
+        self.requests_queue_limit = settings.getDHTReceivingQueueRequestsLimit()
+        self.responses_queue_limit = settings.getDHTReceivingQueueResponsesLimit()
+        # every not fragmented request message starts with same bytes
+        self.request_prefix = self._encoder.encode({
+            self._translator.headerType: self._translator.typeRequest, })[:-1]
+        self.counters = {
+            'requests_received': 0,
+            'responses_received': 0,
+            'requests_dropped': 0,
+            'responses_dropped': 0,
+            'processed': 0,
+            'batches': 0,
+        }
         self.worker = None
 
+    def receiving_stats(self):
+        result = dict(self.counters)
+        result['requests_queue'] = len(self.requests_queue)
+        result['responses_queue'] = len(self.responses_queue)
+        result['requests_queue_limit'] = self.requests_queue_limit
+        result['responses_queue_limit'] = self.responses_queue_limit
+        return result
+
     def datagramReceived(self, datagram, address):
-        if len(self.datagrams_queue) > 10:
-            # TODO:
-            # seems like DHT traffic is too high at that moment
-            # need to find some solution here probably
-            return
-        self.datagrams_queue.append((datagram, address))
+        if datagram.startswith(self.request_prefix):
+            self.counters['requests_received'] += 1
+            if len(self.requests_queue) >= self.requests_queue_limit:
+                self.counters['requests_dropped'] += 1
+                return
+            self.requests_queue.append((datagram, address, ))
+        else:
+            # responses, errors and parts of fragmented messages
+            self.counters['responses_received'] += 1
+            if len(self.responses_queue) >= self.responses_queue_limit:
+                self.counters['responses_dropped'] += 1
+                return
+            self.responses_queue.append((datagram, address, ))
         if self.worker is None:
             self.worker = reactor.callLater(0, self._process)
 
     def _process(self):
-        if len(self.datagrams_queue) == 0:
-            self.worker = None
-            return
-        datagram, address = self.datagrams_queue.pop(0)
-        KademliaProtocol.datagramReceived(self, datagram, address)
-        self.worker = reactor.callLater(0.005, self._process)
+        self.worker = None
+        deadline = time.time() + RECEIVING_BATCH_SECONDS
+        processed = 0
+        while self.responses_queue or self.requests_queue:
+            if self.responses_queue:
+                datagram, address = self.responses_queue.popleft()
+            else:
+                datagram, address = self.requests_queue.popleft()
+            KademliaProtocol.datagramReceived(self, datagram, address)
+            processed += 1
+            if time.time() >= deadline:
+                break
+        self.counters['processed'] += processed
+        self.counters['batches'] += 1
+        if self.responses_queue or self.requests_queue:
+            self.worker = reactor.callLater(0, self._process)
+
+    def stop_processing(self):
+        if self.worker and self.worker.active():
+            self.worker.cancel()
+        self.worker = None
+        self.requests_queue.clear()
+        self.responses_queue.clear()
 
 #------------------------------------------------------------------------------
 
@@ -31,6 +31,7 @@ import UserDict
 import sqlite3
 import cPickle as pickle
 import os
+import threading
 
 import constants
 
@@ -338,3 +339,230 @@ class SQLiteExpiredDataStore(SQLiteDataStore):
             return None
         return result
 
+
+
+class SQLiteIndexedDataStore(DataStore):
+    """
+    SQLite database-based datastore with an index on the expiration time of
+    the records, so expired and republished records are selected with a
+    single query instead of reading every record one by one.
+
+    Every thread gets its own connection to the database file, so bulk
+    queries can run in a background thread while the reactor thread keeps
+    serving requests. In-memory database can not be shared between
+    connections, so in that case all threads use one connection under a lock.
+    """
+
+    nodeStateKey = 'nodeState'.encode('hex')
+
+    def __init__(self, dbFile=':memory:'):
+        """
+        @param dbFile: The name of the file containing the SQLite database; if
+                       unspecified, an in-memory database is used.
+        @type dbFile: str
+        """
+        self._dbFile = dbFile
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._connections = []
+        self._shared = None
+        if dbFile == ':memory:':
+            self._shared = self._connect()
+        self._db = self._connection()
+        self._createTable()
+
+    def _connect(self):
+        db = sqlite3.connect(self._dbFile, timeout=30, check_same_thread=False)
+        db.isolation_level = None
+        db.text_factory = str
+        if self._dbFile != ':memory:':
+            # readers do not block the writer in WAL mode
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._connections.append(db)
+        return db
+
+    def _connection(self):
+        if self._shared is not None:
+            return self._shared
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._connect()
+            self._local.db = db
+        return db
+
+    def _query(self, sql, args=()):
+        if self._shared is None:
+            return self._connection().execute(sql, args).fetchall()
+        with self._lock:
+            return self._shared.execute(sql, args).fetchall()
+
+    def _update(self, sql, args=()):
+        if self._shared is None:
+            return self._connection().execute(sql, args).rowcount
+        with self._lock:
+            return self._shared.execute(sql, args).rowcount
+
+    def _createTable(self):
+        columns = [row[1] for row in self._query('PRAGMA table_info(data)')]
+        if 'expireTime' in columns:
+            return
+        self._update('BEGIN')
+        try:
+            if columns:
+                # database was created by SQLiteDataStore or SQLiteExpiredDataStore
+                self._update('ALTER TABLE data RENAME TO data_old')
+            self._update('CREATE TABLE data(key TEXT PRIMARY KEY, value BLOB, lastPublished INTEGER, originallyPublished INTEGER, originalPublisherID, expireSeconds INTEGER, expireTime INTEGER)')
+            self._update('CREATE INDEX data_expireTime ON data(expireTime)')
+            self._update('CREATE INDEX data_originallyPublished ON data(originallyPublished)')
+            self._update('CREATE INDEX data_lastPublished ON data(lastPublished)')
+            if columns:
+                expireSeconds = 'expireSeconds' if 'expireSeconds' in columns else str(constants.dataExpireSecondsDefaut)
+                self._update('INSERT OR REPLACE INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, expireTime) '
+                             'SELECT key, value, lastPublished, originallyPublished, originalPublisherID, {0}, '
+                             'CASE WHEN {0} > 0 THEN originallyPublished + {0} END FROM data_old'.format(expireSeconds))
+                self._update('DROP TABLE data_old')
+        except:
+            self._update('ROLLBACK')
+            raise
+        self._update('COMMIT')
+
+    def close(self):
+        """
+        Close connections of all threads.
+        """
+        with self._lock:
+            for db in self._connections:
+                try:
+                    db.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
+        self._shared = None
+
+    def keys(self):
+        """
+        Return a list of the keys in this data store.
+        """
+        return [row[0].decode('hex') for row in self._query('SELECT key FROM data')]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM data')[0][0]
+
+    def __contains__(self, key):
+        return bool(self._query('SELECT 1 FROM data WHERE key=?', (key.encode('hex'), )))
+
+    def has_key(self, key):
+        return self.__contains__(key)
+
+    def lastPublished(self, key):
+        return int(self._dbQuery(key, 'lastPublished'))
+
+    def originalPublisherID(self, key):
+        return self._dbQuery(key, 'originalPublisherID')
+
+    def originalPublishTime(self, key):
+        return int(self._dbQuery(key, 'originallyPublished'))
+
+    def expireSeconds(self, key):
+        return int(self._dbQuery(key, 'expireSeconds'))
+
+    def setItem(self,
+                key,
+                value,
+                lastPublished,
+                originallyPublished,
+                originalPublisherID,
+                expireSeconds=constants.dataExpireSecondsDefaut,
+                **kwargs):
+        expireTime = None
+        if expireSeconds:
+            expireTime = originallyPublished + expireSeconds
+        self._update('INSERT OR REPLACE INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, expireTime) VALUES (?, ?, ?, ?, ?, ?, ?)', (
+            key.encode('hex'), buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), lastPublished, originallyPublished, originalPublisherID, expireSeconds, expireTime))
+
+    def _dbQuery(self, key, columnName, unpickle=False):
+        rows = self._query('SELECT %s FROM data WHERE key=?' % columnName, (key.encode('hex'), ))
+        if not rows:
+            raise KeyError(key)
+        value = str(rows[0][0])
+        if unpickle:
+            return pickle.loads(value)
+        return value
+
+    def __getitem__(self, key):
+        return self._dbQuery(key, 'value', unpickle=True)
+
+    def __delitem__(self, key):
+        self._update('DELETE FROM data WHERE key=?', (key.encode('hex'), ))
+
+    def getItem(self, key):
+        rows = self._query('SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds FROM data WHERE key=?', (key.encode('hex'), ))
+        if not rows:
+            return None
+        row = rows[0]
+        return dict(
+            key=row[0],
+            value=str(row[1]),
+            lastPublished=row[2],
+            originallyPublished=row[3],
+            originalPublisherID=row[4],
+            expireSeconds=row[5],
+        )
+
+    def removeExpired(self, now):
+        """
+        Remove all records which are older than their C{expireSeconds}.
+
+        @return: list of removed keys
+        """
+        args = (now, self.nodeStateKey, )
+        rows = self._query('SELECT key FROM data WHERE expireTime<? AND key!=?', args)
+        if rows:
+            self._update('DELETE FROM data WHERE expireTime<? AND key!=?', args)
+        return [row[0].decode('hex') for row in rows]
+
+    def removeNotRepublished(self, publisherID, originallyPublishedBefore):
+        """
+        Remove records received from other nodes which were not republished
+        by the original publisher in time.
+
+        @return: list of removed keys
+        """
+        args = (publisherID, originallyPublishedBefore, self.nodeStateKey, )
+        rows = self._query('SELECT key FROM data WHERE originalPublisherID!=? AND originallyPublished<=? AND key!=?', args)
+        if rows:
+            self._update('DELETE FROM data WHERE originalPublisherID!=? AND originallyPublished<=? AND key!=?', args)
+        return [row[0].decode('hex') for row in rows]
+
+    def itemsToRepublish(self, publisherID, originallyPublishedBefore, lastPublishedBefore):
+        """
+        Select records which must be republished by this node because it is
+        the original publisher and records from other nodes which must be
+        replicated.
+
+        @return: list of dictionaries with unpickled values
+        """
+        rows = self._query(
+            'SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds FROM data '
+            'WHERE key!=? AND ((originalPublisherID=? AND originallyPublished<=?) OR '
+            '(originalPublisherID!=? AND originallyPublished>? AND lastPublished<=?))', (
+                self.nodeStateKey, publisherID, originallyPublishedBefore,
+                publisherID, originallyPublishedBefore, lastPublishedBefore, ))
+        result = []
+        for row in rows:
+            result.append(dict(
+                key=row[0].decode('hex'),
+                value=pickle.loads(str(row[1])),
+                lastPublished=row[2],
+                originallyPublished=row[3],
+                originalPublisherID=row[4],
+                expireSeconds=row[5],
+            ))
+        return result
+
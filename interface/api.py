@@ -1015,6 +1015,7 @@ def file_delete(remote_path):
     from storage import backup_fs
     from storage import backup_control
     from storage import backup_monitor
+    from storage import local_manifest
     from main import settings
     from main import control
     from lib import packetid
@@ -1037,6 +1038,7 @@ def file_delete(remote_path):
     if not result:
         return ERROR('remote item "%s" was not found' % pathIDfull)
     backup_fs.DeleteLocalDir(settings.getLocalBackupsDir(), pathIDfull)
+    local_manifest.path_removed(pathIDfull)
     backup_fs.DeleteByID(pathID, iter=backup_fs.fs(parts['idurl']), iterID=backup_fs.fsID(parts['idurl']))
     backup_fs.Scan()
     backup_fs.Calculate()
@@ -2039,6 +2041,23 @@ def customers_ping():
 #------------------------------------------------------------------------------
 
 
+def space_rescan():
+    """
+    Scan all files stored on local disk for your customers and re-build the index
+    of used space, this is a repair procedure. Scan is running in a thread.
+
+    Return:
+
+        {'status': 'OK', 'result': 'customers space rescan started'}
+    """
+    if not driver.is_on('service_supplier'):
+        return ERROR('service_supplier() is not started')
+    from supplier import customer_space
+    if customer_space.rescan() is None:
+        return ERROR('customers space rescan is already in progress')
+    return OK('customers space rescan started')
+
+
 def space_donated():
     """
     Returns detailed statistics about your donated space usage.
@@ -2354,14 +2373,32 @@ def packets_stats():
                 'total_packets': 0,
                 'unknown_bytes': 0,
                 'unknown_packets': 0
+            },
+            'public_keys_cache': {
+                'hits': 1520,
+                'max_size': 500,
+                'misses': 12,
+                'size': 12
+            },
+            'verification': {
+                'errors': 0,
+                'in_progress': 1,
+                'max_threads': 4,
+                'not_valid': 0,
+                'queue_depth': 3,
+                'verified': 1530
         }}]}
     """
     if not driver.is_on('service_gateway'):
         return ERROR('service_gateway() is not started')
     from p2p import p2p_stats
+    from crypt import key
+    from transport import packet_in
     return RESULT([{
         'in': p2p_stats.counters_in(),
         'out': p2p_stats.counters_out(),
+        'public_keys_cache': key.PublicKeysCacheStats(),
+        'verification': packet_in.verify_stats(),
     }])
 
 
@@ -2972,6 +3009,61 @@ def network_stun(udp_port=None, dht_port=None):
     return ret
 
 
+def network_dht_stats():
+    """
+    Returns info about DHT records cache of that node, counters of incoming
+    DHT datagrams and summary about customer-supplier relations lookups.
+
+    Return:
+
+        {'status': 'OK',
+         'result': [{
+            'cache': {
+                'bytes': 20480,
+                'evicted': 0,
+                'hit_rate': 0.934,
+                'hits': 1330,
+                'invalidated': 15,
+                'max_bytes': 10485760,
+                'max_size': 1000,
+                'misses': 94,
+                'size': 80
+            },
+            'receiving': {
+                'batches': 5120,
+                'processed': 10450,
+                'requests_dropped': 0,
+                'requests_queue': 3,
+                'requests_queue_limit': 500,
+                'requests_received': 7300,
+                'responses_dropped': 0,
+                'responses_queue': 0,
+                'responses_queue_limit': 1000,
+                'responses_received': 3153
+            },
+            'relations': {
+                'duration_avg': 1.251,
+                'duration_max': 2.03,
+                'latency_avg': 0.874,
+                'latency_max': 1.95,
+                'latency_total': 52.44,
+                'duration_total': 6.255,
+                'lookups': 5,
+                'requests': 60,
+                'wasted': 12
+        }}]}
+    """
+    if not driver.is_on('service_entangled_dht'):
+        return ERROR('service_entangled_dht() is not started')
+    from dht import dht_service
+    from dht import dht_relations
+    return RESULT([{
+        'cache': dht_service.cache_stats(),
+        'receiving': dht_service.receiving_stats(),
+        'relations': dht_relations.lookups_stats(),
+    }])
+
+
 def network_reconnect():
     """
     Sends "reconnect" event to network_connector() Automat in order to refresh
@@ -308,6 +308,9 @@ class BitDustJsonRPCServer(JSONRPCServer):
     def jsonrpc_space_local(self):
         return api.space_local()
 
+    def jsonrpc_space_rescan(self):
+        return api.space_rescan()
+
     def jsonrpc_automats_list(self):
         return api.automats_list()
 
@@ -404,6 +407,9 @@ class BitDustJsonRPCServer(JSONRPCServer):
     def jsonrpc_network_reconnect(self):
         return api.network_reconnect()
 
+    def jsonrpc_network_dht_stats(self):
+        return api.network_dht_stats()
+
     def jsonrpc_network_connected(self, wait_timeout=5):
         return api.network_connected(wait_timeout=wait_timeout)
 
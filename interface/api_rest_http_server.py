@@ -551,6 +551,11 @@ class BitDustRESTHTTPServer(APIResource):
     def customer_ping_v1(self, request):
         return api.customers_ping()
 
+    @POST('^/sp/rs$')
+    @POST('^/space/rescan/v1$')
+    def space_rescan_v1(self, request):
+        return api.space_rescan()
+
     #------------------------------------------------------------------------------
 
     @GET('^/us/s/(?P<nickname>[^/]+)/$')
@@ -693,6 +698,11 @@ class BitDustRESTHTTPServer(APIResource):
             dht_port=int(_request_arg(request, 'dht_port', 0)) or None,
         )
 
+    @GET('^/nw/dht$')
+    @GET('^/network/dht/stats/v1$')
+    def network_dht_stats_v1(self, request):
+        return api.network_dht_stats()
+
     @GET('^/nw/con$')
     @GET('^/network/connected/v1$')
     def network_connected_v1(self, request):
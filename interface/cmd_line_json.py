@@ -1030,6 +1030,11 @@ def cmd_storage(opts, args, overDict):
         d1.addErrback(fail_and_stop)
         reactor.run()
         return 0
+
+    elif args[1] in ['rescan', 'scan', 'repair', ]:
+        tpl = jsontemplate.Template(templ.TPL_RAW)
+        return call_jsonrpc_method_template_and_stop('space_rescan', tpl)
+
     return 2
 
 #------------------------------------------------------------------------------
@@ -57,6 +57,7 @@ from twisted.python.failure import Failure
 # from twisted.internet.utils import getProcessOutput
 from twisted.web import iweb
 from twisted.web import client
+from twisted.web import error
 from twisted.web import http_headers
 from twisted.web.client import getPage
 from twisted.web.client import downloadPage
@@ -72,6 +73,7 @@ _ConnectionFailedCallbackFunc = None
 #------------------------------------------------------------------------------
 
 _UserAgentString = "BitDust-http-agent"
+_HTTPConnectionPool = None
 _ProxySettings = {
     'host': '',
     'port': '',
@@ -92,6 +94,7 @@ def init():
 def shutdown():
     """
     """
+    close_http_connection_pool()
 
 
 def SetConnectionDoneCallbackFunc(f):
@@ -463,6 +466,80 @@ def getPageTwisted(url, timeout=0):
 #------------------------------------------------------------------------------
 
 
+def get_http_connection_pool():
+    """
+    Persistent HTTP connections are kept open and reused for next requests to same host.
+    """
+    global _HTTPConnectionPool
+    if _HTTPConnectionPool is None:
+        _HTTPConnectionPool = client.HTTPConnectionPool(reactor, persistent=True)
+        _HTTPConnectionPool.maxPersistentPerHost = 2
+        _HTTPConnectionPool.cachedConnectionTimeout = 120
+    return _HTTPConnectionPool
+
+
+def close_http_connection_pool():
+    global _HTTPConnectionPool
+    if _HTTPConnectionPool is None:
+        return succeed(None)
+    d = _HTTPConnectionPool.closeCachedConnections()
+    _HTTPConnectionPool = None
+    return d
+
+
+def getPageConditional(url, timeout=0, etag=None, last_modified=None):
+    """
+    Download a page using a persistent HTTP connection from the pool.
+
+    If ``etag`` or ``last_modified`` values from previous response are given
+    this is a conditional request and server may reply with "304 Not Modified".
+    Result is a tuple: (code, body, etag, last_modified), body is None if code is 304.
+    """
+    global _UserAgentString
+
+    if proxy_is_on():
+        d = getPageTwisted(url, timeout)
+        d.addCallback(lambda src: (200, src, None, None, ))
+        return d
+
+    def _on_body(body, response):
+        new_etag = response.headers.getRawHeaders('ETag', [None, ])[0]
+        new_last_modified = response.headers.getRawHeaders('Last-Modified', [None, ])[0]
+        if response.code == 304:
+            return (304, None, new_etag or etag, new_last_modified or last_modified, )
+        if response.code != 200:
+            raise error.Error(response.code, response.phrase, body)
+        return (200, body, new_etag, new_last_modified, )
+
+    def _on_response(response):
+        d = client.readBody(response)
+        d.addCallback(_on_body, response)
+        return d
+
+    def _cancel_timeout(x, timeout_call):
+        if timeout_call and timeout_call.active():
+            timeout_call.cancel()
+        return x
+
+    headers = http_headers.Headers({'User-Agent': [_UserAgentString, ], })
+    if etag:
+        headers.addRawHeader('If-None-Match', etag)
+    if last_modified:
+        headers.addRawHeader('If-Modified-Since', last_modified)
+    agent = client.Agent(reactor, connectTimeout=(timeout or None), pool=get_http_connection_pool())
+    d = agent.request('GET', url, headers)
+    d.addCallback(_on_response)
+    timeout_call = None
+    if timeout:
+        timeout_call = reactor.callLater(timeout, d.cancel)
+    d.addBoth(_cancel_timeout, timeout_call)
+    d.addCallback(ConnectionDone, 'http', 'getPageConditional %s' % url)
+    d.addErrback(ConnectionFailed, 'http', 'getPageConditional %s' % url)
+    return d
+
+#------------------------------------------------------------------------------
+
+
 def downloadHTTP(url, fileOrName):
     """
     Another method to download from HTTP host.
@@ -35,6 +35,9 @@ So that file is starter as child process of BitDust to prepare data for backup.
              If we print anything else to stdout the .tar file will be ruined.
              We must also not print things in anything this calls.
 
+Compression is done here as well: whole tar stream like before or every file
+separately, see ``storage.compression`` module.
+
 Inspired from examples here:
 
 * `http://docs.python.org/lib/tar-examples.html`
@@ -51,9 +54,12 @@ import os
 import sys
 import platform
 import tarfile
+import tempfile
 import traceback
 import locale
 
+from storage import compression as file_compression
+
 #------------------------------------------------------------------------------
 
 AppData = ''
@@ -176,23 +182,67 @@ def writetar_filter(tarinfo, sourcepath):
 
 #------------------------------------------------------------------------------
 
-def writetar(sourcepath, arcname=None, subdirs=True, compression='none', encoding=None):
+
+class CompressingTarFile(tarfile.TarFile):
+    """
+    Compress every regular file separately before it goes to the archive.
+    """
+
+    compression_mode = None
+    compression_threads = 1
+    compression_pool = None
+
+    def addfile(self, tarinfo, fileobj=None):
+        if fileobj is None or not tarinfo.isreg():
+            return tarfile.TarFile.addfile(self, tarinfo, fileobj)
+        sample = file_compression.read_sample(fileobj, tarinfo.size)
+        if not file_compression.should_compress(tarinfo.name, tarinfo.size, sample):
+            return tarfile.TarFile.addfile(self, tarinfo, fileobj)
+        # size of compressed data must be known before the header is written
+        tmp = tempfile.SpooledTemporaryFile(max_size=4 * file_compression.FRAME_SIZE)
+        try:
+            file_compression.compress_file(
+                fileobj, tmp, self.compression_mode, self.compression_threads, self.compression_pool)
+            if tmp.tell() >= tarinfo.size:
+                fileobj.seek(0)
+                return tarfile.TarFile.addfile(self, tarinfo, fileobj)
+            tarinfo.size = tmp.tell()
+            tarinfo.pax_headers = dict(tarinfo.pax_headers)
+            tarinfo.pax_headers[file_compression.PAX_HEADER] = unicode(self.compression_mode)
+            tmp.seek(0)
+            return tarfile.TarFile.addfile(self, tarinfo, tmp)
+        finally:
+            tmp.close()
+
+
+def writetar(sourcepath, arcname=None, subdirs=True, compression='none', encoding=None, threads=1):
     """
     Create a tar archive from given ``sourcepath`` location.
     """
     global _ExcludeFunction
-    printlog('WRITE: %s arcname=%s, subdirs=%s, compression=%s, encoding=%s\n' % (
-        sourcepath, arcname, subdirs, compression, encoding))
+    printlog('WRITE: %s arcname=%s, subdirs=%s, compression=%s, encoding=%s, threads=%s\n' % (
+        sourcepath, arcname, subdirs, compression, encoding, threads))
     mode = 'w|'
-    if compression != 'none':
-        mode += compression
     basedir, filename = os.path.split(sourcepath)
     if arcname is None:
         arcname = unicode(filename)
     else:
         arcname = unicode(arcname)
-    # DEBUG: tar = tarfile.open('', mode, fileobj=open('out.tar', 'wb'), encoding=encoding)
-    tar = tarfile.open('', mode, fileobj=sys.stdout, encoding=encoding)
+    if file_compression.is_file_mode(compression):
+        tar = CompressingTarFile.open(
+            '', mode, fileobj=sys.stdout, encoding=encoding, format=tarfile.PAX_FORMAT,
+            pax_headers={file_compression.PAX_ARCHIVE_HEADER: unicode(compression)},
+        )
+        tar.compression_mode = compression
+        tar.compression_threads = threads
+        if threads > 1:
+            from multiprocessing.pool import ThreadPool
+            tar.compression_pool = ThreadPool(threads)
+    else:
+        if compression != 'none':
+            mode += compression
+        # DEBUG: tar = tarfile.open('', mode, fileobj=open('out.tar', 'wb'), encoding=encoding)
+        tar = tarfile.open('', mode, fileobj=sys.stdout, encoding=encoding)
     # if we have python 2.6 then we can use an exclude function, filter parameter is not available
     if sys.version_info[:2] == (2, 6):
         tar.add(
@@ -249,6 +299,8 @@ def writetar(sourcepath, arcname=None, subdirs=True, compression='none', encodin
                         recursive=False,
                     )
     tar.close()
+    if getattr(tar, 'compression_pool', None):
+        tar.compression_pool.close()
 
 #------------------------------------------------------------------------------
 
@@ -262,9 +314,35 @@ def readtar(archivepath, outputdir, encoding=None):
         archivepath, outputdir, encoding))
     mode = 'r:*'
     tar = tarfile.open(archivepath, mode, encoding=encoding)
-    tar.extractall(outputdir)
+    members = []
+    for tarinfo in tar:
+        if tarinfo.isreg() and file_compression.PAX_HEADER in tarinfo.pax_headers:
+            readtar_compressed(tar, tarinfo, outputdir)
+        else:
+            members.append(tarinfo)
+    # directories attributes are set at the end, after all files were written
+    tar.extractall(outputdir, members=members)
     tar.close()
 
+
+def readtar_compressed(tar, tarinfo, outputdir):
+    """
+    Extract and decompress single file which was compressed by ``CompressingTarFile``.
+    """
+    targetpath = os.path.join(outputdir, tarinfo.name)
+    dirpath = os.path.dirname(targetpath)
+    if dirpath and not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+    fin = tar.extractfile(tarinfo)
+    fout = open(targetpath, 'wb')
+    try:
+        file_compression.decompress_file(fin, fout, str(tarinfo.pax_headers[file_compression.PAX_HEADER]))
+    finally:
+        fout.close()
+        fin.close()
+    tar.chmod(tarinfo, targetpath)
+    tar.utime(tarinfo, targetpath)
+
 #------------------------------------------------------------------------------
 
 
@@ -291,7 +369,7 @@ def main():
 
     if len(sys.argv) < 4:
         printlog('bppipe extract <archive path> <output dir>\n')
-        printlog('bppipe <subdirs / nosubdirs> <"none" / "bz2"/"gz"> <folder/file path> [archive filename]\n')
+        printlog('bppipe <subdirs / nosubdirs> <"none" / "bz2"/"gz" / "zlib:1" ...> <folder/file path> [archive filename] [threads]\n')
         return 2
 
     try:
@@ -306,12 +384,16 @@ def main():
             arcname = None
             if len(sys.argv) >= 5:
                 arcname = sys.argv[4]
+            threads = 1
+            if len(sys.argv) >= 6:
+                threads = max(1, int(sys.argv[5]))
             writetar(
                 sourcepath=sys.argv[3],
                 arcname=arcname,
                 subdirs=True if cmd == 'subdirs' else False,
                 compression=sys.argv[2],
                 encoding=locale.getpreferredencoding(),
+                threads=threads,
             )
     except:
         printexc()
@@ -44,6 +44,9 @@ import time
 
 AppData = ''
 
+# customers files and folders removed by this process
+_RemovedPaths = []
+
 #------------------------------------------------------------------------------
 
 
@@ -79,6 +82,29 @@ def logfilepath():
     return sharedPath('bptester.log')
 
 
+def rememberRemoved(path):
+    """
+    Customer file or folder was removed here, main process must know that.
+    """
+    _RemovedPaths.append(path)
+
+
+def writeRemoved():
+    """
+    Append all removed paths to a file, ``local_tester`` reads it
+    when this process is finished and updates customers space index.
+    """
+    if not _RemovedPaths:
+        return
+    try:
+        fout = open(settings.LocalTesterRemovedPathsFile(), 'a')
+        fout.write(''.join([path + '\n' for path in _RemovedPaths]))
+        fout.close()
+    except:
+        printlog('ERROR writing ' + settings.LocalTesterRemovedPathsFile())
+    del _RemovedPaths[:]
+
+
 def printlog(txt):
     """
     Write a line to the log file.
@@ -174,6 +200,7 @@ def SpaceTime():
                     continue
                 try:
                     os.remove(path)
+                    rememberRemoved(path)
                     printlog('SpaceTime ' + path + ' file removed (cur:%s, max: %s)' % (str(currentV), str(maxspaceV)))
                 except:
                     printlog('SpaceTime ERROR removing ' + path)
@@ -189,6 +216,7 @@ def SpaceTime():
         if os.path.isdir(path):
             try:
                 bpio._dir_remove(path)
+                rememberRemoved(path)
                 printlog('SpaceTime ' + path + ' dir removed (%s)' % (remove_list[path]))
             except:
                 printlog('SpaceTime ERROR removing ' + path)
@@ -200,6 +228,7 @@ def SpaceTime():
             pass
         try:
             os.remove(path)
+            rememberRemoved(path)
             printlog('SpaceTime ' + path + ' file removed (%s)' % (remove_list[path]))
         except:
             printlog('SpaceTime ERROR removing ' + path)
@@ -242,6 +271,7 @@ def UpdateCustomers():
         if os.path.isdir(path):
             try:
                 bpio._dir_remove(path)
+                rememberRemoved(path)
                 printlog('UpdateCustomers ' + path + ' folder removed (%s)' % (remove_list[path]))
             except:
                 printlog('UpdateCustomers ERROR removing ' + path)
@@ -253,6 +283,7 @@ def UpdateCustomers():
             pass
         try:
             os.remove(path)
+            rememberRemoved(path)
             printlog('UpdateCustomers ' + path + ' file removed (%s)' % (remove_list[path]))
         except:
             printlog('UpdateCustomers ERROR removing ' + path)
@@ -291,6 +322,7 @@ def Validate():
                 if not packetsrc:
                     try:
                         os.remove(path)  # if is is no good it is of no use to anyone
+                        rememberRemoved(path)
                         printlog('Validate ' + path + ' removed (empty file)')
                     except:
                         printlog('Validate ERROR removing ' + path)
@@ -299,6 +331,7 @@ def Validate():
                 if p is None:
                     try:
                         os.remove(path)  # if is is no good it is of no use to anyone
+                        rememberRemoved(path)
                         printlog('Validate ' + path + ' removed (unserialize error)')
                     except:
                         printlog('Validate ERROR removing ' + path)
@@ -309,6 +342,7 @@ def Validate():
                 if not result:
                     try:
                         os.remove(path)  # if is is no good it is of no use to anyone
+                        rememberRemoved(path)
                         printlog('Validate ' + path + ' removed (invalid packet)')
                     except:
                         printlog('Validate ERROR removing ' + path)
@@ -341,6 +375,7 @@ def main():
         printlog('ERROR wrong command: ' + str(sys.argv))
         return
     cmd()
+    writeRemoved()
 #    bpio.stdout_stop_redirecting()
 #    bpio.CloseLogFile()
 
@@ -86,6 +86,25 @@ def raw():
     Enable service "Backups".
 {services/backups/block-size} preferred block size
     Preferred block size in bytes which used to split the raw data during backup.
+{services/backups/compression} compression
+    How to compress the data before encryption: "none", "gz" or "bz2" to compress the whole stream
+    or "zlib:1", "zlib:6", "zlib:9", "bz2:9" to compress every file separately with given level.
+    In the second case already compressed files like photos, music or archives are not compressed again
+    and several threads can be used, "zlib:1" is the fastest.
+{services/backups/compression-threads} compression threads
+    How many threads can compress parts of a big file at the same time during backup,
+    used only if every file is compressed separately.
+{services/backups/dedup-enabled} do not upload same data twice
+    Enable this to split the data into blocks depending on the content and
+    to not upload again the blocks which were not changed since older copies of same file or folder.
+    Older copies are kept while newer copies are using their blocks.
+    Backup data is not compressed in that mode.
+    Only whole blocks are reused: any change inside a block uploads it again,
+    so small changes spread over big files give little saving with big block size.
+{services/backups/encrypt-blocks-in-flight} blocks to encrypt at once
+    How many blocks can be encrypted in parallel threads during backup.
+    Encryption of the next blocks is overlapped with processing of the current block,
+    higher values use more memory.
 {services/backups/max-block-size} maximum block size
     Maximum block size in bytes which used to split the raw data during backup.
     The actual block size is calculated depending on size of the particular backup to optimize performance and data storage.
@@ -99,10 +118,20 @@ def raw():
     This increases data reliablity, rebuilding performance and decrease network load,
     but consumes space on your HDD.
     Every one Mb of source data uploaded will consume two Mb on your local HDD.
+{services/backups/raid-pipeline-enabled} pass blocks to raid worker in memory
+    Enable this to send every encrypted block directly to the raid worker process,
+    without writing a temporary ".raid" file on your local HDD first.
 {services/backups/wait-suppliers-enabled} wait suppliers 24 hours
     If you disabled storing of local data of your backups but one day a critical amount of your suppliers become unreliable - your data may be lost completely.
     Enable this option to wait for 24 hours after finishing any backup and perform a check all of your suppliers before removing the locally backed up data for this copy.
 
+{services/restores} restores settings
+    Restores setting.
+{services/restores/blocks-in-flight} blocks to restore at once
+    How many blocks can be downloaded and decoded in parallel during restore.
+    Pieces of the next blocks are requested from suppliers while the current block is decoded,
+    higher values use more bandwidth and space on your local HDD.
+
 {services/supplier} supplier service
     "Supplier" service settings.
 {services/supplier/donated} donated space
@@ -146,6 +175,10 @@ def raw():
 {services/entangled-dht/udp-port} udp port number for distributed hash table
     This is a UDP port number for Distributed Hash Table communications.
     BitDust uses <a href="http://entangled.sourceforge.net/">Entangled Project</a> to implement DHT functionality.
+{services/entangled-dht/receiving-queue-requests} incoming DHT requests queue limit
+    How many incoming DHT requests can wait to be processed, all other requests are dropped.
+{services/entangled-dht/receiving-queue-responses} incoming DHT responses queue limit
+    How many incoming DHT responses can wait to be processed, responses are always processed before requests.
 
 {services/tcp-connections/tcp-port} tcp port number
     Enter the TCP port number, it will be used to connect with your machine by other users.
@@ -93,10 +93,15 @@ def defaults():
         'services/accountant/enabled': TYPE_BOOLEAN,
         'services/backup-db/enabled': TYPE_BOOLEAN,
         'services/backups/block-size': TYPE_DISK_SPACE,
+        'services/backups/compression': TYPE_STRING,
+        'services/backups/compression-threads': TYPE_NON_ZERO_POSITIVE_INTEGER,
+        'services/backups/dedup-enabled': TYPE_BOOLEAN,
         'services/backups/enabled': TYPE_BOOLEAN,
+        'services/backups/encrypt-blocks-in-flight': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/backups/keep-local-copies-enabled': TYPE_BOOLEAN,
         'services/backups/max-block-size': TYPE_DISK_SPACE,
         'services/backups/max-copies': TYPE_POSITIVE_INTEGER,
+        'services/backups/raid-pipeline-enabled': TYPE_BOOLEAN,
         'services/backups/wait-suppliers-enabled': TYPE_BOOLEAN,
         'services/blockchain/enabled': TYPE_BOOLEAN,
         'services/blockchain/host': TYPE_STRING,
@@ -120,6 +125,8 @@ def defaults():
         'services/entangled-dht/enabled': TYPE_BOOLEAN,
         'services/entangled-dht/udp-port': TYPE_POSITIVE_INTEGER,
         'services/entangled-dht/known-nodes': TYPE_STRING,
+        'services/entangled-dht/receiving-queue-requests': TYPE_NON_ZERO_POSITIVE_INTEGER,
+        'services/entangled-dht/receiving-queue-responses': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/employer/enabled': TYPE_BOOLEAN,
         'services/gateway/enabled': TYPE_BOOLEAN,
         'services/http-connections/enabled': TYPE_BOOLEAN,
@@ -169,6 +176,7 @@ def defaults():
         'services/proxy-transport/router-lifetime-seconds': TYPE_POSITIVE_INTEGER,
         'services/rebuilding/enabled': TYPE_BOOLEAN,
         'services/restores/enabled': TYPE_BOOLEAN,
+        'services/restores/blocks-in-flight': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/shared-data/enabled': TYPE_BOOLEAN,
         'services/supplier/donated-space': TYPE_DISK_SPACE,
         'services/supplier/enabled': TYPE_BOOLEAN,
@@ -78,6 +78,7 @@ Commands:
   customer remove <IDURL>
   customer ping
   storage
+  storage rescan
   automat list
   service list
   service <service name>
@@ -223,6 +224,9 @@ Commands:
 
   storage               show donated/needed storage statistic
 
+  storage rescan        scan files stored for customers and re-build
+                        the index of used space
+
   automat list          list all running state machines and current states
 
   service list          list all registered services
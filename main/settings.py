@@ -421,13 +421,6 @@ def DefaultLocaltesterUpdateCustomersTimeout():
     return 5 * 60
 
 
-def DefaultLocaltesterSpaceTimeTimeout():
-    """
-    A period in seconds to call ``SpaceTime`` action of the local tester.
-    """
-    return 5 * 60
-
-
 def MinimumUsernameLength():
     """
     A minimum possible user name length.
@@ -1085,6 +1078,24 @@ def BackupIndexFilePath():
     return os.path.join(MetaDataDir(), BackupIndexFileName())
 
 
+def BackupIndexJournalFileName():
+    """
+    Changes made in the backup data base index after the latest snapshot in
+    ``BackupIndexFileName`` file, one line per revision.
+
+    Also saved on suppliers next to the index file, so only recent changes
+    are uploaded after every modification.
+    """
+    return 'index_journal'
+
+
+def BackupIndexJournalFilePath():
+    """
+    A full local path for ``BackupIndexJournalFileName`` file.
+    """
+    return os.path.join(MetaDataDir(), BackupIndexJournalFileName())
+
+
 def SupplierPath(supplier_idurl, customer_idurl, filename=None):
     """
     A location to given supplier's data.
@@ -1216,6 +1227,34 @@ def CustomersUsedSpaceFile():
     return os.path.join(MetaDataDir(), 'spaceused')
 
 
+def CustomersSpaceIndexFile():
+    """
+    Journal of all files stored for our customers, keeps size and age of every file.
+    """
+    return os.path.join(MetaDataDir(), 'spaceindex')
+
+
+def LocalTesterRemovedPathsFile():
+    """
+    Customers files and folders removed by ``bptester`` child process, one path per line.
+    """
+    return os.path.join(MetaDataDir(), 'localtester_removed')
+
+
+def LocalBackupsManifestFile():
+    """
+    Journal of all Data and Parity pieces stored in the local backups folder, keeps size of every piece.
+    """
+    return os.path.join(MetaDataDir(), 'localmanifest')
+
+
+def DedupIndexFile():
+    """
+    Journal of hashes of all blocks already stored on suppliers, used to not upload same data twice.
+    """
+    return os.path.join(MetaDataDir(), 'dedupindex')
+
+
 def BalanceFile():
     """
     This file keeps our current BitDust balance - two values:
@@ -1781,6 +1820,20 @@ def getDHTPort():
     return config.conf().getInt("services/entangled-dht/udp-port", DefaultDHTPort())
 
 
+def getDHTReceivingQueueRequestsLimit():
+    """
+    How many incoming DHT requests can wait in the queue to be processed.
+    """
+    return max(1, config.conf().getInt('services/entangled-dht/receiving-queue-requests', 500))
+
+
+def getDHTReceivingQueueResponsesLimit():
+    """
+    How many incoming DHT responses can wait in the queue to be processed.
+    """
+    return max(1, config.conf().getInt('services/entangled-dht/receiving-queue-responses', 1000))
+
+
 def enablePROXY(enable=None):
     """
     Switch on/off transport_proxy in the settings or get its current state.
@@ -2196,6 +2249,50 @@ def getBackupsKeepLocalCopies():
     return config.conf().getBool('services/backups/keep-local-copies-enabled')
 
 
+def getBackupsEncryptBlocksInFlight():
+    """
+    Return how many blocks can be encrypted at the same time during backup.
+    """
+    return max(1, config.conf().getInt('services/backups/encrypt-blocks-in-flight', 2))
+
+
+def getBackupsRaidPipelineEnabled():
+    """
+    Return True if encrypted blocks should be passed to the raid worker in
+    memory, without temporary ".raid" files.
+    """
+    return config.conf().getBool('services/backups/raid-pipeline-enabled')
+
+
+def getBackupsCompression():
+    """
+    Return compression mode of backup data, see ``storage.compression`` module.
+    """
+    return (config.conf().getData('services/backups/compression') or 'bz2').strip()
+
+
+def getBackupsCompressionThreads():
+    """
+    Return how many threads can compress files at the same time during backup.
+    """
+    return max(1, config.conf().getInt('services/backups/compression-threads', 1))
+
+
+def getBackupsDedupEnabled():
+    """
+    Return True if backup data should be split into content-defined blocks
+    and unchanged blocks of older versions should not be uploaded again.
+    """
+    return config.conf().getBool('services/backups/dedup-enabled')
+
+
+def getRestoreBlocksInFlight():
+    """
+    Return how many blocks can be downloaded and decoded at the same time during restore.
+    """
+    return max(1, config.conf().getInt('services/restores/blocks-in-flight', 4))
+
+
 def getGeneralWaitSuppliers():
     """
     Return True if user want to be sure that suppliers are reliable enough
@@ -2484,7 +2581,12 @@ def _setUpDefaultSettings():
     config.conf().setDefaultValue('services/backups/max-block-size',
                                   diskspace.MakeStringFromBytes(DefaultBackupMaxBlockSize()))
     config.conf().setDefaultValue('services/backups/max-copies', '2')
+    config.conf().setDefaultValue('services/backups/compression', 'bz2')
+    config.conf().setDefaultValue('services/backups/compression-threads', '1')
+    config.conf().setDefaultValue('services/backups/dedup-enabled', 'false')
+    config.conf().setDefaultValue('services/backups/encrypt-blocks-in-flight', '2')
     config.conf().setDefaultValue('services/backups/keep-local-copies-enabled', 'false')
+    config.conf().setDefaultValue('services/backups/raid-pipeline-enabled', 'true')
     config.conf().setDefaultValue('services/backups/wait-suppliers-enabled', 'false')
 
     config.conf().setDefaultValue('services/blockchain/enabled', 'false')
@@ -2519,6 +2621,8 @@ def _setUpDefaultSettings():
     config.conf().setDefaultValue('services/entangled-dht/enabled', 'true')
     config.conf().setDefaultValue('services/entangled-dht/udp-port', DefaultDHTPort())
     config.conf().setDefaultValue('services/entangled-dht/known-nodes', '')
+    config.conf().setDefaultValue('services/entangled-dht/receiving-queue-requests', '500')
+    config.conf().setDefaultValue('services/entangled-dht/receiving-queue-responses', '1000')
 
     config.conf().setDefaultValue('services/employer/enabled', 'true')
 
@@ -2587,6 +2691,7 @@ def _setUpDefaultSettings():
     config.conf().setDefaultValue('services/rebuilding/enabled', 'true')
 
     config.conf().setDefaultValue('services/restores/enabled', 'true')
+    config.conf().setDefaultValue('services/restores/blocks-in-flight', '4')
 
     config.conf().setDefaultValue('services/shared-data/enabled', 'true')
 
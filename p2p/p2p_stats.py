@@ -44,6 +44,7 @@ _CountersIn = {
     'identity_cache_count': 0,
     'identity_cache_fails': 0,
     'identity_cache_bytes': 0,
+    'identity_cache_not_modified': 0,
     'peers': {},
 }
 _CountersOut = {
@@ -150,6 +151,10 @@ def count_inbox(remote_idurl, proto, status, bytes_received):
         counters_in()['unknown_bytes'] += bytes_received
 
 
+def count_identity_cache_not_modified(idurl):
+    counters_in()['identity_cache_not_modified'] += 1
+
+
 def count_identity_cache(idurl, bytes_received):
     if bytes_received > 0:
         counters_in()['total_bytes'] += bytes_received
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# benchmark.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (benchmark.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: benchmark.
+
+Compare speed of raid procedures and check that results are identical.
+
+    python raid/benchmark.py [block size in bytes]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+if __name__ == '__main__':
+    dirpath = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sys.path.insert(0, os.path.abspath(os.path.join(dirpath, '..')))
+
+import raid.eccmap
+import raid.make
+import raid.read
+
+#------------------------------------------------------------------------------
+
+
+def _read_outputs(targetDir):
+    result = {}
+    for name in os.listdir(targetDir):
+        result[name] = raid.make.ReadBinaryFile(os.path.join(targetDir, name))
+    return result
+
+
+def _run_make(func, blockdata, eccmapname):
+    workdir = tempfile.mkdtemp(prefix='raid_bench_')
+    try:
+        filename = os.path.join(workdir, 'block.raid')
+        targetDir = os.path.join(workdir, 'out')
+        os.mkdir(targetDir)
+        raid.make.WriteFile(filename, blockdata)
+        t = time.time()
+        func(filename, eccmapname, 'F1', 0, targetDir)
+        dt = time.time() - t
+        return dt, _read_outputs(targetDir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_make(blocksize):
+    blockdata = os.urandom(blocksize)
+    print 'raid.make, block size %d bytes' % blocksize
+    print '%12s %12s %12s %10s  %s' % ('eccmap', 'orig, sec', 'new, sec', 'speedup', 'identical')
+    for eccmapname in raid.eccmap.EccMapNames():
+        dt_orig, out_orig = _run_make(raid.make.do_in_memory_orig, blockdata, eccmapname)
+        dt_new, out_new = _run_make(raid.make.do_in_memory, blockdata, eccmapname)
+        print '%12s %12.3f %12.3f %9.1fx  %s' % (
+            eccmapname, dt_orig, dt_new, dt_orig / max(dt_new, 0.000001), out_orig == out_new)
+
+
+def bench_read(blocksize):
+    blockdata = os.urandom(blocksize)
+    print 'raid.read, block size %d bytes, max correctable Data segments removed' % blocksize
+    print '%12s %10s %12s %12s  %s' % ('eccmap', 'removed', 'sec', 'MB/sec', 'restored')
+    for eccmapname in raid.eccmap.EccMapNames():
+        myeccmap = raid.eccmap.eccmap(eccmapname)
+        workdir = tempfile.mkdtemp(prefix='raid_bench_')
+        try:
+            filename = os.path.join(workdir, 'block.raid')
+            outfilename = os.path.join(workdir, 'restored.raid')
+            targetDir = os.path.join(workdir, 'F1')
+            os.mkdir(targetDir)
+            raid.make.WriteFile(filename, blockdata)
+            raid.make.do_in_memory(filename, eccmapname, 'F1', 0, targetDir)
+            roundeddata = raid.make.ReadBinaryFile(filename)
+            removed = 0
+            for DSegNum in xrange(myeccmap.datasegments):
+                if removed >= myeccmap.CorrectableErrors:
+                    break
+                os.remove(os.path.join(targetDir, '0-%d-Data' % DSegNum))
+                removed += 1
+            t = time.time()
+            raid.read.raidread(outfilename, eccmapname, 'F1', 0, workdir)
+            dt = time.time() - t
+            restored = raid.make.ReadBinaryFile(outfilename) == roundeddata
+            print '%12s %10d %12.3f %12.1f  %s' % (
+                eccmapname, removed, dt, len(roundeddata) / max(dt, 0.000001) / (1024.0 * 1024.0), restored)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    blocksize = 1024 * 1024
+    if len(sys.argv) > 1:
+        blocksize = int(sys.argv[1])
+    bench_make(blocksize)
+    bench_read(blocksize)
+
+
+if __name__ == "__main__":
+    main()
@@ -52,6 +52,7 @@ import os
 import sys
 import struct
 import time
+import binascii
 import cStringIO
 import platform
 
@@ -141,7 +142,97 @@ def WriteFile(filename, data):
 #    return dataNum, parityNum
 
 
+def SegmentToLong(data):
+    """
+    Convert a whole segment into one wide integer, so all the 4-byte words of
+    the segment can be XOR-ed at once instead of one by one.
+    """
+    if not data:
+        return 0
+    return int(binascii.hexlify(data), 16)
+
+
+def LongToSegment(value, length):
+    """
+    Reverse of ``SegmentToLong()``, returns exactly ``length`` bytes.
+    """
+    if length <= 0:
+        return ''
+    return binascii.unhexlify('%0*x' % (length * 2, value))
+
+
 def do_in_memory(filename, eccmapname, version, blockNumber, targetDir):
+    """
+    Split the block stored in ``filename`` into Data segments and calculate
+    Parity segments, see ``do_data_in_memory()``.
+    """
+    INTSIZE = 4
+    myeccmap = raid.eccmap.eccmap(eccmapname)
+    # any padding at end and block.Length fixes
+    RoundupFile(filename, myeccmap.datasegments * INTSIZE)
+    del myeccmap
+    wholefile = ReadBinaryFile(filename)
+    return do_data_in_memory(wholefile, eccmapname, version, blockNumber, targetDir)
+
+
+def do_data_in_memory(wholefile, eccmapname, version, blockNumber, targetDir):
+    """
+    Split the block data into Data segments and calculate Parity segments.
+
+    Here block data is passed directly, so no temporary ".raid" file is needed.
+    Every Data segment is converted once into a wide integer and XOR-ed
+    into the Parity segments mentioned in ``eccmap.DataToParity``,
+    every output file is written with a single call.
+    Output is byte-identical to ``do_in_memory_orig()``,
+    which XOR-s segments word by word.
+
+    Returns number of Data and Parity segments and size of every
+    Data and Parity file, so caller do not need to check them on disk.
+    """
+    INTSIZE = 4
+    myeccmap = raid.eccmap.eccmap(eccmapname)
+    length = len(wholefile)
+    # any padding at end and block.Length fixes, same as RoundupFile() does
+    mod = length % (myeccmap.datasegments * INTSIZE)
+    if mod > 0:
+        length += myeccmap.datasegments * INTSIZE - mod
+    seglength = (length + myeccmap.datasegments - 1) / myeccmap.datasegments
+    # parity covers only whole words, same as in do_in_memory_orig()
+    paritylength = (seglength / INTSIZE) * INTSIZE
+
+    Parities = [0, ] * myeccmap.paritysegments
+    for DSegNum in xrange(myeccmap.datasegments):
+        segoffset = DSegNum * seglength
+        segdata = wholefile[segoffset:segoffset + seglength]
+        if len(segdata) < seglength:
+            # any padding should go at the end of last seg
+            # and block.Length fixes
+            segdata += ' ' * (seglength - len(segdata))
+        FileName = targetDir + '/' + str(blockNumber) + '-' + str(DSegNum) + '-Data'
+        WriteFile(FileName, segdata)
+        if paritylength < seglength:
+            segdata = segdata[:paritylength]
+        b = SegmentToLong(segdata)
+        del segdata
+        for PSegNum in myeccmap.DataToParity[DSegNum]:
+            if PSegNum > myeccmap.paritysegments:
+                myeccmap.check()
+                raise Exception("eccmap error")
+            Parities[PSegNum] ^= b
+        del b
+
+    for PSegNum in xrange(myeccmap.paritysegments):
+        FileName = targetDir + '/' + str(blockNumber) + '-' + str(PSegNum) + '-Parity'
+        WriteFile(FileName, LongToSegment(Parities[PSegNum], paritylength))
+
+    dataNum = myeccmap.datasegments
+    parityNum = myeccmap.paritysegments
+    del myeccmap
+    del Parities
+    return dataNum, parityNum, seglength, paritylength
+
+
+def do_in_memory_orig(filename, eccmapname, version, blockNumber, targetDir):
     INTSIZE = 4
     myeccmap = raid.eccmap.eccmap(eccmapname)
     # any padding at end and block.Length fixes
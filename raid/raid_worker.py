@@ -74,6 +74,7 @@ import rebuild
 
 _MODULES = (
     'os',
+    'binascii',
     'cStringIO',
     'struct',
     'logs.lg',
@@ -89,7 +90,10 @@ _MODULES = (
 
 _VALID_TASKS = {
     'make': (make.do_in_memory,
-             (make.RoundupFile, make.ReadBinaryFile, make.WriteFile)),
+             (make.RoundupFile, make.ReadBinaryFile, make.WriteFile,
+              make.SegmentToLong, make.LongToSegment, make.do_data_in_memory)),
+    'make-data': (make.do_data_in_memory,
+                  (make.WriteFile, make.SegmentToLong, make.LongToSegment)),
     'read': (read.raidread,
              (read.RebuildOne, read.ReadBinaryFile,)),
     'rebuild': (rebuild.rebuild,
@@ -104,7 +108,7 @@ _RaidWorker = None
 
 
 def add_task(cmd, params, callback):
-    lg.out(10, 'raid_worker.add_task [%s] %s' % (cmd, str(params)[:80]))
+    lg.out(10, 'raid_worker.add_task [%s] %s' % (cmd, str(params[1:] if cmd == 'make-data' else params)[:80]))
     A('new-task', (cmd, params, callback))
 
 
@@ -118,9 +122,9 @@ def cancel_task(cmd, first_parameter):
         if cmd == t_cmd and first_parameter == t_params[0]:
             try:
                 A().tasks.remove(t_id, t_cmd, t_params)
-                lg.out(10, 'raid_worker.cancel_task found pending task %d, canceling %s' % (t_id, first_parameter))
+                lg.out(10, 'raid_worker.cancel_task found pending task %d, canceling %s' % (t_id, str(first_parameter)[:80]))
             except:
-                lg.warn('failed removing pending task %d, %s' % (t_id, first_parameter))
+                lg.warn('failed removing pending task %d, %s' % (t_id, str(first_parameter)[:80]))
             found = True
             break
 #    for i in xrange(len(A().tasks)):
@@ -138,7 +142,7 @@ def cancel_task(cmd, first_parameter):
             found = True
             break
     if not found:
-        lg.warn('task not found: %s %s' % (cmd, first_parameter))
+        lg.warn('task not found: %s %s' % (cmd, str(first_parameter)[:80]))
         return False
     return True
 
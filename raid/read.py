@@ -61,6 +61,7 @@ import struct
 #------------------------------------------------------------------------------
 
 import raid.eccmap
+import raid.make
 
 #------------------------------------------------------------------------------
 
@@ -102,36 +103,31 @@ def ReadBinaryFile(filename):
 
 
 def RebuildOne(inlist, listlen, outfilename):
-    readsize = 1  # vary from 1 byte to 4 bytes
-    # range(listlen)   # just need a list of this size
-    raidfiles = [''] * listlen
-    raidreads = [''] * listlen  # range(listlen)
+    """
+    XOR ``listlen`` input files and write result to ``outfilename``.
+
+    Every input file is read once and XOR-ed as a whole segment,
+    output has same length as the first input file.
+    """
+    seglength = None
+    xor = 0
     for filenum in xrange(listlen):
         try:
-            raidfiles[filenum] = open(inlist[filenum], "rb")
+            fin = open(inlist[filenum], "rb")
+            segdata = fin.read()
+            fin.close()
         except:
-            for f in raidfiles:
-                try:
-                    f.close()
-                except:
-                    pass
             return False
+        if seglength is None:
+            seglength = len(segdata)
+        if len(segdata) < seglength:
+            return False
+        if len(segdata) > seglength:
+            segdata = segdata[:seglength]
+        xor ^= raid.make.SegmentToLong(segdata)
+        del segdata
     rebuildfile = open(outfilename, "wb")
-    while True:
-        for k in xrange(listlen):
-            raidreads[k] = raidfiles[k].read(2048)
-        if not raidreads[0]:
-            break
-        i = 0
-        while i < len(raidreads[0]):
-            xor = 0
-            for j in xrange(listlen):
-                b1 = ord(raidreads[j][i])
-                xor = xor ^ b1
-            rebuildfile.write(chr(xor))
-            i += readsize
-    for filenum in xrange(listlen):
-        raidfiles[filenum].close()
+    rebuildfile.write(raid.make.LongToSegment(xor, seglength or 0))
     rebuildfile.close()
     return True
 
@@ -178,10 +174,10 @@ def RebuildOne_orig(inlist, listlen, outfilename):
 # If segment is good, there is a file for it, if not then no file exists.
 # We only rebuild data segments.
 # Could only make parity segments from existing data segments, so no help toward getting data.
-# As long as we could rebuild one more data segment in a pass,
-#  we do another pass to see if we are then able to do another.
-#  When we can't do anything more we could how many good data segments there
-#    are, and if we have all we win, if not we fail.
+# The whole fix order is resolved from the ecc map first: as long as we could
+# rebuild one more data segment we do another pass to see if we are then able to do another.
+# After that every needed segment is read only once and missing segments are
+# XOR-ed in memory, rebuilt segments are also written to disk.
 
 
 def raidread(
@@ -191,57 +187,68 @@ def raidread(
         blockNumber,
         data_parity_dir):
     myeccmap = raid.eccmap.eccmap(eccmapname)
-    GoodFiles = range(0, 200)
-    MakingProgress = 1
-    while MakingProgress == 1:
-        MakingProgress = 0
-        for PSegNum in xrange(myeccmap.paritysegments):
-            PFileName = os.path.join(
-                data_parity_dir,
-                version,
-                str(blockNumber) +
-                '-' +
-                str(PSegNum) +
-                '-Parity')
-            if os.path.exists(PFileName):
-                Map = myeccmap.ParityToData[PSegNum]
-                TotalDSegs = 0
-                GoodDSegs = 0
-                for DSegNum in Map:
-                    TotalDSegs += 1
-                    FileName = os.path.join(
-                        data_parity_dir,
-                        version,
-                        str(blockNumber) +
-                        '-' +
-                        str(DSegNum) +
-                        '-Data')
-                    if os.path.exists(FileName):
-                        GoodFiles[GoodDSegs] = FileName
-                        GoodDSegs += 1
-                    else:
-                        BadName = FileName
-                if GoodDSegs == TotalDSegs - 1:
-                    MakingProgress = 1
-                    GoodFiles[GoodDSegs] = PFileName
-                    GoodDSegs += 1
-                    RebuildOne(GoodFiles, GoodDSegs, BadName)
+
+    def _segment_filename(SegNum, dataORparity):
+        return os.path.join(
+            data_parity_dir,
+            version,
+            str(blockNumber) + '-' + str(SegNum) + '-' + dataORparity)
+
+    DataSegs = [0] * myeccmap.datasegments
+    ParitySegs = [0] * myeccmap.paritysegments
+    for DSegNum in xrange(myeccmap.datasegments):
+        if os.path.exists(_segment_filename(DSegNum, 'Data')):
+            DataSegs[DSegNum] = 1
+    for PSegNum in xrange(myeccmap.paritysegments):
+        if os.path.exists(_segment_filename(PSegNum, 'Parity')):
+            ParitySegs[PSegNum] = 1
+
+    FixPath = []
+    MakingProgress = True
+    while MakingProgress:
+        MakingProgress = False
+        for DSegNum in xrange(myeccmap.datasegments):
+            if DataSegs[DSegNum]:
+                continue
+            PSegNum, PMap = myeccmap.GetDataFixPath(DataSegs, ParitySegs, DSegNum)
+            if PSegNum == -1:
+                continue
+            FixPath.append((DSegNum, PSegNum, PMap))
+            DataSegs[DSegNum] = 1
+            MakingProgress = True
+
+    Segments = {}
+
+    def _read_segment(SegNum, dataORparity):
+        key = (SegNum, dataORparity)
+        if key not in Segments:
+            Segments[key] = ReadBinaryFile(_segment_filename(SegNum, dataORparity))
+        return Segments[key]
+
+    for DSegNum, PSegNum, PMap in FixPath:
+        paritydata = _read_segment(PSegNum, 'Parity')
+        seglength = len(paritydata)
+        xor = raid.make.SegmentToLong(paritydata)
+        for DataNum in PMap:
+            if DataNum == DSegNum:
+                continue
+            xor ^= raid.make.SegmentToLong(_read_segment(DataNum, 'Data')[:seglength])
+        Segments[(DSegNum, 'Data')] = raid.make.LongToSegment(xor, seglength)
+        del xor
+        fout = open(_segment_filename(DSegNum, 'Data'), "wb")
+        fout.write(Segments[(DSegNum, 'Data')])
+        fout.close()
+
     #  Count up the good segments and combine
     GoodDSegs = 0
     output = open(OutputFileName, "wb")
     for DSegNum in xrange(myeccmap.datasegments):
-        FileName = os.path.join(
-            data_parity_dir,
-            version,
-            str(blockNumber) +
-            '-' +
-            str(DSegNum) +
-            '-Data')
-        if os.path.exists(FileName):
+        if DataSegs[DSegNum]:
             GoodDSegs += 1
-            moredata = open(FileName, "rb").read()
-            output.write(moredata)
+            output.write(_read_segment(DSegNum, 'Data'))
+            Segments.pop((DSegNum, 'Data'), None)
     output.close()
+    Segments.clear()
     return GoodDSegs
     # except:
     #     return None
@@ -60,6 +60,8 @@ class SupplierService(LocalService):
         from main import events
         from contacts import contactsdb
         from storage import accounting
+        from supplier import customer_space
+        customer_space.init()
         callback.append_inbox_callback(self._on_inbox_packet_received)
         events.add_subscriber(self._on_customer_accepted, 'existing-customer-accepted')
         events.add_subscriber(self._on_customer_accepted, 'new-customer-accepted')
@@ -84,6 +86,8 @@ class SupplierService(LocalService):
         events.remove_subscriber(self._on_customer_terminated, 'existing-customer-denied')
         events.remove_subscriber(self._on_customer_terminated, 'existing-customer-terminated')
         callback.remove_inbox_callback(self._on_inbox_packet_received)
+        from supplier import customer_space
+        customer_space.shutdown()
         return True
 
     def request(self, json_payload, newpacket, info):
@@ -301,7 +305,8 @@ class SupplierService(LocalService):
             if packetID not in [settings.BackupInfoFileName(),
                                 settings.BackupInfoFileNameOld(),
                                 settings.BackupInfoEncryptedFileName(),
-                                settings.BackupIndexFileName()]:
+                                settings.BackupIndexFileName(),
+                                settings.BackupIndexJournalFileName()]:
                 lg.warn('invalid file path')
                 return ''
         if not contactsdb.is_customer(customerIDURL):  # SECURITY
@@ -332,6 +337,8 @@ class SupplierService(LocalService):
         from userid import global_id
         from p2p import p2p_service
         from main import events
+        from supplier import customer_space
+        from supplier import list_files
         if newpacket.Payload == '':
             ids = [newpacket.PacketID, ]
         else:
@@ -364,12 +371,16 @@ class SupplierService(LocalService):
                     filescount += 1
                 except:
                     lg.exc()
+                customer_space.file_removed(newpacket.OwnerID, filename)
+                list_files.file_changed(filename)
             elif os.path.isdir(filename):
                 try:
                     bpio._dir_remove(filename)
                     dirscount += 1
                 except:
                     lg.exc()
+                customer_space.folder_removed(newpacket.OwnerID, filename)
+                list_files.folder_removed(filename)
             else:
                 lg.warn("path not found %s" % filename)
             if self.publish_event_supplier_file_modified:
@@ -390,6 +401,8 @@ class SupplierService(LocalService):
         from userid import global_id
         from p2p import p2p_service
         from main import events
+        from supplier import customer_space
+        from supplier import list_files
         if newpacket.Payload == '':
             ids = [newpacket.PacketID, ]
         else:
@@ -421,12 +434,16 @@ class SupplierService(LocalService):
                     count += 1
                 except:
                     lg.exc()
+                customer_space.folder_removed(newpacket.OwnerID, filename)
+                list_files.folder_removed(filename)
             elif os.path.isfile(filename):
                 try:
                     os.remove(filename)
                     count += 1
                 except:
                     lg.exc()
+                customer_space.file_removed(newpacket.OwnerID, filename)
+                list_files.file_changed(filename)
             else:
                 lg.warn("path not found %s" % filename)
             if self.publish_event_supplier_file_modified:
@@ -451,6 +468,7 @@ class SupplierService(LocalService):
         from transport import gateway
         from p2p import p2p_service
         from p2p import commands
+        from supplier import customer_space
         # external customer must be able to request
         # TODO: add validation of public key
         # if not contactsdb.is_customer(newpacket.OwnerID):
@@ -500,6 +518,22 @@ class SupplierService(LocalService):
             lg.warn("empty data on disk %s" % filename)
             p2p_service.SendFail(newpacket, 'empty data on disk')
             return False
+        if customer_space.is_verified(glob_path['idurl'], filename, len(data)):
+            # signature of that packet was checked when it was stored,
+            # so stored bytes are sent back as they are without reading the packet
+            routed_packet = signed.Packet(
+                Command=commands.Data(),
+                OwnerID=glob_path['idurl'],
+                CreatorID=my_id.getLocalIDURL(),
+                PacketID=newpacket.PacketID,
+                Payload=data,
+                RemoteID=recipient_idurl,
+            )
+            del data
+            lg.info('from request %r : sending stored data of %s to %s' % (
+                newpacket, glob_path['idurl'], recipient_idurl))
+            gateway.outbox(routed_packet)
+            return True
         stored_packet = signed.Unserialize(data)
         del data
         if stored_packet is None:
@@ -510,6 +544,8 @@ class SupplierService(LocalService):
             lg.warn("Stored packet is not Valid %s" % filename)
             p2p_service.SendFail(newpacket, 'stored packet is not valid')
             return False
+        if stored_packet.OwnerID == glob_path['idurl']:
+            customer_space.file_verified(glob_path['idurl'], filename)
         if stored_packet.Command != commands.Data():
             lg.warn('sending back packet which is not a Data')
         # here Data() packet is sent back as it is...
@@ -537,7 +573,6 @@ class SupplierService(LocalService):
 
     def _on_data(self, newpacket):
         import os
-        from twisted.internet import reactor
         from logs import lg
         from system import bpio
         from main import settings
@@ -545,6 +580,9 @@ class SupplierService(LocalService):
         from userid import global_id
         from contacts import contactsdb
         from p2p import p2p_service
+        from storage import accounting
+        from supplier import customer_space
+        from supplier import list_files
         if newpacket.OwnerID == my_id.getLocalID():
             # this Data belong to us, SKIP
             return False
@@ -576,26 +614,19 @@ class SupplierService(LocalService):
                 p2p_service.SendFail(newpacket, 'write error')
                 return False
         data = newpacket.Serialize()
-        donated_bytes = settings.getDonatedBytes()
-        if not os.path.isfile(settings.CustomersSpaceFile()):
-            bpio._write_dict(settings.CustomersSpaceFile(), {'free': donated_bytes, })
+        if accounting.check_create_customers_quotas():
             lg.warn('created a new space file: %s' % settings.CustomersSpaceFile())
-        space_dict = bpio._read_dict(settings.CustomersSpaceFile())
-        if newpacket.OwnerID not in space_dict.keys():
+        bytes_donated_to_customer = accounting.get_customer_quota(newpacket.OwnerID)
+        if bytes_donated_to_customer is None:
             lg.err("no info about donated space for %s" % newpacket.OwnerID)
             p2p_service.SendFail(newpacket, 'no info about donated space')
             return False
-        used_space_dict = bpio._read_dict(settings.CustomersUsedSpaceFile(), {})
-        if newpacket.OwnerID in used_space_dict.keys():
-            try:
-                bytes_used_by_customer = int(used_space_dict[newpacket.OwnerID])
-                bytes_donated_to_customer = int(space_dict[newpacket.OwnerID])
-                if bytes_donated_to_customer - bytes_used_by_customer < len(data):
-                    lg.warn("no free space for %s" % newpacket.OwnerID)
-                    p2p_service.SendFail(newpacket, 'no free space')
-                    return False
-            except:
-                lg.exc()
+        bytes_used_by_customer = customer_space.used_bytes(newpacket.OwnerID)
+        bytes_used_by_customer -= customer_space.file_size(newpacket.OwnerID, filename) or 0
+        if bytes_donated_to_customer - bytes_used_by_customer < len(data):
+            lg.warn("no free space for %s" % newpacket.OwnerID)
+            p2p_service.SendFail(newpacket, 'no free space')
+            return False
         if not bpio.WriteFile(filename, data):
             lg.err("can not write to %s" % str(filename))
             p2p_service.SendFail(newpacket, 'write error')
@@ -606,8 +637,11 @@ class SupplierService(LocalService):
         lg.out(self.debug_level, "service_supplier._on_data %r saved from [%s | %s] to %s with %d bytes" % (
             newpacket, newpacket.OwnerID, newpacket.CreatorID, filename, sz, ))
         p2p_service.SendAck(newpacket, str(len(newpacket.Payload)))
-        from supplier import local_tester
-        reactor.callLater(0, local_tester.TestSpaceTime)
+        # incoming packet was already verified, remember that to not check the stored file again
+        customer_space.file_written(newpacket.OwnerID, filename, sz, verified=(newpacket.OwnerID == glob_path['idurl']))
+        list_files.file_changed(filename)
+        for removed_filename in customer_space.release_space(newpacket.OwnerID, bytes_donated_to_customer):
+            list_files.file_changed(removed_filename)
         if self.publish_event_supplier_file_modified:
             from main import events
             events.send('supplier-file-modified', data=dict(
@@ -689,10 +723,14 @@ class SupplierService(LocalService):
         from userid import my_id
         from userid import global_id
         from p2p import p2p_queue
+        from supplier import customer_space
+        from supplier import list_files
         customer_idurl = e.data.get('idurl')
         if not customer_idurl:
             lg.warn('unknown customer idurl in event data payload')
             return
+        customer_space.customer_removed(customer_idurl)
+        list_files.forget_customer(customer_idurl)
         customer_glob_id = global_id.idurl2glob(customer_idurl)
         queue_id = global_id.MakeGlobalQueueID(
             queue_alias='supplier-file-modified',
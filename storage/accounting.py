@@ -61,6 +61,10 @@ from storage import backup_fs
 
 #------------------------------------------------------------------------------
 
+_CustomersQuotas = None
+
+#------------------------------------------------------------------------------
+
 
 def init():
     lg.out(_DebugLevel, 'accounting.init')
@@ -68,26 +72,41 @@ def init():
 #------------------------------------------------------------------------------
 
 
+def _customers_quotas():
+    """
+    Space file is read only once and then kept in memory until it is re-written.
+    """
+    global _CustomersQuotas
+    if _CustomersQuotas is None:
+        _CustomersQuotas = bpio._read_dict(settings.CustomersSpaceFile(), None)
+        if _CustomersQuotas is None:
+            return {}
+    return _CustomersQuotas
+
+
 def read_customers_quotas():
-    return bpio._read_dict(settings.CustomersSpaceFile(), {})
+    return dict(_customers_quotas())
 
 
 def write_customers_quotas(new_space_dict):
+    global _CustomersQuotas
+    _CustomersQuotas = None
     return bpio._write_dict(settings.CustomersSpaceFile(), new_space_dict)
 
 
 def get_customer_quota(customer_idurl):
     assert customer_idurl != 'free'
     try:
-        return int(read_customers_quotas().get(customer_idurl, None))
+        return int(_customers_quotas().get(customer_idurl, None))
     except:
         return None
 
 
 def check_create_customers_quotas():
+    if _CustomersQuotas is not None:
+        return False
     if not os.path.isfile(settings.CustomersSpaceFile()):
-        bpio._write_dict(settings.CustomersSpaceFile(),
-                         {'free': settings.getDonatedBytes()})
+        write_customers_quotas({'free': settings.getDonatedBytes()})
         return True
     return False
 
@@ -106,7 +125,7 @@ def validate_customers_quotas(space_dict=None):
     unknown_customers = set()
     unused_quotas = set()
     if space_dict is None:
-        space_dict = bpio._read_dict(settings.CustomersSpaceFile(), {})
+        space_dict = read_customers_quotas()
     for idurl in list(space_dict.keys()):
         try:
             space_dict[idurl] = int(space_dict[idurl])
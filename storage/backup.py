@@ -61,6 +61,12 @@ and deleted (user configurable) as soon as the suppliers have them.
 
 For each block must be received delivery report: positive or negative.
 
+If "services/backups/dedup-enabled" option is set the data is split into
+blocks of different size by ``storage.chunker`` depending on the content.
+Block which was already stored in an older version of same path
+(see ``storage.dedup_index``) is not uploaded again: a tiny block is created
+instead which only refers to the older one.
+
 Process will be completed as soon as all data will be read from the folder
 and all blocks will receive a delivery report.
 
@@ -93,6 +99,7 @@ try:
 except:
     sys.exit('Error initializing twisted.internet.reactor in backup.py')
 
+from twisted.internet import threads
 from twisted.internet.defer import maybeDeferred
 
 #------------------------------------------------------------------------------
@@ -124,6 +131,9 @@ from raid import raid_worker
 from crypt import encrypted
 from crypt import key
 
+from storage import chunker
+from storage import dedup_index
+
 #-------------------------------------------------------------------------------
 
 
@@ -154,10 +164,23 @@ class backup(automat.Automat):
         self.sourcePath = sourcePath
         self.keyID = keyID
         self.eccmap = eccmap.Current()
+        self.raidPipeline = settings.getBackupsRaidPipelineEnabled()
+        self.encryptInFlight = settings.getBackupsEncryptBlocksInFlight()
         self.pipe = pipe
         self.blockSize = blockSize
         if self.blockSize is None:
             self.blockSize = settings.getBackupBlockSize()
+        self.dedup = settings.getBackupsDedupEnabled()
+        self.readBlockSize = self.blockSize
+        if self.dedup:
+            # need to have enough data to find the block boundary
+            self.readBlockSize = chunker.max_size(self.blockSize)
+            self.dedupMask = chunker.make_mask(self.blockSize)
+        # (hash, block number, length) of blocks which are really stored in this version
+        self.dedupBlocks = []
+        # older versions this version refers to
+        self.dedupSources = set()
+        self.dedupTail = ''
         self.ask4abort = False
         self.terminating = False
         self.stateEOF = False
@@ -166,6 +189,8 @@ class backup(automat.Automat):
         self.currentBlockData = cStringIO.StringIO()
         self.currentBlockSize = 0
         self.workBlocks = {}
+        self.encryptingBlocks = {}
+        self.nextRaidBlockNumber = 0
         self.blockNumber = 0
         self.dataSent = 0
         self.blocksSent = 0
@@ -189,9 +214,15 @@ class backup(automat.Automat):
                 self.doFirstBlock(arg)
         #---READ---
         elif self.state == 'READ':
-            if event == 'read-success' and not self.isReadingNow(arg) and ( self.isBlockReady(arg) or self.isEOF(arg) ):
+            if event == 'read-success' and not self.isReadingNow(arg) and self.isBlockReady(arg) and not self.isEOF(arg) and self.isMoreEncryptSlots(arg):
+                self.doEncryptBlock(arg)
+                self.doNextBlock(arg)
+                self.doRead(arg)
+            elif event == 'read-success' and not self.isReadingNow(arg) and ( self.isBlockReady(arg) or self.isEOF(arg) ):
                 self.state = 'ENCRYPT'
                 self.doEncryptBlock(arg)
+            elif event == 'block-encrypted':
+                self.doBlockPushAndRaid(arg)
             elif event == 'fail' or ( ( event == 'read-success' or event == 'timer-001sec' ) and self.isAborted(arg) ):
                 self.state = 'ABORTED'
                 self.doClose(arg)
@@ -221,6 +252,8 @@ class backup(automat.Automat):
                 self.doPopBlock(arg)
                 self.doBlockReport(arg)
                 data_sender.A('new-data')
+            elif event == 'block-encrypted':
+                self.doBlockPushAndRaid(arg)
             elif event == 'fail' or ( ( event == 'timer-01sec' or event == 'block-raid-done' or event == 'block-raid-started' ) and self.isAborted(arg) ):
                 self.state = 'ABORTED'
                 self.doClose(arg)
@@ -262,7 +295,7 @@ class backup(automat.Automat):
         return self.pipe is not None and self.pipe.state() in [nonblocking.PIPE_CLOSED, nonblocking.PIPE_READY2READ]
 
     def isBlockReady(self, arg):
-        return self.currentBlockSize >= self.blockSize
+        return self.currentBlockSize >= self.readBlockSize
 
     def isEOF(self, arg):
         return self.stateEOF
@@ -274,7 +307,13 @@ class backup(automat.Automat):
         """
         Condition method.
         """
-        return len(self.workBlocks) > 1
+        return len(self.workBlocks) > 1 or len(self.encryptingBlocks) > 0
+
+    def isMoreEncryptSlots(self, arg):
+        """
+        Condition method.
+        """
+        return len(self.encryptingBlocks) + 1 < self.encryptInFlight
 
     def doInit(self, arg):
         """
@@ -284,7 +323,7 @@ class backup(automat.Automat):
 
     def doRead(self, arg):
         def readChunk():
-            size = self.blockSize - self.currentBlockSize
+            size = self.readBlockSize - self.currentBlockSize
             if size < 0:
                 lg.out(1, "backup.readChunk ERROR eccmap.nodes=" + str(self.eccmap.nodes()))
                 lg.out(1, "backup.readChunk ERROR blockSize=" + str(self.blockSize))
@@ -325,26 +364,49 @@ class backup(automat.Automat):
         d.addErrback(lambda err: self.automat('fail', err))
 
     def doEncryptBlock(self, arg):
-        def _doBlock():
+        """
+        Action method.
+
+        Block is encrypted in a separate thread to not block the reactor,
+        up to ``encryptInFlight`` blocks can be encrypted at the same time.
+        The ``dedup_index`` is only used here in the main thread.
+        """
+        def _doBlock(blockNumber, src, atEOF, dedup_info):
             dt = time.time()
-            src = self.currentBlockData.getvalue()
+            if dedup_info and dedup_info[2]:
+                # same data was already stored in older version
+                source = dedup_info[2]
+                src = '%s %d %d %s' % (source[0], source[1], source[2], dedup_info[0])
             block = encrypted.Block(
                 my_id.getLocalID(),
                 self.backupID,
-                self.blockNumber,
+                blockNumber,
                 key.NewSessionKey(),
                 key.SessionKeyType(),
-                self.stateEOF,
+                atEOF,
                 src,
                 EncryptKey=self.keyID,
+                Reference=bool(dedup_info and dedup_info[2]),
             )
-            del src
             if _Debug:
-                lg.out(_DebugLevel, 'backup.doEncryptBlock blockNumber=%d size=%d atEOF=%s dt=%s EncryptKey=%s' % (
-                    self.blockNumber, self.currentBlockSize, self.stateEOF, str(time.time() - dt), self.keyID))
-            return block
-        d = maybeDeferred(_doBlock)
-        d.addCallback(lambda block: self.automat('block-encrypted', block))
+                lg.out(_DebugLevel, 'backup.doEncryptBlock blockNumber=%d size=%d atEOF=%s dt=%s EncryptKey=%s reference=%s' % (
+                    blockNumber, len(src), atEOF, str(time.time() - dt), self.keyID, block.Reference))
+            del src
+            return block, dedup_info
+        blockNumber = self.blockNumber
+        self.encryptingBlocks[blockNumber] = None
+        src = self.currentBlockData.getvalue()
+        dedup_info = None
+        if self.dedup and not self.stateEOF:
+            pos = chunker.find_boundary(src, chunker.min_size(self.blockSize), self.readBlockSize, self.dedupMask)
+            # the rest goes to the next block
+            self.dedupTail = src[pos:]
+            self.currentBlockSize = pos
+            src = src[:pos]
+            digest = chunker.block_hash(src)
+            dedup_info = (digest, len(src), dedup_index.lookup(self.backupID, digest), )
+        d = threads.deferToThread(_doBlock, blockNumber, src, self.stateEOF, dedup_info)
+        d.addCallback(lambda result: self._on_block_encrypted(blockNumber, *result))
         d.addErrback(lambda err: self.automat('fail', err))
 
     def doBlockPushAndRaid(self, arg):
@@ -362,12 +424,18 @@ class backup(automat.Automat):
             self.automat('block-raid-done', (newblock.BlockNumber, None))
             lg.out(_DebugLevel, 'backup.doBlockPushAndRaid SKIP, terminating=True')
             return
-        fileno, filename = tmpfile.make('raid', extension='.raid')
         serializedblock = newblock.Serialize()
         blocklen = len(serializedblock)
-        os.write(fileno, str(blocklen) + ":" + serializedblock)
-        os.close(fileno)
-        self.workBlocks[newblock.BlockNumber] = filename
+        if self.raidPipeline:
+            # block data goes directly to the raid worker process, no temporary file
+            raid_cmd = 'make-data'
+            raidsource = str(blocklen) + ":" + serializedblock
+        else:
+            raid_cmd = 'make'
+            fileno, raidsource = tmpfile.make('raid', extension='.raid')
+            os.write(fileno, str(blocklen) + ":" + serializedblock)
+            os.close(fileno)
+        self.workBlocks[newblock.BlockNumber] = raidsource
         # key_alias = 'master'
         # if self.keyID:
         #     key_alias = packetid.KeyAlias(self.keyID)
@@ -375,14 +443,14 @@ class backup(automat.Automat):
         customer_dir = self.customerGlobalID  # global_id.MakeGlobalID(customer=self.customerGlobalID, key_alias=key_alias)
         outputpath = os.path.join(
             settings.getLocalBackupsDir(), customer_dir, self.pathID, self.version)
-        task_params = (filename, self.eccmap.name, self.version, newblock.BlockNumber, outputpath)
-        raid_worker.add_task('make', task_params,
+        task_params = (raidsource, self.eccmap.name, self.version, newblock.BlockNumber, outputpath)
+        raid_worker.add_task(raid_cmd, task_params,
                              lambda cmd, params, result: self._raidmakeCallback(params, result, dt),)
         self.automat('block-raid-started', newblock)
         del serializedblock
         if _Debug:
             lg.out(_DebugLevel, 'backup.doBlockPushAndRaid %s : start process data from %s to %s, %d' % (
-                newblock.BlockNumber, filename, outputpath, id(self.terminating)))
+                newblock.BlockNumber, 'memory' if self.raidPipeline else raidsource, outputpath, id(self.terminating)))
 
     def doPopBlock(self, arg):
         """
@@ -390,7 +458,8 @@ class backup(automat.Automat):
         """
         blockNumber, _ = arg
         filename = self.workBlocks.pop(blockNumber)
-        tmpfile.throw_out(filename, 'block raid done')
+        if not self.raidPipeline:
+            tmpfile.throw_out(filename, 'block raid done')
 
     def doFirstBlock(self, arg):
         """
@@ -399,6 +468,8 @@ class backup(automat.Automat):
         self.dataSent = 0
         self.blocksSent = 0
         self.blockNumber = 0
+        self.nextRaidBlockNumber = 0
+        self.encryptingBlocks.clear()
         self.currentBlockSize = 0
         self.currentBlockData = cStringIO.StringIO()
 
@@ -410,8 +481,10 @@ class backup(automat.Automat):
         self.blocksSent += 1
         self.blockNumber += 1
         self.currentBlockData.close()
-        self.currentBlockSize = 0
+        self.currentBlockSize = len(self.dedupTail)
         self.currentBlockData = cStringIO.StringIO()
+        self.currentBlockData.write(self.dedupTail)
+        self.dedupTail = ''
 
     def doBlockReport(self, arg):
         """
@@ -424,13 +497,23 @@ class backup(automat.Automat):
         """
         """
         self.closed = True
-        for filename in self.workBlocks.values():
-            tmpfile.throw_out(filename, 'backup aborted')
+        self.encryptingBlocks.clear()
+        if not self.raidPipeline:
+            for filename in self.workBlocks.values():
+                tmpfile.throw_out(filename, 'backup aborted')
 
     def doReport(self, arg):
         """
         """
-        if self.ask4abort:
+        aborted = self.ask4abort
+        if self.dedup:
+            # references must be known before older versions are cleaned up
+            if aborted:
+                dedup_index.version_aborted(self.backupID)
+            elif not dedup_index.version_done(self.backupID, self.dedupBlocks, self.dedupSources):
+                lg.warn('%s refers to blocks which are not stored anymore, ABORTING' % self.backupID)
+                aborted = True
+        if aborted:
             if self.finishCallback:
                 self.finishCallback(self.backupID, 'abort')
             events.send('backup-aborted', dict(backup_id=self.backupID))
@@ -457,8 +540,12 @@ class backup(automat.Automat):
             lg.out(_DebugLevel, 'backup.abort id %s, %d' % (str(self.backupID), id(self.ask4abort)))
         self.terminating = True
         for blockNumber, filename in self.workBlocks.items():
-            lg.warn('aborting raid make worker for block %d in %s' % (blockNumber, filename))
-            raid_worker.cancel_task('make', filename)
+            if self.raidPipeline:
+                lg.warn('aborting raid make worker for block %d' % blockNumber)
+                raid_worker.cancel_task('make-data', filename)
+            else:
+                lg.warn('aborting raid make worker for block %d in %s' % (blockNumber, filename))
+                raid_worker.cancel_task('make', filename)
         lg.warn('killing backup pipe')
         self._kill_pipe()
 
@@ -470,6 +557,22 @@ class backup(automat.Automat):
         percent = min(100.0, 100.0 * self.dataSent / self.totalSize)
         return percent
 
+    def _on_block_encrypted(self, blockNumber, block, dedup_info=None):
+        if self.closed:
+            return
+        if dedup_info is not None:
+            digest, length, source = dedup_info
+            if source is None:
+                self.dedupBlocks.append((digest, blockNumber, length, ))
+            else:
+                self.dedupSources.add(source[0])
+        self.encryptingBlocks[blockNumber] = block
+        # blocks can be encrypted in any order, but must go to raid worker one by one
+        while self.encryptingBlocks.get(self.nextRaidBlockNumber) is not None:
+            newblock = self.encryptingBlocks.pop(self.nextRaidBlockNumber)
+            self.nextRaidBlockNumber += 1
+            self.automat('block-encrypted', newblock)
+
     def _raidmakeCallback(self, params, result, dt):
         filename, eccmapname, backupID, blockNumber, targetDir = params
         if result is None:
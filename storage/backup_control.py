@@ -84,8 +84,12 @@ from services import driver
 
 from storage import backup_fs
 from storage import backup_matrix
+from storage import local_manifest
+from storage import dedup_index
+from storage import index_journal
 from storage import backup_tar
 from storage import backup
+from storage import compression
 
 #------------------------------------------------------------------------------
 
@@ -98,6 +102,7 @@ _RevisionNumber = 0
 _LoadingFlag = False
 _TaskStartedCallbacks = {}
 _TaskFinishedCallbacks = {}
+_PendingIndexJournal = None
 
 #------------------------------------------------------------------------------
 
@@ -133,7 +138,7 @@ def commit(new_revision_number=None):
     This increase revision number by 1 or set ``new_revision_number``.
     """
     global _RevisionNumber
-    if new_revision_number:
+    if new_revision_number is not None:
         _RevisionNumber = new_revision_number
     else:
         _RevisionNumber += 1
@@ -149,6 +154,7 @@ def init():
     """
     lg.out(4, 'backup_control.init')
     Load()
+    dedup_index.init()
 
 
 def shutdown():
@@ -156,6 +162,8 @@ def shutdown():
     Called for the correct completion of all things.
     """
     lg.out(4, 'backup_control.shutdown')
+    dedup_index.shutdown()
+    index_journal.shutdown()
 
 #------------------------------------------------------------------------------
 
@@ -163,12 +171,15 @@ def shutdown():
 def WriteIndex(filepath=None, encoding='utf-8'):
     """
     Write index data base to the local file .bitdust/metadata/index.
+
+    This is a snapshot of the whole index, so the index journal is cleaned after that.
     """
     global _LoadingFlag
     if _LoadingFlag:
         return
     if filepath is None:
         filepath = settings.BackupIndexFilePath()
+    is_snapshot = (filepath == settings.BackupIndexFilePath())
     json_data = {}
     # json_data = backup_fs.Serialize(to_json=True, encoding=encoding)
     for customer_idurl in backup_fs.known_customers():
@@ -183,7 +194,11 @@ def WriteIndex(filepath=None, encoding='utf-8'):
     if _Debug:
         import pprint
         lg.out(_DebugLevel, pprint.pformat(json_data))
-    return bpio.AtomicWriteFile(filepath, src)
+    if not bpio.AtomicWriteFile(filepath, src):
+        return False
+    if is_snapshot:
+        index_journal.reset(revision())
+    return True
 
 
 def ReadIndex(raw_data, encoding='utf-8'):
@@ -239,6 +254,8 @@ def ReadIndex(raw_data, encoding='utf-8'):
 def Load(filepath=None):
     """
     This load the data from local file and call ``ReadIndex()`` method.
+
+    Changes written to the index journal after that snapshot are applied on top.
     """
     global _LoadingFlag
     if _LoadingFlag:
@@ -264,8 +281,16 @@ def Load(filepath=None):
     ret = ReadIndex(raw_data)
     if ret:
         commit(known_revision)
+        records, complete = index_journal.read()
+        applied = _ApplyIndexJournal(records)
         backup_fs.Scan()
         backup_fs.Calculate()
+        if not complete or applied < len([r for r in records if r[0] > known_revision]):
+            # journal is damaged, start a new one from a fresh snapshot
+            lg.warn('index journal was not fully applied, writing a new snapshot')
+            WriteIndex()
+        else:
+            index_journal.loaded(known_revision)
     else:
         lg.warn('catalog index reading failed')
     return ret
@@ -273,14 +298,19 @@ def Load(filepath=None):
 
 def Save(filepath=None):
     """
-    Save index data base to local file ( call ``WriteIndex()`` ) and notify
-    "index_synchronizer()" state machine.
+    Save index data base to local file and notify "index_synchronizer()" state machine.
+
+    Only changed items are appended to the index journal, a full snapshot
+    is written with ``WriteIndex()`` when journal becomes too big.
     """
     global _LoadingFlag
     if _LoadingFlag:
         return False
     commit()
-    WriteIndex(filepath)
+    if filepath is not None or index_journal.need_snapshot():
+        WriteIndex(filepath)
+    elif not index_journal.write(revision(), index_journal.make_delta()):
+        WriteIndex()
     if driver.is_on('service_backup_db'):
         from storage import index_synchronizer
         index_synchronizer.A('push')
@@ -348,14 +378,11 @@ def IncomingSupplierBackupIndex(newpacket):
 
     The index is also stored on suppliers to be able to restore it.
     """
-    b = encrypted.Unserialize(newpacket.Payload)
-    if b is None:
-        lg.out(2, 'backup_control.IncomingSupplierBackupIndex ERROR reading data from %s' % newpacket.RemoteID)
+    padded_data = _DecryptIndexPacket(newpacket)
+    if padded_data is None:
         return
     try:
-        session_key = key.DecryptLocalPrivateKey(b.EncryptedSessionKey)
-        padded_data = key.DecryptWithSessionKey(session_key, b.EncryptedData)
-        inpt = cStringIO.StringIO(padded_data[:int(b.Length)])
+        inpt = cStringIO.StringIO(padded_data)
         supplier_revision = inpt.readline().rstrip('\n')
         if supplier_revision:
             supplier_revision = int(supplier_revision)
@@ -389,9 +416,122 @@ def IncomingSupplierBackupIndex(newpacket):
         control.request_update()
         lg.out(4, 'backup_control.IncomingSupplierBackupIndex updated to revision %d from %s' % (
             revision(), newpacket.RemoteID))
+        _ApplyPendingIndexJournal()
     else:
         lg.warn('failed to read catalog index from supplier')
 
+
+def IncomingSupplierBackupIndexJournal(newpacket):
+    """
+    Called by ``index_synchronizer()`` when a remote copy of our index journal
+    is received from one of our suppliers.
+
+    Only changes made after the local revision are applied. If local index is
+    older than the snapshot this journal continues - it must wait for the snapshot.
+    """
+    global _PendingIndexJournal
+    raw_data = _DecryptIndexPacket(newpacket)
+    if raw_data is None:
+        return
+    try:
+        snapshot_revision, records, _ = index_journal.unpack(raw_data)
+    except:
+        lg.out(2, 'backup_control.IncomingSupplierBackupIndexJournal ERROR reading data from %s' % newpacket.RemoteID)
+        lg.exc()
+        return
+    supplier_revision = records[-1][0] if records else snapshot_revision
+    if driver.is_on('service_backup_db'):
+        from storage import index_synchronizer
+        index_synchronizer.A('index-file-received', (newpacket, supplier_revision))
+    if revision() >= supplier_revision:
+        lg.out(4, 'backup_control.IncomingSupplierBackupIndexJournal SKIP, supplier %s revision=%d, local revision=%d' % (
+            newpacket.RemoteID, supplier_revision, revision(), ))
+        return
+    if not records:
+        return
+    if revision() < snapshot_revision:
+        if _PendingIndexJournal is None or _PendingIndexJournal[2][-1][0] < supplier_revision:
+            _PendingIndexJournal = (newpacket.RemoteID, snapshot_revision, records, )
+        lg.out(4, 'backup_control.IncomingSupplierBackupIndexJournal WAIT for snapshot %d from %s, local revision=%d' % (
+            snapshot_revision, newpacket.RemoteID, revision(), ))
+        return
+    _ApplySupplierIndexJournal(records, newpacket.RemoteID)
+
+
+def _DecryptIndexPacket(newpacket):
+    """
+    Return data of the index file or the index journal stored on supplier.
+    """
+    b = encrypted.Unserialize(newpacket.Payload)
+    if b is None:
+        lg.out(2, 'backup_control._DecryptIndexPacket ERROR reading data from %s' % newpacket.RemoteID)
+        return None
+    try:
+        session_key = key.DecryptLocalPrivateKey(b.EncryptedSessionKey)
+        padded_data = key.DecryptWithSessionKey(session_key, b.EncryptedData)
+    except:
+        lg.out(2, 'backup_control._DecryptIndexPacket ERROR decrypting data from %s' % newpacket.RemoteID)
+        lg.exc()
+        return None
+    return padded_data[:int(b.Length)]
+
+
+def _ApplyIndexJournal(records):
+    """
+    Apply journal records which follows current revision one by one,
+    returns number of applied records.
+    """
+    count = 0
+    for journal_revision, delta in records:
+        if journal_revision <= revision():
+            continue
+        if journal_revision != revision() + 1:
+            lg.warn('index journal revision %d does not follow current revision %d' % (journal_revision, revision()))
+            break
+        try:
+            index_journal.apply_delta(delta)
+        except:
+            lg.exc()
+            break
+        commit(journal_revision)
+        count += 1
+    return count
+
+
+def _ApplySupplierIndexJournal(records, supplier_idurl):
+    """
+    Apply changes received from supplier and write them into the local journal.
+    """
+    known_revision = revision()
+    count = _ApplyIndexJournal(records)
+    if not count:
+        lg.warn('failed to apply index journal from supplier')
+        return False
+    for journal_revision, delta in records:
+        if known_revision < journal_revision <= revision():
+            index_journal.write(journal_revision, delta)
+    backup_fs.Scan()
+    backup_fs.Calculate()
+    if index_journal.need_snapshot():
+        WriteIndex()
+    control.request_update()
+    lg.out(4, 'backup_control._ApplySupplierIndexJournal updated to revision %d with %d changes from %s' % (
+        revision(), count, supplier_idurl))
+    return True
+
+
+def _ApplyPendingIndexJournal():
+    global _PendingIndexJournal
+    if _PendingIndexJournal is None:
+        return False
+    supplier_idurl, snapshot_revision, records = _PendingIndexJournal
+    if revision() < snapshot_revision:
+        return False
+    _PendingIndexJournal = None
+    if revision() >= records[-1][0]:
+        return False
+    return _ApplySupplierIndexJournal(records, supplier_idurl)
+
 #------------------------------------------------------------------------------
 
 
@@ -403,6 +543,8 @@ def DeleteAllBackups():
     all_ids = set(backup_fs.ListAllBackupIDs())
     all_ids.update(backup_matrix.GetBackupIDs(remote=True, local=True))
     lg.out(4, 'backup_control.DeleteAllBackups %d ID\'s to kill' % len(all_ids))
+    # all versions are going to be removed, no need to protect referenced ones
+    dedup_index.clear()
     # delete one by one
     for backupID in all_ids:
         DeleteBackup(backupID, saveDB=False, calculate=False)
@@ -425,7 +567,8 @@ def DeleteBackup(backupID, removeLocalFilesToo=True, saveDB=True, calculate=True
     3) remove interests in transport_control, see ``lib.transport_control.DeleteBackupInterest()``
     4) remove that ID from the index data base
     5) remove local files for this backup ID
-    6) remove all remote info for this backup from the memory, see ``p2p.backup_matrix.EraseBackupRemoteInfo()``
+    6) remove all remote info for this backup from the memory, see ``p2p.backup_matrix.EraseBackupRemoteInfo()``,
+       if newer versions are referring to that one its remote data is kept, see ``storage.dedup_index.retire()``
     7) also remove local info from memory, see ``p2p.backup_matrix.EraseBackupLocalInfo()``
     8) stop any rebuilding, we will restart it soon
     9) check and calculate used space
@@ -448,11 +591,14 @@ def DeleteBackup(backupID, removeLocalFilesToo=True, saveDB=True, calculate=True
     # mark it as being deleted in the db, well... just remove it from the index now
     if not backup_fs.DeleteBackupID(backupID):
         return False
+    remoteDataNotNeeded = _ForgetDedupVersion(backupID)
     # finally remove local files for this backupID
     if removeLocalFilesToo:
         backup_fs.DeleteLocalBackup(settings.getLocalBackupsDir(), backupID)
+        local_manifest.backup_removed(backupID)
     # remove all remote info for this backup from the memory
-    backup_matrix.EraseBackupRemoteInfo(backupID)
+    if remoteDataNotNeeded:
+        backup_matrix.EraseBackupRemoteInfo(backupID)
     # also remove local info
     backup_matrix.EraseBackupLocalInfo(backupID)
     # stop any rebuilding, we will restart it soon
@@ -499,12 +645,14 @@ def DeletePathBackups(pathID, removeLocalFilesToo=True, saveDB=True, calculate=T
         # remove local files for this backupID
         if removeLocalFilesToo:
             backup_fs.DeleteLocalBackup(settings.getLocalBackupsDir(), backupID)
-        # remove remote info for this backup from the memory
-        backup_matrix.EraseBackupRemoteInfo(backupID)
+            local_manifest.backup_removed(backupID)
         # also remove local info
         backup_matrix.EraseBackupLocalInfo(backupID)
         # finally remove this backup from the index
         item.delete_version(version)
+        # remove remote info for this backup from the memory
+        if _ForgetDedupVersion(backupID):
+            backup_matrix.EraseBackupRemoteInfo(backupID)
         # lg.out(8, 'backup_control.DeletePathBackups ' + backupID)
     # stop any rebuilding, we will restart it soon
     backup_rebuilder.RemoveAllBackupsToWork()
@@ -519,6 +667,28 @@ def DeletePathBackups(pathID, removeLocalFilesToo=True, saveDB=True, calculate=T
         control.request_update()
     return True
 
+
+def _ForgetDedupVersion(backupID):
+    """
+    Must be called after the version was removed from the catalog.
+
+    If newer versions are referring to blocks of that version it is only
+    retired in ``storage.dedup_index`` - data stays on suppliers and is used during restore.
+    Otherwise version is removed from the index and retired versions which are not
+    needed anymore are released: their remote info is erased here and suppliers
+    will be asked to remove the data after next "ListFiles" from them.
+
+    Returns False if remote data of that version must be kept.
+    """
+    if dedup_index.is_referenced(backupID):
+        lg.out(8, 'backup_control._ForgetDedupVersion %s is referenced by newer versions, retired' % backupID)
+        dedup_index.retire(backupID)
+        return False
+    for releasedBackupID in dedup_index.version_removed(backupID):
+        lg.out(8, 'backup_control._ForgetDedupVersion %s is not referenced anymore, released' % releasedBackupID)
+        backup_matrix.EraseBackupRemoteInfo(releasedBackupID)
+    return True
+
 #------------------------------------------------------------------------------
 
 
@@ -693,12 +863,21 @@ class Task():
             # self._on_job_failed(self.backupID)
             err = 'failed creating destination folder for "%s"' % self.backupID
             return OnTaskFailed(self.backupID, err)
-        compress_mode = 'bz2'  # 'none' # 'gz'
+        compress_mode = settings.getBackupsCompression()
+        if not compression.is_available(compress_mode):
+            lg.warn('compression mode %r is not available, will use "bz2"' % compress_mode)
+            compress_mode = 'bz2'
+        if settings.getBackupsDedupEnabled() and not compression.is_file_mode(compress_mode):
+            # compressed stream is changed completely after any change in the source
+            compress_mode = 'none'
+        compress_threads = settings.getBackupsCompressionThreads()
         arcname = os.path.basename(sourcePath)
         if bpio.pathIsDir(self.localPath):
-            backupPipe = backup_tar.backuptardir(self.localPath, arcname=arcname, compress=compress_mode)
+            backupPipe = backup_tar.backuptardir(
+                self.localPath, arcname=arcname, compress=compress_mode, threads=compress_threads)
         else:
-            backupPipe = backup_tar.backuptarfile(self.localPath, arcname=arcname, compress=compress_mode)
+            backupPipe = backup_tar.backuptarfile(
+                self.localPath, arcname=arcname, compress=compress_mode, threads=compress_threads)
         backupPipe.make_nonblocking()
         job = backup.backup(
             self.backupID,
@@ -861,13 +1040,16 @@ def OnJobDone(backupID, result):
                 versions = item.list_versions(sorted=True, reverse=True)
                 if len(versions) > maxBackupsNum:
                     for version in versions[maxBackupsNum:]:
-                        item.delete_version(version)
                         backupID = packetid.MakeBackupID(customerGlobalID, remotePath, version)
+                        item.delete_version(version)
+                        if _ForgetDedupVersion(backupID):
+                            backup_matrix.EraseBackupRemoteInfo(backupID)
                         backup_rebuilder.RemoveBackupToWork(backupID)
                         io_throttle.DeleteBackupRequests(backupID)
                         io_throttle.DeleteBackupSendings(backupID)
                         # callback.delete_backup_interest(backupID)
                         backup_fs.DeleteLocalBackup(settings.getLocalBackupsDir(), backupID)
+                        local_manifest.backup_removed(backupID)
                         backup_matrix.EraseBackupLocalInfo(backupID)
                         backup_matrix.EraseBackupLocalInfo(backupID)
         backup_fs.ScanID(remotePath)
@@ -107,6 +107,12 @@ _SizeFiles = 0
 _SizeFolders = 0
 _SizeBackups = 0
 
+# path ID -> list of items changed since last call to ``PopChanges()``
+_ChangedItems = {}
+# customer IDURL -> set of path IDs removed since last call to ``PopChanges()``
+_RemovedIDs = {}
+_TrackChanges = True
+
 #------------------------------------------------------------------------------
 
 
@@ -264,7 +270,9 @@ class FSItemInfo():
         return self.size != -1
 
     def set_size(self, sz):
-        self.size = sz
+        if self.size != sz:
+            self.size = sz
+            _ItemChanged(self)
 
     def read_stats(self, path):
         if not bpio.pathExist(path):
@@ -279,7 +287,7 @@ class FSItemInfo():
             except:
                 lg.exc()
                 return False
-        self.size = long(s.st_size)
+        self.set_size(long(s.st_size))
         return True
 
     def read_versions(self, local_path):
@@ -329,9 +337,12 @@ class FSItemInfo():
 
     def add_version(self, version):
         self.versions[version] = [-1, -1]
+        _ItemChanged(self)
 
     def set_version_info(self, version, maxblocknum, sizebytes):
-        self.versions[version] = [maxblocknum, sizebytes]
+        if self.versions.get(version) != [maxblocknum, sizebytes]:
+            self.versions[version] = [maxblocknum, sizebytes]
+            _ItemChanged(self)
 
     def get_version_info(self, version):
         return self.versions.get(version, [-1, -1])
@@ -340,7 +351,8 @@ class FSItemInfo():
         return self.versions.get(version, [-1, -1])[1]
 
     def delete_version(self, version):
-        self.versions.pop(version, None)
+        if self.versions.pop(version, None) is not None:
+            _ItemChanged(self)
 
     def has_version(self, version):
         return version in self.versions
@@ -514,6 +526,7 @@ def AddFile(path, read_stats=False, iter=None, iterID=None, key_id=None):
             iter[ii.name()] = {0: id}
             # also save index from opposite side
             iterID[id] = {INFO_KEY: ii}
+            _ItemChanged(ii)
         else:
             # get an existing ID from the index
             id = iter[name][0]
@@ -534,6 +547,7 @@ def AddFile(path, read_stats=False, iter=None, iterID=None, key_id=None):
         ii.read_stats(path)
     iter[ii.name()] = id
     iterID[id] = ii
+    _ItemChanged(ii)
     # finally make a complete backup id - this a relative path to the backed up file
     return resultID, iter, iterID
 
@@ -578,6 +592,7 @@ def AddDir(path, read_stats=False, iter=None, iterID=None, key_id=None):
                 ii.read_stats(p)
             iter[ii.name()] = {0: id}
             iterID[id] = {INFO_KEY: ii}
+            _ItemChanged(ii)
         else:
             id = iter[name][0]
             resultID += '/' + str(id)
@@ -587,7 +602,8 @@ def AddDir(path, read_stats=False, iter=None, iterID=None, key_id=None):
         if i == len(parts) - 1:
             if iterID[INFO_KEY].type != DIR:
                 lg.warn('not a dir: %s' % iterID[INFO_KEY])
-            iterID[INFO_KEY].type = DIR
+                iterID[INFO_KEY].type = DIR
+                _ItemChanged(iterID[INFO_KEY])
     return resultID.lstrip('/'), iter, iterID
 
 
@@ -636,6 +652,7 @@ def AddLocalPath(localpath, read_stats=False, iter=None, iterID=None, key_id=Non
                     if read_stats:
                         ii.read_stats(p)
                     iterID[id] = {INFO_KEY: ii}
+                    _ItemChanged(ii)
                     lastID = id
                 else:
                     id = iter[name][0]
@@ -647,6 +664,7 @@ def AddLocalPath(localpath, read_stats=False, iter=None, iterID=None, key_id=Non
                     ii.read_stats(p)
                 iter[ii.name()] = id
                 iterID[id] = ii
+                _ItemChanged(ii)
                 c += 1
                 lastID = id
         return c
@@ -682,6 +700,7 @@ def PutItem(name, parent_path_id, as_folder=False, iter=None, iterID=None, key_i
     ii = FSItemInfo(name=remote_path, path_id=resultID, typ=typ, key_id=key_id)
     iter[ii.name()] = newItemID
     iterID[newItemID] = ii
+    _ItemChanged(ii)
     return resultID, iter, iterID
 
 #------------------------------------------------------------------------------
@@ -706,6 +725,7 @@ def SetFile(item, iter=None, iterID=None):
             if item.name() not in iter:
                 iter[item.name()] = id
                 iterID[id] = item
+                _ItemChanged(item)
             return True
         found = False
         for name in iter.keys():
@@ -743,6 +763,7 @@ def SetDir(item, iter=None, iterID=None):
             if id not in iterID:
                 iterID[id] = {}
             iterID[id][INFO_KEY] = item
+            _ItemChanged(item)
             return True
         found = False
         for name in iter.keys():
@@ -769,6 +790,61 @@ def SetDir(item, iter=None, iterID=None):
             return False
     return False
 
+
+def ReplaceItem(item, iter=None, iterID=None):
+    """
+    Put FSItemInfo ``item`` into the index, an item with same path ID is
+    replaced: this can be a renamed file or folder, folder keeps all its childs.
+
+    This is used when applying changes from the index journal.
+    """
+    if iter is None:
+        iter = fs()
+    if iterID is None:
+        iterID = fsID()
+    root_iter = iter
+    root_iterID = iterID
+    parts = item.path_id.lstrip('/').split('/')
+    for j in range(len(parts)):
+        part = parts[j]
+        id = misc.ToInt(part, part)
+        if id not in iterID:
+            break
+        existing = iterID[id]
+        if isinstance(existing, dict):
+            if INFO_KEY not in existing:
+                raise Exception('Error, directory info missed in the index')
+            name = existing[INFO_KEY].name()
+        elif isinstance(existing, FSItemInfo):
+            name = existing.name()
+        else:
+            raise Exception('Wrong data type in the index')
+        if j < len(parts) - 1:
+            if not isinstance(existing, dict):
+                return False
+            iter = iter[name]
+            iterID = existing
+            continue
+        if isinstance(existing, dict) and item.type == DIR:
+            iter[item.name()] = iter.pop(name)
+            existing[INFO_KEY] = item
+            _ItemChanged(item)
+            return True
+        if isinstance(existing, FSItemInfo) and item.type == FILE:
+            iter.pop(name)
+            iter[item.name()] = id
+            iterID[id] = item
+            _ItemChanged(item)
+            return True
+        # type of the item was changed, remove it and put again
+        _ItemsRemoved(existing, root_iterID)
+        iter.pop(name)
+        iterID.pop(id)
+        break
+    if item.type == DIR:
+        return SetDir(item, iter=root_iter, iterID=root_iterID)
+    return SetFile(item, iter=root_iter, iterID=root_iterID)
+
 #------------------------------------------------------------------------------
 
 
@@ -867,6 +943,7 @@ def DeleteByID(pathID, iter=None, iterID=None):
         iter = fs()
     if iterID is None:
         iterID = fsID()
+    root_iterID = iterID
     path = ''
     parts = pathID.strip('/').split('/')
     for j in range(len(parts)):
@@ -892,7 +969,7 @@ def DeleteByID(pathID, iter=None, iterID=None):
         if name not in iter:
             raise Exception('Can not found target name in the index')
         if j == len(parts) - 1:
-            iterID.pop(id)
+            _ItemsRemoved(iterID.pop(id), root_iterID)
             iter.pop(name)
             return path
         iterID = iterID[id]
@@ -908,13 +985,14 @@ def DeleteByPath(path, iter=None, iterID=None):
         iter = fs()
     if iterID is None:
         iterID = fsID()
+    root_iterID = iterID
     path_id = ''
     ppath = bpio.remotePath(path)
     parts = ppath.lstrip('/').split('/')
     if ppath in iter:
         path_id = iter[ppath]
         iter.pop(ppath)
-        iterID.pop(path_id)
+        _ItemsRemoved(iterID.pop(path_id), root_iterID)
         return str(path_id)
     for j in range(len(parts)):
         name = parts[j]  # .encode('utf-8') # parts[j]
@@ -936,7 +1014,7 @@ def DeleteByPath(path, iter=None, iterID=None):
             raise Exception('Can not found target ID in the index')
         if j == len(parts) - 1:
             iter.pop(name)
-            iterID.pop(id)
+            _ItemsRemoved(iterID.pop(id), root_iterID)
             return path_id.lstrip('/')
         iter = iter[name]
         iterID = iterID[id]
@@ -1977,7 +2055,7 @@ def Calculate(iterID=None):
             else:
                 raise Exception('Error, wrong item type in the index')
         if INFO_KEY in i:
-            i[INFO_KEY].size = folder_size
+            i[INFO_KEY].set_size(folder_size)
             if i[INFO_KEY].type == FILE:
                 _FilesCount += 1
                 if i[INFO_KEY].exist():
@@ -2010,9 +2088,92 @@ def Clear(customer_idurl=None):
     """
     Erase all items in the index.
     """
+    _ItemsRemoved(fsID(customer_idurl=customer_idurl), fsID(customer_idurl=customer_idurl))
     fs(customer_idurl=customer_idurl).clear()
     fsID(customer_idurl=customer_idurl).clear()
 
+#------------------------------------------------------------------------------
+
+
+def TrackChanges(flag):
+    """
+    Changes of the index are not tracked while ``flag`` is False,
+    this is used when changes are coming from the index journal itself.
+    """
+    global _TrackChanges
+    _TrackChanges = flag
+
+
+def PopChanges():
+    """
+    Return changes made in the index since previous call and start tracking from scratch.
+
+    Result is a dictionary {customer IDURL: (list of changed items, set of removed path IDs)},
+    changed items which are not in the index anymore are skipped.
+    Folder which was removed and created again with same ID is reported in both lists.
+    """
+    result = {}
+    for customer_idurl in set(known_customers() + _RemovedIDs.keys()):
+        changed = []
+        iterID = _FileSystemIndexByID.get(customer_idurl)
+        if iterID is not None:
+            for path_id, items in _ChangedItems.items():
+                iter_and_path = WalkByID(path_id, iterID=iterID)
+                if iter_and_path is None:
+                    continue
+                info = iter_and_path[0]
+                if isinstance(info, dict):
+                    info = info.get(INFO_KEY)
+                for item in items:
+                    if item is info:
+                        changed.append(info)
+                        break
+        removed = _RemovedIDs.get(customer_idurl, set())
+        if changed or removed:
+            result[customer_idurl] = (changed, removed, )
+    ForgetChanges()
+    return result
+
+
+def ForgetChanges():
+    """
+    Current state of the index is already stored, start tracking changes from scratch.
+    """
+    _ChangedItems.clear()
+    _RemovedIDs.clear()
+
+
+def _ItemChanged(info):
+    if not _TrackChanges:
+        return
+    items = _ChangedItems.setdefault(info.path_id, [])
+    for item in items:
+        if item is info:
+            return
+    items.append(info)
+
+
+def _ItemsRemoved(node, rootIterID):
+    """
+    Remember path IDs of the item and all its childs, ``node`` is already or going
+    to be removed from the tree ``rootIterID``.
+    """
+    if not _TrackChanges:
+        return
+    customer_idurl = None
+    for idurl, iterID in _FileSystemIndexByID.items():
+        if iterID is rootIterID:
+            customer_idurl = idurl
+            break
+    if customer_idurl is None:
+        return
+    removed = _RemovedIDs.setdefault(customer_idurl, set())
+
+    def visitor(path_id, path, info):
+        removed.add(info.path_id)
+
+    TraverseByID(visitor, iterID=node)
+
 
 def Serialize(iterID=None, to_json=False, encoding='utf-8', filter_cb=None):
     """
@@ -83,6 +83,8 @@ from contacts import contactsdb
 from services import driver
 
 from storage import backup_fs
+from storage import local_manifest
+from storage import dedup_index
 
 from userid import my_id
 from userid import global_id
@@ -110,13 +112,18 @@ def init():
     Call this method before all others here. Prepare several things here:
 
     * start a loop to repaint the GUI when needed
-    * scan local files and build the "local" matrix
+    * read manifest of local files and build the "local" matrix
     * read latest (stored on local disk) ListFiles for suppliers to build "remote" matrix
+    * start verification of local files in background
     """
     lg.out(4, 'backup_matrix.init')
     RepaintingProcess(True)
+    local_manifest.init()
     ReadLocalFiles()
     ReadLatestRawListFiles()
+    d = local_manifest.verify()
+    if d:
+        d.addCallback(_on_local_manifest_verified)
 
 
 def shutdown():
@@ -125,6 +132,14 @@ def shutdown():
     """
     lg.out(4, 'backup_matrix.shutdown')
     RepaintingProcess(False)
+    local_manifest.shutdown()
+
+
+def _on_local_manifest_verified(changes):
+    if changes:
+        lg.warn('%d local files were not listed correctly in the manifest, re-building "local" matrix' % changes)
+        ReadLocalFiles()
+    return changes
 
 #------------------------------------------------------------------------------
 
@@ -138,8 +153,8 @@ def remote_files():
       0  : no info comes yet
       1  : this file exist on given remote machine
 
-    This is a dictionary of dictionaries of dictionaries of lists. :-)))
-    Values can be accessed this way::
+    This is a dictionary of ``BlocksMatrix`` objects, one for every backup.
+    Values can be read this way::
 
       remote_files()[backupID][blockNumber][dataORparity][supplierNumber]
 
@@ -149,6 +164,9 @@ def remote_files():
     - blockNumber - a number of block started from 0, look at ``p2p.backup``
     - dataORparity - can be 'D' for Data packet or 'P' for Parity packets
     - supplierNumber - who should keep that piece?
+
+    The rows are built on request, so to change the matrix use methods
+    of ``BlocksMatrix`` or functions of this module.
     """
     global _RemoteFiles
     return _RemoteFiles
@@ -195,6 +213,267 @@ def local_backup_size():
 #------------------------------------------------------------------------------
 
 
+def _bits_mask(count):
+    """
+    Bit set with first ``count`` bits switched on.
+    """
+    if count <= 0:
+        return 0
+    return (1 << count) - 1
+
+
+def _bits_count(bits):
+    """
+    Number of bits switched on.
+    """
+    return bin(bits).count('1')
+
+
+def _bits_lowest(bits):
+    """
+    Position of the lowest bit switched on, or -1 for empty bit set.
+    """
+    if not bits:
+        return -1
+    return (bits & -bits).bit_length() - 1
+
+
+def _bits_highest(bits):
+    """
+    Position of the highest bit switched on, or -1 for empty bit set.
+    """
+    return bits.bit_length() - 1
+
+
+def _bits_list(bits):
+    """
+    Return sorted list of positions of all bits switched on.
+    """
+    result = []
+    if not bits:
+        return result
+    reverse_digits = bin(bits)[:1:-1]
+    pos = reverse_digits.find('1')
+    while pos >= 0:
+        result.append(pos)
+        pos = reverse_digits.find('1', pos + 1)
+    return result
+
+
+def _bits_counters(columns):
+    """
+    Sum up bit sets "vertically": for every bit position count how many of
+    given bit sets have that bit switched on.
+
+    The result is a list of bit slices, ``counters[i]`` keeps bit number
+    ``i`` of every counter, so all positions are counted at once.
+    """
+    counters = []
+    for column in columns:
+        carry = column
+        for i in xrange(len(counters)):
+            if not carry:
+                break
+            counters[i], carry = counters[i] ^ carry, counters[i] & carry
+        if carry:
+            counters.append(carry)
+    return counters
+
+
+def _bits_equal(counters, value, mask):
+    """
+    Return bit set of positions inside ``mask`` where counter is equal to ``value``.
+    """
+    if value >> len(counters):
+        return 0
+    result = mask
+    for i, counter in enumerate(counters):
+        if (value >> i) & 1:
+            result &= counter
+        else:
+            result &= ~counter
+        if not result:
+            break
+    return result
+
+
+def _bits_weakest(columns, mask, limit):
+    """
+    Find a position inside ``mask`` which is present in a fewer number of
+    given bit sets, but only if that number is less than ``limit``.
+
+    Return a tuple (position, counter) or (-1, limit) if all positions are
+    present in ``limit`` or more bit sets.
+    """
+    counters = _bits_counters(columns)
+    for value in xrange(limit):
+        found = _bits_equal(counters, value, mask)
+        if found:
+            return _bits_lowest(found), value
+    return -1, limit
+
+
+class BlocksMatrix(object):
+    """
+    Keeps info about all pieces of a single backup in a compact form.
+
+    For every supplier and every "surface" two bit sets (Python integers) are
+    stored, bit number N corresponds to the block number N::
+
+      exist[dataORparity][supplierNumber] - pieces marked with 1
+      missing[dataORparity][supplierNumber] - pieces marked with -1
+
+    All other pieces have value 0 - no info yet. Known block numbers are
+    stored in ``blocks`` bit set. This way whole columns are checked with a
+    single bitwise operation instead of walking all the blocks one by one.
+
+    Old style access still works, but returns a copy of the row::
+
+      matrix[blockNumber][dataORparity][supplierNumber]
+    """
+
+    def __init__(self, suppliers_number):
+        self.suppliers = 0
+        self.blocks = 0
+        self.exist = {'D': [], 'P': [], }
+        self.missing = {'D': [], 'P': [], }
+        self.extend(suppliers_number)
+
+    def __repr__(self):
+        return 'BlocksMatrix(%d blocks, %d suppliers)' % (len(self), self.suppliers)
+
+    def __contains__(self, blockNum):
+        if blockNum < 0:
+            return False
+        return bool((self.blocks >> blockNum) & 1)
+
+    def __len__(self):
+        return _bits_count(self.blocks)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, blockNum):
+        if blockNum not in self:
+            raise KeyError(blockNum)
+        return self.row(blockNum)
+
+    def keys(self):
+        return _bits_list(self.blocks)
+
+    def extend(self, suppliers_number):
+        """
+        Make sure there is a column for every supplier.
+        """
+        while self.suppliers < suppliers_number:
+            for dataORparity in ('D', 'P', ):
+                self.exist[dataORparity].append(0)
+                self.missing[dataORparity].append(0)
+            self.suppliers += 1
+
+    def add_blocks(self, blocks_mask):
+        """
+        Mark given blocks as known, all new pieces will have value 0.
+        """
+        self.blocks |= blocks_mask
+
+    def get(self, blockNum, dataORparity, supplierNum):
+        if supplierNum >= self.suppliers:
+            return 0
+        if (self.exist[dataORparity][supplierNum] >> blockNum) & 1:
+            return 1
+        if (self.missing[dataORparity][supplierNum] >> blockNum) & 1:
+            return -1
+        return 0
+
+    def set(self, blockNum, dataORparity, supplierNum, value):
+        self.extend(supplierNum + 1)
+        bit = 1 << blockNum
+        self.blocks |= bit
+        exist = self.exist[dataORparity]
+        missing = self.missing[dataORparity]
+        if value == 1:
+            exist[supplierNum] |= bit
+            missing[supplierNum] &= ~bit
+        elif value == -1:
+            exist[supplierNum] &= ~bit
+            missing[supplierNum] |= bit
+        else:
+            exist[supplierNum] &= ~bit
+            missing[supplierNum] &= ~bit
+
+    def cells(self, blockNum, dataORparity):
+        """
+        Return a list of values for given block, one item for every supplier.
+        """
+        exist = self.exist[dataORparity]
+        missing = self.missing[dataORparity]
+        result = [0, ] * self.suppliers
+        for supplierNum in xrange(self.suppliers):
+            if (exist[supplierNum] >> blockNum) & 1:
+                result[supplierNum] = 1
+            elif (missing[supplierNum] >> blockNum) & 1:
+                result[supplierNum] = -1
+        return result
+
+    def row(self, blockNum):
+        return {'D': self.cells(blockNum, 'D'),
+                'P': self.cells(blockNum, 'P'), }
+
+    def column(self, dataORparity, supplierNum):
+        """
+        Bit set of blocks where given supplier have a piece on that "surface".
+        """
+        if supplierNum >= self.suppliers:
+            return 0
+        return self.exist[dataORparity][supplierNum]
+
+    def complete(self, supplierNum):
+        """
+        Bit set of blocks where given supplier have both Data and Parity pieces.
+        """
+        if supplierNum >= self.suppliers:
+            return 0
+        return self.exist['D'][supplierNum] & self.exist['P'][supplierNum]
+
+    def update_column(self, dataORparity, supplierNum, blocks_mask, exist_bits):
+        """
+        For all blocks in ``blocks_mask`` set value 1 if block is present in
+        ``exist_bits`` and -1 otherwise.
+        """
+        self.extend(supplierNum + 1)
+        self.blocks |= blocks_mask
+        exist_bits &= blocks_mask
+        self.exist[dataORparity][supplierNum] = (
+            self.exist[dataORparity][supplierNum] & ~blocks_mask) | exist_bits
+        self.missing[dataORparity][supplierNum] = (
+            self.missing[dataORparity][supplierNum] & ~blocks_mask) | (blocks_mask & ~exist_bits)
+
+    def clear_column(self, supplierNum):
+        """
+        Forget all pieces marked with 1 for given supplier, return number of
+        such pieces.
+        """
+        if supplierNum >= self.suppliers:
+            return 0
+        count = 0
+        for dataORparity in ('D', 'P', ):
+            count += _bits_count(self.exist[dataORparity][supplierNum])
+            self.exist[dataORparity][supplierNum] = 0
+        return count
+
+
+def _get_matrix(matrixes, backupID, customer_idurl):
+    """
+    Return ``BlocksMatrix`` for given backup, create a new one if not exist yet.
+    """
+    if backupID not in matrixes:
+        matrixes[backupID] = BlocksMatrix(contactsdb.num_suppliers(customer_idurl=customer_idurl))
+    return matrixes[backupID]
+
+#------------------------------------------------------------------------------
+
+
 def GetActiveArray(customer_idurl=None):
     """
     Loops all suppliers and returns who is alive at the moment.
@@ -334,7 +613,7 @@ def ReadRawListFiles(supplierNum, listFileText, customer_idurl=None):
                 filesz = -1
             if not backup_fs.IsFileID(pth, iterID=backup_fs.fsID(customer_idurl)):
                 # remote supplier have some file - but we don't have it in the index
-                if pth.strip('/') in [settings.BackupIndexFileName(), ]:
+                if pth.strip('/') in [settings.BackupIndexFileName(), settings.BackupIndexJournalFileName(), ]:
                     # this is the index file saved on remote supplier
                     # let's remember its size and put it in the backup_fs
                     item = backup_fs.FSItemInfo(
@@ -436,13 +715,17 @@ def ReadRawListFiles(supplierNum, listFileText, customer_idurl=None):
                 except:
                     item = None
             if not item or not item.has_version(versionName):
-                if is_in_sync:
+                if dedup_index.is_retired(backupID):
+                    # removed from the catalog, but newer versions still refer to its blocks
+                    # keep track of the remote data, so it can be rebuilt if needed
+                    pass
+                elif is_in_sync:
                     backups2remove.add(backupID)
                     lg.out(2, '        V%s - remove, version is not found in the index' % backupID)
+                    continue
                 else:
                     lg.warn('V%s version is not found in the index, but we are not in sync, skip' % backupID)
-                continue
-            item_version_info = item.get_version_info(versionName)
+                    continue
             missingBlocksSet = {'Data': set(), 'Parity': set()}
             if len(words) > 4:
                 # "0/0/123/4567/F20090709034221PM/0-Data" "3" "0-5" "434353" "missing" "Data:1,3" "Parity:0,1,2"
@@ -456,20 +739,18 @@ def ReadRawListFiles(supplierNum, listFileText, customer_idurl=None):
                     except:
                         lg.exc()
                         break
-            if backupID not in remote_files():
-                remote_files()[backupID] = {}
-                # lg.out(6, 'backup_matrix.ReadRawListFiles new remote entry for %s created in the memory' % backupID)
+            matrix = _get_matrix(remote_files(), backupID, customer_idurl)
             # +1 because range(2) give us [0,1] but we want [0,1,2]
-            for blockNum in xrange(maxBlockNum + 1):
-                if blockNum not in remote_files()[backupID]:
-                    remote_files()[backupID][blockNum] = {
-                        'D': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl),
-                        'P': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl), }
-                for dataORparity in ['Data', 'Parity', ]:
-                    # we set -1 if the file is missing and 1 if exist, so 0 mean "no info yet" ... smart!
-                    bit = -1 if str(blockNum) in missingBlocksSet[dataORparity] else 1
-                    remote_files()[backupID][blockNum][dataORparity[0]][supplierNum] = bit
-                    newfiles += int((bit + 1) / 2)  # this should switch -1 or 1 to 0 or 1
+            blocksMask = _bits_mask(maxBlockNum + 1)
+            for dataORparity in ['Data', 'Parity', ]:
+                # we set -1 if the file is missing and 1 if exist, so 0 mean "no info yet" ... smart!
+                missingBits = 0
+                for blockNumStr in missingBlocksSet[dataORparity]:
+                    if blockNumStr.isdigit() and int(blockNumStr) <= maxBlockNum:
+                        missingBits |= 1 << int(blockNumStr)
+                existBits = blocksMask & ~missingBits
+                matrix.update_column(dataORparity[0], supplierNum, blocksMask, existBits)
+                newfiles += _bits_count(existBits)
             # save max block number for this backup
             if backupID not in remote_max_block_numbers():
                 remote_max_block_numbers()[backupID] = -1
@@ -517,7 +798,8 @@ def ReadLatestRawListFiles(customer_idurl=None):
 
 def ReadLocalFiles():
     """
-    This method scans local backups and build the whole "local" matrix.
+    This method builds the whole "local" matrix from the list of local pieces
+    kept in ``storage.local_manifest``, so no disk access is needed here.
     """
     global _LocalFilesNotifyCallback
     local_files().clear()
@@ -525,34 +807,10 @@ def ReadLocalFiles():
     local_backup_size().clear()
     _counter = [0, ]
 
-    def visit(customer, realpath, subpath, name):
-        # subpath is something like 0/0/1/0/F20131120053803PM/0-1-Data
-        if not os.path.isfile(realpath):
-            return True
-        if realpath.startswith('newblock-'):
-            return False
-        if subpath in [settings.BackupIndexFileName(), settings.BackupInfoFileName(), settings.BackupInfoFileNameOld(), settings.BackupInfoEncryptedFileName()]:
-            return False
-        try:
-            version = subpath.split('/')[-2]
-        except:
-            return False
-        if not packetid.IsCanonicalVersion(version):
-            return True
-        LocalFileReport(packetID=packetid.MakeBackupID(customer, subpath))
-        _counter[0] += 1
-        return False
-
-    for customer in os.listdir(settings.getLocalBackupsDir()):
-        customer_path = os.path.join(settings.getLocalBackupsDir(), customer)
-        if not global_id.IsValidGlobalUser(customer):
-            lg.warn('found incorrect folder name, not a customer: %s' % customer_path)
-            continue
-        if os.path.isdir(customer_path):
-            bpio.traverse_dir_recursive(
-                lambda r, s, n: visit(customer, r, s, n), customer_path)
-        else:
-            lg.warn('not a folder: %s' % customer_path)
+    for backupID in local_manifest.backups():
+        for name in local_manifest.pieces(backupID).keys():
+            LocalFileReport(packetID=backupID + '/' + name)
+            _counter[0] += 1
 
     if _Debug:
         lg.out(_DebugLevel, 'backup_matrix.ReadLocalFiles %d files indexed' % _counter[0])
@@ -632,18 +890,15 @@ def RemoteFileReport(backupID, blockNum, supplierNum, dataORparity, result):
         lg.out(4, 'backup_matrix.RemoteFileReport got too big supplier number, possible this is an old packet')
         return
     if backupID not in remote_files():
-        remote_files()[backupID] = {}
         lg.info('new remote entry for %s created in the memory' % backupID)
-    if blockNum not in remote_files()[backupID]:
-        remote_files()[backupID][blockNum] = {
-            'D': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl),
-            'P': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl), }
+    matrix = _get_matrix(remote_files(), backupID, customer_idurl)
+    matrix.add_blocks(1 << blockNum)
     # save backed up block info into remote info structure, synchronize on hand info
     flag = 1 if result else 0
     if dataORparity == 'Data':
-        remote_files()[backupID][blockNum]['D'][supplierNum] = flag
+        matrix.set(blockNum, 'D', supplierNum, flag)
     elif dataORparity == 'Parity':
-        remote_files()[backupID][blockNum]['P'][supplierNum] = flag
+        matrix.set(blockNum, 'P', supplierNum, flag)
     else:
         lg.warn('incorrect backup ID: %s' % backupID)
     # if we know only 5 blocks stored on remote machine
@@ -653,7 +908,16 @@ def RemoteFileReport(backupID, blockNum, supplierNum, dataORparity, result):
     RepaintBackup(backupID)
 
 
-def LocalFileReport(packetID=None, backupID=None, blockNum=None, supplierNum=None, dataORparity=None):
+def CreateRemoteBlocks(backupID, maxBlockNum):
+    """
+    Make sure "remote" matrix have info for all blocks of given backup up to
+    ``maxBlockNum``, new blocks will have all pieces with value 0 - "no info yet".
+    """
+    customer_idurl = packetid.CustomerIDURL(backupID)
+    _get_matrix(remote_files(), backupID, customer_idurl).add_blocks(_bits_mask(maxBlockNum + 1))
+
+
+def LocalFileReport(packetID=None, backupID=None, blockNum=None, supplierNum=None, dataORparity=None, size=None):
     """
     Writes info for a single piece of data into "local" matrix.
 
@@ -662,6 +926,9 @@ def LocalFileReport(packetID=None, backupID=None, blockNum=None, supplierNum=Non
     * pass all other parameters and do not use ``packetID``
 
     This is called when new local file created, for example during rebuilding process.
+    If caller just wrote that file pass its ``size`` here, so it will be remembered
+    in ``storage.local_manifest``, otherwise the manifest is checked and
+    local file is verified only if manifest do not know it yet.
     """
     if packetID is not None:
         customer, remotePath, blockNum, supplierNum, dataORparity = packetid.Split(packetID)
@@ -673,12 +940,21 @@ def LocalFileReport(packetID=None, backupID=None, blockNum=None, supplierNum=Non
         blockNum = int(blockNum)
         supplierNum = int(supplierNum)
         dataORparity = dataORparity
-        packetID = packetid.MakePacketID(backupID, blockNum, supplierNum, dataORparity)
+    packetID = packetid.MakePacketID(backupID, blockNum, supplierNum, dataORparity)
     customer, filename = packetid.SplitPacketID(packetID)
     customer_idurl = global_id.GlobalUserToIDURL(customer)
     if dataORparity not in ['Data', 'Parity']:
         lg.warn('Data or Parity? ' + filename)
         return
+    if size is not None:
+        local_manifest.piece_written(packetID, size)
+    else:
+        size = local_manifest.piece_size(packetID)
+        if size is None:
+            localDest = os.path.join(settings.getLocalBackupsDir(), customer, filename)
+            if os.path.isfile(localDest):
+                size = os.path.getsize(localDest)
+                local_manifest.piece_written(packetID, size)
     if supplierNum >= contactsdb.num_suppliers(customer_idurl=customer_idurl):
         lg.warn('supplier position invalid %d > %d for customer %s : %s' % (
             supplierNum, contactsdb.num_suppliers(), customer_idurl, filename))
@@ -687,33 +963,26 @@ def LocalFileReport(packetID=None, backupID=None, blockNum=None, supplierNum=Non
     if not supplier_idurl:
         lg.warn('empty supplier at position %s for customer %s' % (supplierNum, customer_idurl, ))
         return
-    localDest = os.path.join(settings.getLocalBackupsDir(), customer, filename)
-    if backupID not in local_files():
-        local_files()[backupID] = {}
-    if blockNum not in local_files()[backupID]:
-        local_files()[backupID][blockNum] = {
-            'D': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl),
-            'P': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl), }
-    if not os.path.isfile(localDest):
-        local_files()[backupID][blockNum][dataORparity[0]][supplierNum] = 0
+    matrix = _get_matrix(local_files(), backupID, customer_idurl)
+    if size is None:
+        matrix.set(blockNum, dataORparity[0], supplierNum, 0)
         return
-    local_files()[backupID][blockNum][dataORparity[0]][supplierNum] = 1
+    matrix.set(blockNum, dataORparity[0], supplierNum, 1)
     if backupID not in local_max_block_numbers():
         local_max_block_numbers()[backupID] = -1
     if local_max_block_numbers()[backupID] < blockNum:
         local_max_block_numbers()[backupID] = blockNum
-    if backupID not in local_backup_size():
-        local_backup_size()[backupID] = 0
-    try:
-        local_backup_size()[backupID] += os.path.getsize(localDest)
-    except:
-        lg.exc()
+    local_backup_size()[backupID] = local_manifest.backup_size(backupID)
     RepaintBackup(backupID)
 
 
 def LocalBlockReport(backupID, blockNumber, result):
     """
     This updates "local" matrix - a several pieces corresponding to given block of data.
+
+    When block was just created by ``raid.make`` the ``result`` contains
+    number of Data and Parity pieces and their sizes - they are written into
+    ``storage.local_manifest``. Otherwise info about pieces is taken from the manifest.
     """
     if result is None:
         lg.warn('result is None')
@@ -728,6 +997,20 @@ def LocalBlockReport(backupID, blockNumber, result):
     repaint_flag = False
     if _Debug:
         lg.out(_DebugLevel, 'backup_matrix.LocalFileReport  in block %d at %s for %s' % (blockNumber, backupID, customer, ))
+    if isinstance(result, tuple) and len(result) == 4:
+        dataNum, parityNum, dataSize, paritySize = result
+        for supplierNum in xrange(dataNum):
+            local_manifest.piece_written(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Data'), dataSize)
+        for supplierNum in xrange(parityNum):
+            local_manifest.piece_written(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Parity'), paritySize)
+    if backupID not in local_files():
+        repaint_flag = True
+        if _Debug:
+            lg.out(_DebugLevel, '    new local entry for %s created in the memory' % backupID)
+    matrix = _get_matrix(local_files(), backupID, customer_idurl)
+    if blockNum not in matrix:
+        matrix.add_blocks(1 << blockNum)
+        repaint_flag = True
     num_suppliers = contactsdb.num_suppliers(customer_idurl=customer_idurl)
     for supplierNum in xrange(num_suppliers):
         supplier_idurl = contactsdb.supplier(supplierNum, customer_idurl=customer_idurl)
@@ -736,38 +1019,21 @@ def LocalBlockReport(backupID, blockNumber, result):
                 supplierNum, backupID, customer_idurl))
             continue
         for dataORparity in ('Data', 'Parity'):
-            packetID = packetid.MakePacketID(remotePath, blockNum, supplierNum, dataORparity)
-            local_file = os.path.join(settings.getLocalBackupsDir(), customer, packetID)
-            if backupID not in local_files():
-                local_files()[backupID] = {}
-                repaint_flag = True
-                if _Debug:
-                    lg.out(_DebugLevel, '    new local entry for %s created in the memory' % backupID)
-            if blockNum not in local_files()[backupID]:
-                local_files()[backupID][blockNum] = {
-                    'D': [0, ] * num_suppliers,
-                    'P': [0, ] * num_suppliers}
+            packetID = packetid.MakePacketID(backupID, blockNum, supplierNum, dataORparity)
+            flag = 0 if local_manifest.piece_size(packetID) is None else 1
+            if matrix.get(blockNum, dataORparity[0], supplierNum) != flag:
+                matrix.set(blockNum, dataORparity[0], supplierNum, flag)
                 repaint_flag = True
-            if not os.path.isfile(local_file):
-                local_files()[backupID][blockNum][dataORparity[0]][supplierNum] = 0
-                repaint_flag = True
-                continue
-            local_files()[backupID][blockNum][dataORparity[0]][supplierNum] = 1
-            if backupID not in local_backup_size():
-                local_backup_size()[backupID] = 0
-                repaint_flag = True
-            try:
-                local_backup_size()[backupID] += os.path.getsize(local_file)
-                repaint_flag = True
-            except:
-                lg.exc()
-            if _Debug:
-                lg.out(_DebugLevel, '    OK, local backup size is %s and max block num is %s' % (
-                    local_backup_size()[backupID], local_max_block_numbers()[backupID]))
+    if local_backup_size().get(backupID) != local_manifest.backup_size(backupID):
+        local_backup_size()[backupID] = local_manifest.backup_size(backupID)
+        repaint_flag = True
     if backupID not in local_max_block_numbers():
         local_max_block_numbers()[backupID] = -1
     if local_max_block_numbers()[backupID] < blockNum:
         local_max_block_numbers()[backupID] = blockNum
+    if _Debug:
+        lg.out(_DebugLevel, '    OK, local backup size is %s and max block num is %s' % (
+            local_backup_size()[backupID], local_max_block_numbers()[backupID]))
     if repaint_flag:
         RepaintBackup(backupID)
 
@@ -785,7 +1051,7 @@ def ScanMissingBlocks(backupID):
     if _Debug:
         lg.out(_DebugLevel, 'backup_matrix.ScanMissingBlocks for %s' % backupID)
     customer_idurl = packetid.CustomerIDURL(backupID)
-    missingBlocks = set()
+    missingBlocks = 0
     localMaxBlockNum = local_max_block_numbers().get(backupID, -1)
     remoteMaxBlockNum = remote_max_block_numbers().get(backupID, -1)
     supplierActiveArray = GetActiveArray(customer_idurl=customer_idurl)
@@ -803,19 +1069,16 @@ def ScanMissingBlocks(backupID):
             # need to scan all block numbers
             if _Debug:
                 lg.out(_DebugLevel, '    no remote info but found local info, maxBlockNum=%d' % localMaxBlockNum)
-            for blockNum in xrange(localMaxBlockNum + 1):
+            localMatrix = local_files()[backupID]
+            for supplierNum in xrange(len(supplierActiveArray)):
+                # if supplier is not alive we can not send to him
+                # so no need to scan for missing blocks
+                if supplierActiveArray[supplierNum] != 1:
+                    continue
                 # we check for Data and Parity packets
-                localData = GetLocalDataArray(backupID, blockNum)
-                localParity = GetLocalParityArray(backupID, blockNum)
-                for supplierNum in xrange(len(supplierActiveArray)):
-                    # if supplier is not alive we can not send to him
-                    # so no need to scan for missing blocks
-                    if supplierActiveArray[supplierNum] != 1:
-                        continue
-                    if localData[supplierNum] == 1:
-                        missingBlocks.add(blockNum)
-                    if localParity[supplierNum] == 1:
-                        missingBlocks.add(blockNum)
+                missingBlocks |= localMatrix.column('D', supplierNum)
+                missingBlocks |= localMatrix.column('P', supplierNum)
+            missingBlocks &= _bits_mask(localMaxBlockNum + 1)
     else:
         # now we have some remote info
         # we take max block number from local and remote
@@ -823,31 +1086,23 @@ def ScanMissingBlocks(backupID):
         if _Debug:
             lg.out(_DebugLevel, '    found remote info, maxBlockNum=%d' % maxBlockNum)
         # and increase by one because range(3) give us [0, 1, 2], but we want [0, 1, 2, 3]
-        for blockNum in xrange(maxBlockNum + 1):
-            # if we have few remote files, but many locals - we want to send all missed
-            if blockNum not in remote_files()[backupID]:
-                missingBlocks.add(blockNum)
+        blocksMask = _bits_mask(maxBlockNum + 1)
+        remoteMatrix = remote_files()[backupID]
+        # if we have few remote files, but many locals - we want to send all missed
+        missingBlocks = blocksMask & ~remoteMatrix.blocks
+        # now check every our supplier for all blocks at once
+        for supplierNum in xrange(len(supplierActiveArray)):
+            # if supplier is not alive we can not send to him
+            # so no need to scan for missing blocks
+            if supplierActiveArray[supplierNum] != 1:
                 continue
-            # take remote info for this block
-            remoteData = GetRemoteDataArray(backupID, blockNum)
-            remoteParity = GetRemoteParityArray(backupID, blockNum)
-            # now check every our supplier for every block
-            for supplierNum in xrange(len(supplierActiveArray)):
-                # if supplier is not alive we can not send to him
-                # so no need to scan for missing blocks
-                if supplierActiveArray[supplierNum] != 1:
-                    continue
-                if supplierNum >= len(remoteData) or supplierNum >= len(remoteParity):
-                    missingBlocks.add(blockNum)
-                    continue
-                if remoteData[supplierNum] != 1:    # -1 means missing
-                    missingBlocks.add(blockNum)     # 0 - no info yet
-                if remoteParity[supplierNum] != 1:  # 1 - file exist on remote supplier
-                    missingBlocks.add(blockNum)
+            # -1 means missing, 0 - no info yet, 1 - file exist on remote supplier
+            missingBlocks |= blocksMask & ~remoteMatrix.complete(supplierNum)
 
+    missingBlocks = _bits_list(missingBlocks)
     if _Debug:
         lg.out(_DebugLevel, '    missingBlocks=%s' % missingBlocks)
-    return list(missingBlocks)
+    return missingBlocks
 
 
 def ScanBlocksToRemove(backupID, check_all_suppliers=True):
@@ -866,37 +1121,36 @@ def ScanBlocksToRemove(backupID, check_all_suppliers=True):
     if backupID not in remote_files() or backupID not in local_files():
         # no info about this backup yet - skip
         return packets
-    for blockNum in xrange(localMaxBlockNum + 1):
-        localArray = {'Data': GetLocalDataArray(backupID, blockNum),
-                      'Parity': GetLocalParityArray(backupID, blockNum)}
-        remoteArray = {'Data': GetRemoteDataArray(backupID, blockNum),
-                       'Parity': GetRemoteParityArray(backupID, blockNum)}
-        if (0 in remoteArray['Data']) or (0 in remoteArray['Parity']):
-            # if some supplier do not have some data for that block - do not remove any local files for that block!
-            # we do remove the local files only when we sure all suppliers got the all data pieces
-            continue
-        if (-1 in remoteArray['Data']) or (-1 in remoteArray['Parity']):
-            # also if we do not have any info about this block for some supplier do not remove other local pieces
+    remoteMatrix = remote_files()[backupID]
+    localMatrix = local_files()[backupID]
+    if remoteMatrix.suppliers == 0 or remoteMatrix.suppliers < contactsdb.num_suppliers(customer_idurl=customer_idurl):
+        # no info from some of suppliers yet - nothing is known to be delivered
+        return packets
+    # if some supplier do not have some data for that block - do not remove any local files for that block!
+    # we do remove the local files only when we sure all suppliers got the all data pieces
+    # also if we do not have any info about this block for some supplier do not remove other local pieces
+    deliveredBlocks = remoteMatrix.blocks & _bits_mask(localMaxBlockNum + 1)
+    for supplierNum in xrange(remoteMatrix.suppliers):
+        deliveredBlocks &= remoteMatrix.complete(supplierNum)
+    if not deliveredBlocks:
+        return packets
+    suppliers = []
+    for supplierNum in xrange(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
+        supplierIDURL = contactsdb.supplier(supplierNum, customer_idurl=customer_idurl)
+        if not supplierIDURL:
+            # supplier is unknown - skip
             continue
-        for supplierNum in xrange(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
-            supplierIDURL = contactsdb.supplier(supplierNum, customer_idurl=customer_idurl)
-            if not supplierIDURL:
-                # supplier is unknown - skip
-                continue
+        suppliers.append((supplierNum, supplierIDURL, ))
+    for blockNum in _bits_list(deliveredBlocks):
+        for supplierNum, supplierIDURL in suppliers:
             for dataORparity in ['Data', 'Parity']:
+                if localMatrix.get(blockNum, dataORparity[0], supplierNum) != 1:
+                    continue
                 packetID = packetid.MakePacketID(backupID, blockNum, supplierNum, dataORparity)
                 if io_throttle.HasPacketInSendQueue(supplierIDURL, packetID):
                     # if we do sending the packet at the moment - skip
                     continue
-                if localArray[dataORparity][supplierNum] == 1:
-                    packets.append(packetID)
-                    # lg.out(10, '    mark to remove %s, blockNum:%d remote:%s local:%s' % (packetID, blockNum, str(remoteArray), str(localArray)))
-#                if check_all_suppliers:
-#                    if localArray[dataORparity][supplierNum] == 1:
-#                        packets.append(packetID)
-#                else:
-#                    if remoteArray[dataORparity][supplierNum] == 1 and localArray[dataORparity][supplierNum] == 1:
-#                        packets.append(packetID)
+                packets.append(packetID)
     return packets
 
 
@@ -912,34 +1166,23 @@ def ScanBlocksToSend(backupID):
     bySupplier = {}
     for supplierNum in xrange(len(supplierActiveArray)):
         bySupplier[supplierNum] = set()
-    if backupID not in remote_files():
-        for blockNum in xrange(localMaxBlockNum + 1):
-            localData = GetLocalDataArray(backupID, blockNum)
-            localParity = GetLocalParityArray(backupID, blockNum)
-            for supplierNum in xrange(len(supplierActiveArray)):
-                if supplierActiveArray[supplierNum] != 1:
-                    continue
-                if supplierNum >= len(localData) or supplierNum >= len(localParity):
-                    continue
-                if localData[supplierNum] == 1:
-                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Data'))
-                if localParity[supplierNum] == 1:
-                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Parity'))
-    else:
-        for blockNum in xrange(localMaxBlockNum + 1):
-            remoteData = GetRemoteDataArray(backupID, blockNum)
-            remoteParity = GetRemoteParityArray(backupID, blockNum)
-            localData = GetLocalDataArray(backupID, blockNum)
-            localParity = GetLocalParityArray(backupID, blockNum)
-            for supplierNum in xrange(len(supplierActiveArray)):
-                if supplierActiveArray[supplierNum] != 1:
-                    continue
-                if supplierNum >= len(remoteData) or supplierNum >= len(remoteParity):
-                    continue
-                if remoteData[supplierNum] != 1 and localData[supplierNum] == 1:
-                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Data'))
-                if remoteParity[supplierNum] != 1 and localParity[supplierNum] == 1:
-                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Parity'))
+    if backupID not in local_files():
+        return bySupplier
+    blocksMask = _bits_mask(localMaxBlockNum + 1)
+    localMatrix = local_files()[backupID]
+    remoteMatrix = remote_files().get(backupID)
+    for supplierNum in xrange(len(supplierActiveArray)):
+        if supplierActiveArray[supplierNum] != 1:
+            continue
+        for dataORparity in ['Data', 'Parity']:
+            blocksToSend = localMatrix.column(dataORparity[0], supplierNum) & blocksMask
+            if remoteMatrix is not None:
+                if supplierNum < remoteMatrix.suppliers:
+                    blocksToSend &= ~remoteMatrix.column(dataORparity[0], supplierNum)
+                else:
+                    blocksToSend &= ~remoteMatrix.blocks
+            for blockNum in _bits_list(blocksToSend):
+                bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, dataORparity))
     return bySupplier
 
 #------------------------------------------------------------------------------
@@ -1037,19 +1280,7 @@ def ClearSupplierRemoteInfo(supplierNum, customer_idurl=None):
     for backupID in remote_files().keys():
         _customer_idurl = packetid.CustomerIDURL(backupID)
         if _customer_idurl == customer_idurl:
-            for blockNum in remote_files()[backupID].keys():
-                try:
-                    if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                        files += 1
-                        remote_files()[backupID][blockNum]['D'][supplierNum] = 0
-                except:
-                    pass
-                try:
-                    if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                        files += 1
-                        remote_files()[backupID][blockNum]['P'][supplierNum] = 0
-                except:
-                    pass
+            files += remote_files()[backupID].clear_column(supplierNum)
     return files
 
 #------------------------------------------------------------------------------
@@ -1068,15 +1299,11 @@ def GetBackupStats(backupID):
     maxBlockNum = GetKnownMaxBlockNum(backupID)
     fileNumbers = [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
     totalNumberOfFiles = 0
-    for blockNum in remote_files()[backupID].keys():
-        for supplierNum in xrange(len(fileNumbers)):
-            if supplierNum < contactsdb.num_suppliers(customer_idurl=customer_idurl):
-                if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                    fileNumbers[supplierNum] += 1
-                    totalNumberOfFiles += 1
-                if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                    fileNumbers[supplierNum] += 1
-                    totalNumberOfFiles += 1
+    remoteMatrix = remote_files()[backupID]
+    for supplierNum in xrange(len(fileNumbers)):
+        fileNumbers[supplierNum] += _bits_count(remoteMatrix.column('D', supplierNum))
+        fileNumbers[supplierNum] += _bits_count(remoteMatrix.column('P', supplierNum))
+        totalNumberOfFiles += fileNumbers[supplierNum]
     statsArray = []
     for supplierNum in xrange(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
         if maxBlockNum > -1:
@@ -1104,18 +1331,12 @@ def GetBackupLocalStats(backupID):
     percentPerSupplier = 100.0 / contactsdb.num_suppliers(customer_idurl=customer_idurl)
     totalNumberOfFiles = 0
     fileNumbers = [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    for blockNum in xrange(maxBlockNum + 1):
-        if blockNum not in local_files()[backupID].keys():
-            continue
-#    for blockNum in local_files()[backupID].keys():
-        for supplierNum in xrange(len(fileNumbers)):
-            if supplierNum < contactsdb.num_suppliers(customer_idurl=customer_idurl):
-                if local_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                    fileNumbers[supplierNum] += 1
-                    totalNumberOfFiles += 1
-                if local_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                    fileNumbers[supplierNum] += 1
-                    totalNumberOfFiles += 1
+    blocksMask = _bits_mask(maxBlockNum + 1)
+    localMatrix = local_files()[backupID]
+    for supplierNum in xrange(len(fileNumbers)):
+        fileNumbers[supplierNum] += _bits_count(localMatrix.column('D', supplierNum) & blocksMask)
+        fileNumbers[supplierNum] += _bits_count(localMatrix.column('P', supplierNum) & blocksMask)
+        totalNumberOfFiles += fileNumbers[supplierNum]
     statsArray = []
     for supplierNum in xrange(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
         if maxBlockNum > -1:
@@ -1143,12 +1364,10 @@ def GetBackupBlocksAndPercent(backupID):
     customer_idurl = packetid.CustomerIDURL(backupID)
     # we count all remote files for this backup
     fileCounter = 0
-    for blockNum in remote_files()[backupID].keys():
-        for supplierNum in xrange(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
-            if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                fileCounter += 1
-            if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                fileCounter += 1
+    remoteMatrix = remote_files()[backupID]
+    for supplierNum in xrange(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
+        fileCounter += _bits_count(remoteMatrix.column('D', supplierNum))
+        fileCounter += _bits_count(remoteMatrix.column('P', supplierNum))
     # +1 since zero based and *0.5 because Data and Parity
     return maxBlockNum + 1, 100.0 * 0.5 * fileCounter / ((maxBlockNum + 1) * contactsdb.num_suppliers(customer_idurl=customer_idurl))
 
@@ -1176,35 +1395,26 @@ def GetBackupRemoteStats(backupID, only_available_files=True):
     customer_idurl = packetid.CustomerIDURL(backupID)
     supplierCount = contactsdb.num_suppliers(customer_idurl=customer_idurl)
     fileCounter = 0
-    weakBlockNum = -1
-    lessSuppliers = supplierCount
     activeArray = GetActiveArray(customer_idurl=customer_idurl)
-    # we count all remote files for this backup - scan all blocks
-    for blockNum in xrange(maxBlockNum + 1):
-        if blockNum not in remote_files()[backupID].keys():
-            lessSuppliers = 0
-            weakBlockNum = blockNum
+    blocksMask = _bits_mask(maxBlockNum + 1)
+    remoteMatrix = remote_files()[backupID]
+    # we count all remote files for this backup - scan all suppliers
+    goodColumns = []
+    for supplierNum in xrange(supplierCount):
+        if activeArray[supplierNum] != 1 and only_available_files:
             continue
-        goodSuppliers = supplierCount
-        for supplierNum in xrange(supplierCount):
-            if activeArray[supplierNum] != 1 and only_available_files:
-                goodSuppliers -= 1
-                continue
-            try:
-                remote_files()[backupID][blockNum]['D'][supplierNum]
-                remote_files()[backupID][blockNum]['D'][supplierNum]
-            except:
-                goodSuppliers -= 1
-                continue
-            if remote_files()[backupID][blockNum]['D'][supplierNum] != 1 or remote_files()[backupID][blockNum]['P'][supplierNum] != 1:
-                goodSuppliers -= 1
-            if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                fileCounter += 1
-            if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                fileCounter += 1
-        if goodSuppliers < lessSuppliers:
-            lessSuppliers = goodSuppliers
-            weakBlockNum = blockNum
+        if supplierNum >= remoteMatrix.suppliers:
+            continue
+        fileCounter += _bits_count(remoteMatrix.column('D', supplierNum) & blocksMask)
+        fileCounter += _bits_count(remoteMatrix.column('P', supplierNum) & blocksMask)
+        goodColumns.append(remoteMatrix.complete(supplierNum))
+    unknownBlocks = blocksMask & ~remoteMatrix.blocks
+    if unknownBlocks:
+        # no info at all about some blocks - the last of them is reported as the weakest
+        weakBlockNum = _bits_highest(unknownBlocks)
+        lessSuppliers = 0
+    else:
+        weakBlockNum, lessSuppliers = _bits_weakest(goodColumns, blocksMask, supplierCount)
     # +1 since zero based and *0.5 because Data and Parity
     return (
         maxBlockNum + 1,
@@ -1272,7 +1482,7 @@ def GetLocalMatrix(backupID, blockNum):
     if blockNum not in local_files()[backupID]:
         return {'D': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl),
                 'P': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl), }
-    return local_files()[backupID][blockNum]
+    return local_files()[backupID].row(blockNum)
 
 
 def GetLocalDataArray(backupID, blockNum):
@@ -1285,7 +1495,7 @@ def GetLocalDataArray(backupID, blockNum):
         return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
     if blockNum not in local_files()[backupID]:
         return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    return local_files()[backupID][blockNum]['D']
+    return local_files()[backupID].cells(blockNum, 'D')
 
 
 def GetLocalParityArray(backupID, blockNum):
@@ -1298,7 +1508,7 @@ def GetLocalParityArray(backupID, blockNum):
         return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
     if blockNum not in local_files()[backupID]:
         return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    return local_files()[backupID][blockNum]['P']
+    return local_files()[backupID].cells(blockNum, 'P')
 
 
 def GetRemoteMatrix(backupID, blockNum):
@@ -1311,7 +1521,7 @@ def GetRemoteMatrix(backupID, blockNum):
     if blockNum not in remote_files()[backupID]:
         return {'D': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl),
                 'P': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl), }
-    return remote_files()[backupID][blockNum]
+    return remote_files()[backupID].row(blockNum)
 
 
 def GetRemoteDataArray(backupID, blockNum):
@@ -1324,7 +1534,7 @@ def GetRemoteDataArray(backupID, blockNum):
         return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
     if blockNum not in remote_files()[backupID]:
         return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    return remote_files()[backupID][blockNum]['D']
+    return remote_files()[backupID].cells(blockNum, 'D')
 
 
 def GetRemoteParityArray(backupID, blockNum):
@@ -1337,7 +1547,7 @@ def GetRemoteParityArray(backupID, blockNum):
         return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
     if blockNum not in remote_files()[backupID]:
         return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    return remote_files()[backupID][blockNum]['P']
+    return remote_files()[backupID].cells(blockNum, 'P')
 
 
 def GetSupplierStats(supplierNum, customer_idurl=None):
@@ -1349,16 +1559,14 @@ def GetSupplierStats(supplierNum, customer_idurl=None):
     for backupID in remote_files().keys():
         if customer_idurl != packetid.CustomerIDURL(backupID):
             continue
-        result[backupID] = {'data': 0, 'parity': 0, 'total': 0, }
-        for blockNum in remote_files()[backupID].keys():
-            if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                result[backupID]['data'] += 1
-                files += 1
-            if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                result[backupID]['parity'] += 1
-                files += 1
-            result[backupID]['total'] += 2
-            total += 2
+        remoteMatrix = remote_files()[backupID]
+        result[backupID] = {
+            'data': _bits_count(remoteMatrix.column('D', supplierNum)),
+            'parity': _bits_count(remoteMatrix.column('P', supplierNum)),
+            'total': 2 * len(remoteMatrix),
+        }
+        files += result[backupID]['data'] + result[backupID]['parity']
+        total += result[backupID]['total']
     return files, total, result
 
 
@@ -1371,18 +1579,13 @@ def GetWeakLocalBlock(backupID):
     if backupID not in local_files():
         return -1, 0, supplierCount
     maxBlockNum = GetKnownMaxBlockNum(backupID)
-    weakBlockNum = -1
-    lessSuppliers = supplierCount
-    for blockNum in xrange(maxBlockNum + 1):
-        if blockNum not in local_files()[backupID].keys():
-            return blockNum, 0, supplierCount
-        goodSuppliers = supplierCount
-        for supplierNum in xrange(supplierCount):
-            if local_files()[backupID][blockNum]['D'][supplierNum] != 1 or local_files()[backupID][blockNum]['P'][supplierNum] != 1:
-                goodSuppliers -= 1
-        if goodSuppliers < lessSuppliers:
-            lessSuppliers = goodSuppliers
-            weakBlockNum = blockNum
+    blocksMask = _bits_mask(maxBlockNum + 1)
+    localMatrix = local_files()[backupID]
+    unknownBlocks = blocksMask & ~localMatrix.blocks
+    if unknownBlocks:
+        return _bits_lowest(unknownBlocks), 0, supplierCount
+    goodColumns = [localMatrix.complete(supplierNum) for supplierNum in xrange(supplierCount)]
+    weakBlockNum, lessSuppliers = _bits_weakest(goodColumns, blocksMask, supplierCount)
     return weakBlockNum, lessSuppliers, supplierCount
 
 
@@ -1396,26 +1599,20 @@ def GetWeakRemoteBlock(backupID):
     if backupID not in remote_files():
         return -1, 0, supplierCount
     maxBlockNum = GetKnownMaxBlockNum(backupID)
-    weakBlockNum = -1
-    lessSuppliers = supplierCount
+    blocksMask = _bits_mask(maxBlockNum + 1)
+    remoteMatrix = remote_files()[backupID]
+    unknownBlocks = blocksMask & ~remoteMatrix.blocks
+    if unknownBlocks:
+        return _bits_lowest(unknownBlocks), 0, supplierCount
     activeArray = GetActiveArray(customer_idurl=customer_idurl)
-    for blockNum in xrange(maxBlockNum + 1):
-        if blockNum not in remote_files()[backupID].keys():
-            return blockNum, 0, supplierCount
-        goodSuppliers = supplierCount
-        for supplierNum in xrange(supplierCount):
-            if activeArray[supplierNum] != 1:
-                goodSuppliers -= 1
-                continue
-            if remote_files()[backupID][blockNum]['D'][supplierNum] != 1 or remote_files()[backupID][blockNum]['P'][supplierNum] != 1:
-                goodSuppliers -= 1
-        if goodSuppliers < lessSuppliers:
-            lessSuppliers = goodSuppliers
-            weakBlockNum = blockNum
+    goodColumns = []
+    for supplierNum in xrange(supplierCount):
+        if activeArray[supplierNum] != 1:
+            continue
+        goodColumns.append(remoteMatrix.complete(supplierNum))
+    weakBlockNum, lessSuppliers = _bits_weakest(goodColumns, blocksMask, supplierCount)
     return weakBlockNum, lessSuppliers, supplierCount
 
-#------------------------------------------------------------------------------
-
 
 def SetBackupStatusNotifyCallback(callBack):
     """
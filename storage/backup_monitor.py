@@ -104,6 +104,7 @@ from contacts import contactsdb
 from storage import backup_matrix
 from storage import backup_fs
 from storage import backup_control
+from storage import dedup_index
 
 from userid import global_id
 from userid import my_id
@@ -308,8 +309,8 @@ class BackupMonitor(automat.Automat):
             return
         # take remote and local backups and get union from it
         allBackupIDs = set(backup_matrix.local_files().keys() + backup_matrix.remote_files().keys())
-        # take only backups from data base
-        allBackupIDs.intersection_update(backup_fs.ListAllBackupIDs())
+        # take only backups from data base and retired versions which are still referenced by them
+        allBackupIDs.intersection_update(backup_fs.ListAllBackupIDs() + dedup_index.retired_backups())
         # remove running backups
         allBackupIDs.difference_update(backup_control.ListRunningBackups())
         # sort it in reverse order - newer backups should be repaired first
@@ -351,8 +352,8 @@ class BackupMonitor(automat.Automat):
                     if _Debug:
                         lg.out(_DebugLevel, 'backup_monitor.doCleanUpBackups %d of %d backups for %s, so remove older %s' % (
                             len(versions), versionsToKeep, localPath, backupID))
-                    backup_control.DeleteBackup(backupID, saveDB=False, calculate=False)
-                    delete_count += 1
+                    if backup_control.DeleteBackup(backupID, saveDB=False, calculate=False):
+                        delete_count += 1
         # we need also to fit used space into needed space (given from other users)
         # they trust us - do not need to take extra space from our friends
         # so remove oldest backups, but keep at least one for every folder - at least locally!
@@ -373,7 +374,8 @@ class BackupMonitor(automat.Automat):
                         if _Debug:
                             lg.out(_DebugLevel, 'backup_monitor.doCleanUpBackups over use %d of %d, so remove %s of %s' % (
                                 bytesUsed, bytesNeeded, backupID, localPath))
-                        backup_control.DeleteBackup(backupID, saveDB=False, calculate=False)
+                        if not backup_control.DeleteBackup(backupID, saveDB=False, calculate=False):
+                            continue
                         delete_count += 1
                         bytesUsed -= versionInfo[1]
                         if bytesNeeded > bytesUsed:
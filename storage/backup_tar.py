@@ -38,6 +38,10 @@ This data stream is passed via ``Pipe`` to the main process.
 
 This module execute a sub process "bppipe" - pretty simple TAR compressor,
 see ``p2p.bppipe`` module.
+
+Compression mode can be "none", "gz", "bz2" for the whole stream or
+like "zlib:1" to compress every file separately in ``threads`` threads,
+see ``storage.compression`` module.
 """
 
 import os
@@ -59,7 +63,7 @@ from system import child_process
 #------------------------------------------------------------------------------
 
 
-def backuptardir(directorypath, arcname=None, recursive_subfolders=True, compress=None):
+def backuptardir(directorypath, arcname=None, recursive_subfolders=True, compress=None, threads=1):
     """
     Returns file descriptor for process that makes tar archive.
 
@@ -80,13 +84,13 @@ def backuptardir(directorypath, arcname=None, recursive_subfolders=True, compres
     if bpio.Windows():
         if bpio.isFrozen():
             commandpath = "bppipe.exe"
-            cmdargs = [commandpath, subdirs, compress, directorypath, arcname]
+            cmdargs = [commandpath, subdirs, compress, directorypath, arcname, str(threads)]
         else:
             commandpath = "bppipe.py"
-            cmdargs = [sys.executable, commandpath, subdirs, compress, directorypath, arcname]
+            cmdargs = [sys.executable, commandpath, subdirs, compress, directorypath, arcname, str(threads)]
     else:
         commandpath = "bppipe.py"
-        cmdargs = [sys.executable, commandpath, subdirs, compress, directorypath, arcname]
+        cmdargs = [sys.executable, commandpath, subdirs, compress, directorypath, arcname, str(threads)]
     if not os.path.isfile(commandpath):
         lg.out(1, 'backup_tar.backuptar ERROR %s not found' % commandpath)
         return None
@@ -96,7 +100,7 @@ def backuptardir(directorypath, arcname=None, recursive_subfolders=True, compres
     return p
 
 
-def backuptarfile(filepath, arcname=None, compress=None):
+def backuptarfile(filepath, arcname=None, compress=None, threads=1):
     """
     Almost same - returns file descriptor for process that makes tar archive.
     But tar archive is created from single file, not folder.
@@ -112,13 +116,13 @@ def backuptarfile(filepath, arcname=None, compress=None):
     if bpio.Windows():
         if bpio.isFrozen():
             commandpath = "bppipe.exe"
-            cmdargs = [commandpath, 'nosubdirs', compress, filepath, arcname]
+            cmdargs = [commandpath, 'nosubdirs', compress, filepath, arcname, str(threads)]
         else:
             commandpath = "bppipe.py"
-            cmdargs = [sys.executable, commandpath, 'nosubdirs', compress, filepath, arcname]
+            cmdargs = [sys.executable, commandpath, 'nosubdirs', compress, filepath, arcname, str(threads)]
     else:
         commandpath = "bppipe.py"
-        cmdargs = [sys.executable, commandpath, 'nosubdirs', compress, filepath, arcname]
+        cmdargs = [sys.executable, commandpath, 'nosubdirs', compress, filepath, arcname, str(threads)]
     if not os.path.isfile(commandpath):
         lg.out(1, 'backup_tar.backuptarfile ERROR %s not found' % commandpath)
         return None
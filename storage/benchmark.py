@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# benchmark.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (benchmark.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: benchmark.
+
+Compare memory usage and speed of the "remote" matrix of a single backup
+stored as a dictionary of lists (old way) and as ``backup_matrix.BlocksMatrix``.
+
+The matrix is filled with ``backup_matrix.RemoteFileReport()`` and then
+``backup_matrix.ScanMissingBlocks()``, ``backup_matrix.GetWeakRemoteBlock()``
+and ``backup_matrix.GetBackupRemoteStats()`` are measured as they are.
+The old implementation of same functions is copied here from the version
+of ``backup_matrix`` where matrix was a dictionary of lists, both are
+called with same reports and results are compared.
+
+``backup_matrix.GetActiveArray()`` is replaced here with a fixed list
+because online state of suppliers is not known without network.
+
+    python storage/benchmark.py
+"""
+
+import os
+import sys
+import time
+import random
+
+if __name__ == '__main__':
+    dirpath = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sys.path.insert(0, os.path.abspath(os.path.join(dirpath, '..')))
+
+from lib import getsizeof
+from lib import packetid
+
+from contacts import contactsdb
+
+from storage import backup_matrix
+
+#------------------------------------------------------------------------------
+
+BACKUP_ID = 'master$alice@127.0.0.1:0/0/1/F20180101000000AM'
+
+MATRIX_SIZES = [
+    # (suppliers, blocks)
+    (4, 100),
+    (7, 1000),
+    (18, 1000),
+    (26, 10000),
+    (64, 10000),
+]
+
+#------------------------------------------------------------------------------
+
+_OldRemoteFiles = {}
+_OldRemoteMaxBlockNumbers = {}
+_OldLocalMaxBlockNumbers = {}
+
+#------------------------------------------------------------------------------
+
+
+def OldRemoteFileReport(backupID, blockNum, supplierNum, dataORparity, result):
+    blockNum = int(blockNum)
+    supplierNum = int(supplierNum)
+    customer_idurl = packetid.CustomerIDURL(backupID)
+    if supplierNum > contactsdb.num_suppliers(customer_idurl=customer_idurl):
+        return
+    if backupID not in _OldRemoteFiles:
+        _OldRemoteFiles[backupID] = {}
+    if blockNum not in _OldRemoteFiles[backupID]:
+        _OldRemoteFiles[backupID][blockNum] = {
+            'D': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl),
+            'P': [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl), }
+    flag = 1 if result else 0
+    if dataORparity == 'Data':
+        _OldRemoteFiles[backupID][blockNum]['D'][supplierNum] = flag
+    elif dataORparity == 'Parity':
+        _OldRemoteFiles[backupID][blockNum]['P'][supplierNum] = flag
+    _OldRemoteMaxBlockNumbers[backupID] = max(_OldRemoteMaxBlockNumbers.get(backupID, -1), blockNum)
+
+
+def OldGetRemoteDataArray(backupID, blockNum):
+    customer_idurl = packetid.CustomerIDURL(backupID)
+    if backupID not in _OldRemoteFiles:
+        return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
+    if blockNum not in _OldRemoteFiles[backupID]:
+        return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
+    return _OldRemoteFiles[backupID][blockNum]['D']
+
+
+def OldGetRemoteParityArray(backupID, blockNum):
+    customer_idurl = packetid.CustomerIDURL(backupID)
+    if backupID not in _OldRemoteFiles:
+        return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
+    if blockNum not in _OldRemoteFiles[backupID]:
+        return [0] * contactsdb.num_suppliers(customer_idurl=customer_idurl)
+    return _OldRemoteFiles[backupID][blockNum]['P']
+
+
+def OldGetKnownMaxBlockNum(backupID):
+    return max(_OldRemoteMaxBlockNumbers.get(backupID, -1),
+               _OldLocalMaxBlockNumbers.get(backupID, -1))
+
+
+def OldScanMissingBlocks(backupID):
+    # only "remote info found" branch, there is no local info here
+    customer_idurl = packetid.CustomerIDURL(backupID)
+    missingBlocks = set()
+    localMaxBlockNum = _OldLocalMaxBlockNumbers.get(backupID, -1)
+    remoteMaxBlockNum = _OldRemoteMaxBlockNumbers.get(backupID, -1)
+    supplierActiveArray = backup_matrix.GetActiveArray(customer_idurl=customer_idurl)
+    maxBlockNum = max(remoteMaxBlockNum, localMaxBlockNum)
+    for blockNum in xrange(maxBlockNum + 1):
+        if blockNum not in _OldRemoteFiles[backupID]:
+            missingBlocks.add(blockNum)
+            continue
+        remoteData = OldGetRemoteDataArray(backupID, blockNum)
+        remoteParity = OldGetRemoteParityArray(backupID, blockNum)
+        for supplierNum in xrange(len(supplierActiveArray)):
+            if supplierActiveArray[supplierNum] != 1:
+                continue
+            if supplierNum >= len(remoteData) or supplierNum >= len(remoteParity):
+                missingBlocks.add(blockNum)
+                continue
+            if remoteData[supplierNum] != 1:
+                missingBlocks.add(blockNum)
+            if remoteParity[supplierNum] != 1:
+                missingBlocks.add(blockNum)
+    return list(missingBlocks)
+
+
+def OldGetBackupRemoteStats(backupID, only_available_files=True):
+    if backupID not in _OldRemoteFiles:
+        return -1, 0, -1, 0
+    maxBlockNum = OldGetKnownMaxBlockNum(backupID)
+    if maxBlockNum == -1:
+        return -1, 0, -1, 0
+    customer_idurl = packetid.CustomerIDURL(backupID)
+    supplierCount = contactsdb.num_suppliers(customer_idurl=customer_idurl)
+    fileCounter = 0
+    weakBlockNum = -1
+    lessSuppliers = supplierCount
+    activeArray = backup_matrix.GetActiveArray(customer_idurl=customer_idurl)
+    for blockNum in xrange(maxBlockNum + 1):
+        if blockNum not in _OldRemoteFiles[backupID].keys():
+            lessSuppliers = 0
+            weakBlockNum = blockNum
+            continue
+        goodSuppliers = supplierCount
+        for supplierNum in xrange(supplierCount):
+            if activeArray[supplierNum] != 1 and only_available_files:
+                goodSuppliers -= 1
+                continue
+            try:
+                _OldRemoteFiles[backupID][blockNum]['D'][supplierNum]
+                _OldRemoteFiles[backupID][blockNum]['D'][supplierNum]
+            except:
+                goodSuppliers -= 1
+                continue
+            if _OldRemoteFiles[backupID][blockNum]['D'][supplierNum] != 1 or _OldRemoteFiles[backupID][blockNum]['P'][supplierNum] != 1:
+                goodSuppliers -= 1
+            if _OldRemoteFiles[backupID][blockNum]['D'][supplierNum] == 1:
+                fileCounter += 1
+            if _OldRemoteFiles[backupID][blockNum]['P'][supplierNum] == 1:
+                fileCounter += 1
+        if goodSuppliers < lessSuppliers:
+            lessSuppliers = goodSuppliers
+            weakBlockNum = blockNum
+    return (
+        maxBlockNum + 1,
+        100.0 * 0.5 * fileCounter / ((maxBlockNum + 1) * supplierCount),
+        weakBlockNum,
+        100.0 * float(lessSuppliers) / float(supplierCount),
+    )
+
+
+def OldGetWeakRemoteBlock(backupID):
+    customer_idurl = packetid.CustomerIDURL(backupID)
+    supplierCount = contactsdb.num_suppliers(customer_idurl=customer_idurl)
+    if backupID not in _OldRemoteFiles:
+        return -1, 0, supplierCount
+    maxBlockNum = OldGetKnownMaxBlockNum(backupID)
+    weakBlockNum = -1
+    lessSuppliers = supplierCount
+    activeArray = backup_matrix.GetActiveArray(customer_idurl=customer_idurl)
+    for blockNum in xrange(maxBlockNum + 1):
+        if blockNum not in _OldRemoteFiles[backupID].keys():
+            return blockNum, 0, supplierCount
+        goodSuppliers = supplierCount
+        for supplierNum in xrange(supplierCount):
+            if activeArray[supplierNum] != 1:
+                goodSuppliers -= 1
+                continue
+            if _OldRemoteFiles[backupID][blockNum]['D'][supplierNum] != 1 or _OldRemoteFiles[backupID][blockNum]['P'][supplierNum] != 1:
+                goodSuppliers -= 1
+        if goodSuppliers < lessSuppliers:
+            lessSuppliers = goodSuppliers
+            weakBlockNum = blockNum
+    return weakBlockNum, lessSuppliers, supplierCount
+
+#------------------------------------------------------------------------------
+
+
+def _prepare(suppliers, blocks):
+    customer_idurl = packetid.CustomerIDURL(BACKUP_ID)
+    contactsdb.set_suppliers(['http://127.0.0.1/supplier%d.xml' % i for i in xrange(suppliers)],
+                             customer_idurl=customer_idurl)
+    active = [1, ] * suppliers
+    active[0] = 0
+    backup_matrix.GetActiveArray = lambda customer_idurl=None: active
+    backup_matrix.EraseBackupRemoteInfo(BACKUP_ID)
+    _OldRemoteFiles.clear()
+    _OldRemoteMaxBlockNumbers.clear()
+    random.seed(suppliers * blocks)
+    for blockNum in xrange(blocks):
+        for supplierNum in xrange(suppliers):
+            for dataORparity in ('Data', 'Parity', ):
+                result = random.random() > 0.05
+                backup_matrix.RemoteFileReport(BACKUP_ID, blockNum, supplierNum, dataORparity, result)
+                OldRemoteFileReport(BACKUP_ID, blockNum, supplierNum, dataORparity, result)
+
+
+def _matrix_size(matrix):
+    return getsizeof.total_size(matrix, handlers={
+        backup_matrix.BlocksMatrix: lambda m: iter([m.__dict__, ]),
+    })
+
+
+def _measure(func, *args):
+    count = 0
+    t = time.time()
+    while True:
+        result = func(*args)
+        count += 1
+        dt = time.time() - t
+        if dt > 0.5:
+            break
+    return result, dt / count
+
+
+def main():
+    print '%10s %8s %24s %14s %14s %12s %12s  %s' % (
+        'suppliers', 'blocks', 'function', 'dict bytes', 'bitset bytes', 'dict ms', 'bitset ms', 'same')
+    for suppliers, blocks in MATRIX_SIZES:
+        _prepare(suppliers, blocks)
+        old_size = getsizeof.total_size(_OldRemoteFiles[BACKUP_ID])
+        new_size = _matrix_size(backup_matrix.remote_files()[BACKUP_ID])
+        for name, old_func, new_func in [
+            ('ScanMissingBlocks', lambda: sorted(OldScanMissingBlocks(BACKUP_ID)),
+                lambda: sorted(backup_matrix.ScanMissingBlocks(BACKUP_ID))),
+            ('GetWeakRemoteBlock', lambda: OldGetWeakRemoteBlock(BACKUP_ID),
+                lambda: backup_matrix.GetWeakRemoteBlock(BACKUP_ID)),
+            ('GetBackupRemoteStats', lambda: OldGetBackupRemoteStats(BACKUP_ID),
+                lambda: backup_matrix.GetBackupRemoteStats(BACKUP_ID)),
+        ]:
+            old_result, old_time = _measure(old_func)
+            new_result, new_time = _measure(new_func)
+            print '%10d %8d %24s %14d %14d %12.3f %12.3f  %s' % (
+                suppliers, blocks, name, old_size, new_size,
+                old_time * 1000.0, new_time * 1000.0, old_result == new_result)
+
+
+if __name__ == "__main__":
+    main()
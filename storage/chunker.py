@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# chunker.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (chunker.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: chunker.
+
+Content-defined chunking of the backup data stream.
+
+Fixed size blocks are shifted by any insertion or removal in the middle
+of the stream and every block after that point looks new.
+Here the block boundaries are chosen by the content itself,
+so after a local change the stream "re-synchronizes" on the same boundaries
+and unchanged blocks get the same hash as in the previous version.
+
+Rolling the hash over every single byte is too slow in pure Python,
+so only positions right after an "anchor" byte (zero byte or a new line) are tested:
+they are found with a compiled regular expression in C code.
+The position is a boundary when CRC32 of the ``WINDOW_SIZE`` bytes before
+it matches the mask - so it depends only on the local content.
+
+If no boundary is found the block is cut at the maximum size.
+"""
+
+#------------------------------------------------------------------------------
+
+import re
+import zlib
+import hashlib
+
+#------------------------------------------------------------------------------
+
+WINDOW_SIZE = 32
+
+# bytes after which a block boundary is possible
+_AnchorsRE = re.compile('[\x00\n]')
+
+# about one of 128 bytes is an anchor in random binary data
+_AnchorsDensity = 128
+
+#------------------------------------------------------------------------------
+
+
+def min_size(block_size):
+    """
+    Block can not be smaller than that, except the last one.
+    """
+    return max(WINDOW_SIZE, block_size / 2)
+
+
+def max_size(block_size):
+    """
+    Block is cut here if no boundary was found.
+    """
+    return max(WINDOW_SIZE * 2, block_size * 2)
+
+
+def make_mask(block_size):
+    """
+    Return a mask to get blocks of about ``block_size`` bytes in average.
+    """
+    anchors = max(1, (block_size - min_size(block_size)) / _AnchorsDensity)
+    mask = 1
+    while mask * 2 <= anchors:
+        mask *= 2
+    return mask - 1
+
+
+def find_boundary(data, minsize, maxsize, mask):
+    """
+    Return position in ``data`` where current block must be cut.
+
+    Returns ``len(data)`` if data is shorter than ``maxsize`` and
+    no boundary was found - more data must be read in that case.
+    """
+    end = min(len(data), maxsize)
+    if end <= minsize:
+        return len(data)
+    for m in _AnchorsRE.finditer(data, minsize - 1, end - 1):
+        pos = m.end()
+        if zlib.crc32(data[pos - WINDOW_SIZE:pos]) & mask == 0:
+            return pos
+    return end
+
+
+def split(data, block_size):
+    """
+    Split whole string into a list of content-defined blocks.
+    """
+    minsize = min_size(block_size)
+    maxsize = max_size(block_size)
+    mask = make_mask(block_size)
+    blocks = []
+    offset = 0
+    while offset < len(data):
+        pos = find_boundary(data[offset:offset + maxsize], minsize, maxsize, mask)
+        blocks.append(data[offset:offset + pos])
+        offset += pos
+    return blocks
+
+
+def block_hash(data):
+    """
+    Strong hash of the block data, used as a key in the ``dedup_index``.
+    """
+    return hashlib.sha256(data).hexdigest()
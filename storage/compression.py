@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# compression.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (compression.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: compression.
+
+Compression of separate files inside the backup ".tar" stream.
+
+This is used by ``main.bppipe`` child process, so only standard modules
+are imported here and nothing must be printed to stdout.
+
+Compression mode is a string:
+
+    + "none", "gz" or "bz2" - whole tar stream is compressed by ``tarfile`` module (old way)
+    + "<codec>:<level>", for example "zlib:1" - every file is compressed separately
+
+In the second case:
+
+    + files with known extensions of already compressed formats and files where
+      sample of data has high entropy are stored as is
+    + data is split into frames which are compressed independently,
+      so several threads can work on a big file at once - ``zlib`` and ``bz2``
+      release the GIL while compressing
+    + a change in one file does not affect compressed data of other files,
+      so ``storage.chunker`` still finds unchanged blocks in the stream
+
+Compressed file is stored in the archive with the compressed size and
+the mode is written into "BITDUST.compression" field of PAX header of
+that member - restore is picking the right decoder from there.
+Mode is also written into the global PAX header of the archive.
+"""
+
+#------------------------------------------------------------------------------
+
+import os
+import bz2
+import math
+import zlib
+import struct
+import collections
+
+try:
+    import lz4.block as _lz4
+except:
+    _lz4 = None
+
+#------------------------------------------------------------------------------
+
+PAX_HEADER = 'BITDUST.compression'
+
+# global header of the whole archive, values from there are copied to every member by ``tarfile``
+PAX_ARCHIVE_HEADER = 'BITDUST.archive-compression'
+
+STREAM_MODES = ['none', 'gz', 'bz2', ]
+
+FRAME_SIZE = 1024 * 1024
+
+SAMPLE_SIZE = 32 * 1024
+
+# bits per byte, compressed data and media files are close to 8.0
+ENTROPY_LIMIT = 7.5
+
+# files smaller than one tar record are not worth it
+MIN_FILE_SIZE = 512
+
+COMPRESSED_EXTENSIONS = frozenset([
+    '.7z', '.apk', '.avi', '.bz2', '.docx', '.flac', '.gif', '.gz', '.jar',
+    '.jpeg', '.jpg', '.lz4', '.m4a', '.m4v', '.mkv', '.mov', '.mp3', '.mp4',
+    '.odt', '.ods', '.ogg', '.png', '.pptx', '.rar', '.tgz', '.webm', '.webp',
+    '.xlsx', '.xz', '.zip', '.zst',
+])
+
+_FrameHeader = struct.Struct('>cI')
+
+#------------------------------------------------------------------------------
+
+_Codecs = {
+    'zlib': (
+        lambda data, level: zlib.compress(data, level),
+        zlib.decompress,
+    ),
+    'bz2': (
+        lambda data, level: bz2.compress(data, level),
+        bz2.decompress,
+    ),
+}
+
+if _lz4 is not None:
+    _Codecs['lz4'] = (
+        lambda data, level: _lz4.compress(data, mode='high_compression', compression=level) if level > 1 else _lz4.compress(data),
+        _lz4.decompress,
+    )
+
+#------------------------------------------------------------------------------
+
+
+def modes():
+    """
+    List of all modes available here, sorted from fastest to strongest.
+    """
+    result = list(STREAM_MODES)
+    if 'lz4' in _Codecs:
+        result.append('lz4:1')
+    result.extend(['zlib:1', 'zlib:6', 'zlib:9', 'bz2:9', ])
+    return result
+
+
+def is_file_mode(mode):
+    """
+    Return True if files are compressed separately in that mode.
+    """
+    return ':' in (mode or '')
+
+
+def is_available(mode):
+    if mode in STREAM_MODES:
+        return True
+    codec, _, level = (mode or '').partition(':')
+    return codec in _Codecs and level.isdigit()
+
+
+def parse_mode(mode):
+    """
+    Return codec name and level from string like "zlib:1".
+    """
+    codec, _, level = mode.partition(':')
+    return codec, int(level)
+
+#------------------------------------------------------------------------------
+
+
+def entropy(data):
+    """
+    Shannon entropy of the data in bits per byte.
+    """
+    if not data:
+        return 0.0
+    total = float(len(data))
+    result = 0.0
+    for i in xrange(256):
+        count = data.count(chr(i))
+        if count:
+            p = count / total
+            result -= p * math.log(p, 2)
+    return result
+
+
+def read_sample(fileobj, size):
+    """
+    Read a piece of data from the beginning and from the middle of a file
+    and seek back to the start.
+    """
+    sample = fileobj.read(SAMPLE_SIZE / 2)
+    if size > SAMPLE_SIZE:
+        fileobj.seek(size / 2)
+        sample += fileobj.read(SAMPLE_SIZE / 2)
+    fileobj.seek(0)
+    return sample
+
+
+def should_compress(filename, size, sample):
+    """
+    Decide to compress given file or store it as is.
+    """
+    if size < MIN_FILE_SIZE:
+        return False
+    if os.path.splitext(filename)[1].lower() in COMPRESSED_EXTENSIONS:
+        return False
+    return entropy(sample) < ENTROPY_LIMIT
+
+#------------------------------------------------------------------------------
+
+
+def encode_frame(codec, level, data):
+    """
+    Compress one frame, frame is kept as is if it does not become smaller.
+    """
+    compressed = _Codecs[codec][0](data, level)
+    if len(compressed) >= len(data):
+        return _FrameHeader.pack('R', len(data)) + data
+    return _FrameHeader.pack('C', len(compressed)) + compressed
+
+
+def compress_file(fin, fout, mode, threads=1, pool=None):
+    """
+    Read all data from ``fin`` and write compressed frames to ``fout``.
+
+    If ``threads`` is more than 1 a ``multiprocessing.pool.ThreadPool``
+    object must be passed in ``pool`` - up to ``2 * threads`` frames are
+    compressed at once, frames are written in the same order.
+    Returns number of bytes read.
+    """
+    codec, level = parse_mode(mode)
+    total = 0
+    if threads <= 1 or pool is None:
+        while True:
+            data = fin.read(FRAME_SIZE)
+            if not data:
+                break
+            total += len(data)
+            fout.write(encode_frame(codec, level, data))
+        return total
+    pending = collections.deque()
+    while True:
+        data = fin.read(FRAME_SIZE)
+        total += len(data)
+        if data:
+            pending.append(pool.apply_async(encode_frame, (codec, level, data, )))
+        while pending and (len(pending) >= threads * 2 or not data):
+            fout.write(pending.popleft().get())
+        if not data:
+            break
+    return total
+
+
+def decompress_file(fin, fout, mode):
+    """
+    Read compressed frames from ``fin`` and write original data to ``fout``.
+    """
+    codec, _ = parse_mode(mode)
+    decompress = _Codecs[codec][1]
+    while True:
+        header = fin.read(_FrameHeader.size)
+        if not header:
+            break
+        kind, length = _FrameHeader.unpack(header)
+        data = fin.read(length)
+        if len(data) != length:
+            raise IOError('compressed data is truncated')
+        if kind == 'C':
+            data = decompress(data)
+        elif kind != 'R':
+            raise IOError('unknown frame type: %r' % kind)
+        fout.write(data)
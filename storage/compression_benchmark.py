@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# compression_benchmark.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (compression_benchmark.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: compression_benchmark.
+
+Measure throughput and ratio of compression modes from ``storage.compression``
+on several typical kinds of data, in one and in several threads.
+
+Data which is not worth compressing is detected by sampling and stored as is,
+the "skip" column shows that. Stream "gz" and "bz2" modes of the old code
+are the same as "zlib:6" and "bz2:9" without skipping in one thread.
+
+    python storage/compression_benchmark.py [data size in Mb] [threads]
+"""
+
+import os
+import sys
+import time
+import random
+import struct
+import cStringIO
+
+if __name__ == '__main__':
+    dirpath = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sys.path.insert(0, os.path.abspath(os.path.join(dirpath, '..')))
+
+from multiprocessing.pool import ThreadPool
+
+from storage import compression
+
+#------------------------------------------------------------------------------
+
+
+def _make_text(size):
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        line = '2018-01-01 12:%02d:%02d INFO request %d from 10.0.%d.%d took %.3f ms\n' % (
+            (i / 60) % 60, i % 60, i, random.randint(0, 255), random.randint(0, 255), random.random() * 100)
+        lines.append(line)
+        total += len(line)
+        i += 1
+    return ''.join(lines)[:size]
+
+
+def _make_source_code(size):
+    rootdir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    parts = []
+    total = 0
+    for dirpath, _, filenames in os.walk(rootdir):
+        for filename in sorted(filenames):
+            if not filename.endswith('.py'):
+                continue
+            parts.append(open(os.path.join(dirpath, filename), 'rb').read())
+            total += len(parts[-1])
+            if total >= size:
+                return ''.join(parts)[:size]
+    data = ''.join(parts)
+    return (data * (size / max(1, len(data)) + 1))[:size]
+
+
+def _make_records(size):
+    # binary database-like records: many zeros and small numbers
+    return ''.join([
+        struct.pack('>IIdH10x', i, random.randint(0, 1000), random.random(), random.randint(0, 3))
+        for i in xrange(size / 32 + 1)])[:size]
+
+
+def _make_media(size):
+    # already compressed data looks like random bytes
+    return os.urandom(size)
+
+
+DATASETS = [
+    ('text log', _make_text),
+    ('source code', _make_source_code),
+    ('records', _make_records),
+    ('media', _make_media),
+]
+
+#------------------------------------------------------------------------------
+
+
+def _compress(data, mode, threads, pool):
+    skip = not compression.should_compress('file', len(data), compression.read_sample(cStringIO.StringIO(data), len(data)))
+    if skip:
+        return len(data), True
+    fout = cStringIO.StringIO()
+    compression.compress_file(cStringIO.StringIO(data), fout, mode, threads, pool)
+    return fout.tell(), False
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    size *= 1024 * 1024
+    random.seed(size)
+    pool = ThreadPool(threads)
+    modes = [m for m in compression.modes() if compression.is_file_mode(m)]
+    print '%12s %8s %8s %10s %8s %6s' % ('data', 'mode', 'threads', 'Mb/s', 'ratio', 'skip')
+    for name, func in DATASETS:
+        data = func(size)
+        for mode in modes:
+            for thr in sorted(set([1, threads])):
+                t = time.time()
+                compressed_size, skipped = _compress(data, mode, thr, pool)
+                dt = time.time() - t
+                print '%12s %8s %8d %10.1f %8.3f %6s' % (
+                    name, mode, thr, len(data) / dt / 1024.0 / 1024.0, float(compressed_size) / len(data), skipped)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
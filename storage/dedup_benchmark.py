@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# dedup_benchmark.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (dedup_benchmark.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: dedup_benchmark.
+
+Measure how many bytes must be uploaded for a new version of same data
+depending on how much of it was changed since previous version:
+with fixed size blocks (old way) and with content-defined blocks
+from ``storage.chunker`` where unchanged blocks are only referenced.
+
+Changes are random insertions, removals and overwrites of small pieces,
+the last block of the version is always uploaded.
+
+Deduplication works with whole blocks, so every changed piece costs
+about one block to upload: when changes are spread over the data
+the saving quickly goes down with growing change ratio,
+run it again with smaller block size to compare.
+
+    python storage/dedup_benchmark.py [data size in Mb] [block size in Kb]
+"""
+
+import os
+import sys
+import time
+import random
+
+if __name__ == '__main__':
+    dirpath = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sys.path.insert(0, os.path.abspath(os.path.join(dirpath, '..')))
+
+from storage import chunker
+
+#------------------------------------------------------------------------------
+
+CHANGE_RATIOS = [
+    0.0,
+    0.0001,
+    0.001,
+    0.01,
+    0.05,
+    0.2,
+]
+
+EDIT_SIZE = 4 * 1024
+
+#------------------------------------------------------------------------------
+
+
+def _split_fixed(data, block_size):
+    return [data[i:i + block_size] for i in xrange(0, len(data), block_size)]
+
+
+def _change(data, ratio):
+    """
+    Return a copy of ``data`` where about ``ratio`` of bytes were touched.
+    """
+    edits = int(len(data) * ratio / EDIT_SIZE)
+    if ratio and not edits:
+        edits = 1
+    positions = sorted([random.randint(0, len(data)) for _ in xrange(edits)])
+    parts = []
+    last = 0
+    for pos in positions:
+        if pos < last:
+            continue
+        parts.append(data[last:pos])
+        kind = random.choice(('insert', 'remove', 'overwrite', ))
+        if kind == 'insert':
+            parts.append(os.urandom(EDIT_SIZE))
+            last = pos
+        elif kind == 'remove':
+            last = pos + EDIT_SIZE
+        else:
+            parts.append(os.urandom(EDIT_SIZE))
+            last = pos + EDIT_SIZE
+    parts.append(data[last:])
+    return ''.join(parts)
+
+
+def _uploaded(old_blocks, new_blocks):
+    known = set(map(chunker.block_hash, old_blocks[:-1]))
+    total = 0
+    for block in new_blocks[:-1]:
+        if chunker.block_hash(block) not in known:
+            total += len(block)
+    return total + len(new_blocks[-1])
+
+
+def main():
+    data_size = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    data_size *= 1024 * 1024
+    block_size *= 1024
+    random.seed(data_size + block_size)
+    # half random data and half text, to have both kinds of anchor densities
+    data = os.urandom(data_size / 2) + ''.join([
+        'line %d of a text file, %s\n' % (i, random.random()) for i in xrange(data_size / 64)])[:data_size / 2]
+    t = time.time()
+    old_cdc = chunker.split(data, block_size)
+    dt = time.time() - t
+    old_fixed = _split_fixed(data, block_size)
+    print 'data %d bytes, block size %d bytes' % (len(data), block_size)
+    print 'content-defined chunking: %.1f Mb/s, %d blocks, %d bytes in average' % (
+        len(data) / dt / 1024.0 / 1024.0, len(old_cdc), len(data) / len(old_cdc))
+    print
+    print '%10s %14s %14s %14s %8s' % ('changed', 'version bytes', 'fixed bytes', 'chunker bytes', 'ratio')
+    for ratio in CHANGE_RATIOS:
+        newdata = _change(data, ratio)
+        fixed = _uploaded(old_fixed, _split_fixed(newdata, block_size))
+        cdc = _uploaded(old_cdc, chunker.split(newdata, block_size))
+        print '%9.2f%% %14d %14d %14d %8.2f' % (
+            ratio * 100.0, len(newdata), fixed, cdc, float(fixed) / cdc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# dedup_index.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (dedup_index.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: dedup_index.
+
+Keeps hashes of all blocks already stored on suppliers for every backed up path,
+so new version of the same path can refer to the unchanged blocks
+of older versions instead of uploading them again.
+
+Only "real" blocks are indexed, never the last block of the version and never
+the blocks which are references themselves - so there is only one step to follow
+during restore.
+
+Index also knows which versions are referenced by the newer ones,
+see ``is_referenced()``. Reference made by a running backup is counted as soon as
+``lookup()`` found the block, so older version can not be released in the middle. Such version can still be removed from the catalog by the user
+or by the "max copies" limit, but it is only "retired" here: its data stays on
+suppliers until the last version referring to it is removed, see ``retire()``
+and ``version_removed()``.
+
+Deduplication unit is a whole backup block: a block is skipped only if
+exactly same block (same content-defined boundaries and same data) was already stored.
+Any change inside a block makes the whole block new, so with big blocks even
+a small scattered change (few percent of the data) gives almost no saving -
+smaller "services/backups/block-size" gives better deduplication for such data,
+but more blocks to store and to track on suppliers.
+
+All changes are appended to a journal file in the "metadata" folder
+and index is restored from there after restart, see ``system.journal_file``.
+"""
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+from logs import lg
+
+from system import journal_file
+
+from main import settings
+
+#------------------------------------------------------------------------------
+
+# path ID -> {block hash: (version, block number, length)}
+_Blocks = {}
+# path ID -> {version: set of block hashes stored in that version}
+_VersionBlocks = {}
+# path ID -> {version: set of older versions it refers to}
+_References = {}
+# path ID -> set of versions removed from the catalog, but still referenced by newer versions
+_Retired = {}
+# path ID -> {version: set of older versions}, references of backups which are running now
+_Pending = {}
+
+_Journal = journal_file.JournalFile(
+    lambda: settings.DedupIndexFile(),
+    lambda: _snapshot_lines(),
+    lambda: _records_total(),
+)
+
+#------------------------------------------------------------------------------
+
+
+def init():
+    lg.out(4, 'dedup_index.init')
+    return load()
+
+
+def shutdown():
+    lg.out(4, 'dedup_index.shutdown')
+    _Journal.close()
+
+#------------------------------------------------------------------------------
+
+
+def lookup(backupID, digest):
+    """
+    Search the block with given hash in older versions of same path.
+
+    Return a tuple (version, block number, length) or None.
+    Found version is referenced by ``backupID`` from now on, until
+    ``version_done()`` or ``version_aborted()`` is called.
+    """
+    pathID, version = _split(backupID)
+    info = _Blocks.get(pathID, {}).get(digest)
+    if info is None or info[0] == version:
+        return None
+    _Pending.setdefault(pathID, {}).setdefault(version, set()).add(info[0])
+    return info
+
+
+def is_referenced(backupID):
+    """
+    Return True if blocks of that version are used by other versions of same path,
+    including backups which are running now.
+    """
+    pathID, version = _split(backupID)
+    for path_references in (_References.get(pathID, {}), _Pending.get(pathID, {}), ):
+        for other_version, sources in path_references.items():
+            if other_version != version and version in sources:
+                return True
+    return False
+
+
+def version_done(backupID, blocks, sources):
+    """
+    Must be called when backup was successfully finished.
+
+    ``blocks`` is a list of tuples (block hash, block number, length) of
+    all blocks stored in that version, ``sources`` is a set of older
+    versions it refers to.
+
+    Returns False if some of those older versions are not known anymore:
+    such version can not be restored and must be removed.
+    """
+    pathID, version = _split(backupID)
+    if not pathID:
+        lg.warn('incorrect backup ID: %s' % backupID)
+        return False
+    _pop_pending(pathID, version)
+    missed = [source for source in sources if source not in _VersionBlocks.get(pathID, {})]
+    if missed:
+        lg.err('%s refers to versions %s which are not in the index anymore' % (backupID, missed))
+        return False
+    lines = []
+    for digest, blockNum, length in blocks:
+        if _add_block(pathID, version, digest, blockNum, length):
+            lines.append('+ %s %d %d %s' % (digest, blockNum, length, backupID))
+    for source in sources:
+        _add_reference(pathID, version, source)
+        lines.append('r %s %s' % (source, backupID))
+    if lines:
+        _Journal.write(lines)
+    if _Debug:
+        lg.out(_DebugLevel, 'dedup_index.version_done %s with %d blocks, refers to %s' % (
+            backupID, len(blocks), sources))
+    return True
+
+
+def version_aborted(backupID):
+    """
+    Must be called when backup was not finished, references found by ``lookup()`` are not needed.
+    """
+    pathID, version = _split(backupID)
+    _pop_pending(pathID, version)
+
+
+def is_retired(backupID):
+    """
+    Return True if that version was removed from the catalog,
+    but its data is still needed for newer versions.
+    """
+    pathID, version = _split(backupID)
+    return version in _Retired.get(pathID, set())
+
+
+def retired_backups():
+    """
+    Return a list of backup IDs of all retired versions.
+    """
+    result = []
+    for pathID, versions in _Retired.items():
+        for version in versions:
+            result.append('%s/%s' % (pathID, version))
+    return result
+
+
+def retire(backupID):
+    """
+    Must be called instead of ``version_removed()`` when a version referenced
+    by newer versions was removed from the catalog.
+
+    Blocks of that version are still used for restore and can be referred again,
+    version is removed here completely when it is not referenced anymore.
+    """
+    pathID, version = _split(backupID)
+    if not pathID:
+        lg.warn('incorrect backup ID: %s' % backupID)
+        return False
+    _Retired.setdefault(pathID, set()).add(version)
+    _Journal.write(['d %s' % backupID, ])
+    if _Debug:
+        lg.out(_DebugLevel, 'dedup_index.retire %s' % backupID)
+    return True
+
+
+def version_removed(backupID):
+    """
+    Must be called after a version was removed from the catalog.
+
+    Returns a list of retired versions which were needed only for that
+    one, they are removed from the index too and their remote data can be erased.
+    """
+    pathID, version = _split(backupID)
+    lines = []
+    if _remove_version(pathID, version):
+        lines.append('x %s' % backupID)
+    released = []
+    while True:
+        # retired version can refer to another retired version
+        unused = [v for v in _Retired.get(pathID, set()) if not is_referenced('%s/%s' % (pathID, v))]
+        if not unused:
+            break
+        for retired_version in unused:
+            _remove_version(pathID, retired_version)
+            lines.append('x %s/%s' % (pathID, retired_version))
+            released.append('%s/%s' % (pathID, retired_version))
+    if lines:
+        _Journal.write(lines)
+    if _Debug:
+        lg.out(_DebugLevel, 'dedup_index.version_removed %s, released %s' % (backupID, released))
+    return released
+
+
+def clear():
+    """
+    Forget all blocks of all paths, used when all backups are going to be removed.
+    """
+    _clear()
+    _Journal.save_snapshot()
+
+#------------------------------------------------------------------------------
+
+
+def load():
+    """
+    Read journal file and restore the index.
+    """
+    _clear()
+    if not _Journal.read(_apply_record):
+        _clear()
+        return False
+    _Journal.compact()
+    lg.out(4, 'dedup_index.load %d paths, %d blocks, %d journal records' % (
+        len(_Blocks), _blocks_total(), _Journal.records))
+    return True
+
+
+def _apply_record(line):
+    if line.startswith('+ '):
+        _, digest, blockNum, length, backupID = line.split(' ', 4)
+        pathID, version = _split(backupID)
+        _add_block(pathID, version, digest, int(blockNum), int(length))
+    elif line.startswith('r '):
+        _, source, backupID = line.split(' ', 2)
+        pathID, version = _split(backupID)
+        _add_reference(pathID, version, source)
+    elif line.startswith('d '):
+        pathID, version = _split(line[2:])
+        _Retired.setdefault(pathID, set()).add(version)
+    elif line.startswith('x '):
+        _remove_version(*_split(line[2:]))
+
+
+def _snapshot_lines():
+    lines = []
+    for pathID, path_blocks in _Blocks.items():
+        for digest, (version, blockNum, length) in path_blocks.items():
+            lines.append('+ %s %d %d %s/%s' % (digest, blockNum, length, pathID, version))
+    for pathID, path_references in _References.items():
+        for version, sources in path_references.items():
+            for source in sources:
+                lines.append('r %s %s/%s' % (source, pathID, version))
+    for pathID, versions in _Retired.items():
+        for version in versions:
+            lines.append('d %s/%s' % (pathID, version))
+    return lines
+
+#------------------------------------------------------------------------------
+
+
+def _clear():
+    _Blocks.clear()
+    _VersionBlocks.clear()
+    _References.clear()
+    _Retired.clear()
+    _Pending.clear()
+
+
+def _blocks_total():
+    return sum(map(len, _Blocks.values()))
+
+
+def _records_total():
+    return _blocks_total() + sum([sum(map(len, r.values())) for r in _References.values()]) + sum(map(len, _Retired.values()))
+
+
+def _split(backupID):
+    pathID, _, version = backupID.rpartition('/')
+    if pathID and '$' not in pathID:
+        pathID = 'master$' + pathID
+    return pathID, version
+
+
+def _add_block(pathID, version, digest, blockNum, length):
+    path_blocks = _Blocks.setdefault(pathID, {})
+    if digest in path_blocks:
+        # keep the oldest copy, it is already referenced by someone probably
+        return False
+    path_blocks[digest] = (version, blockNum, length)
+    _VersionBlocks.setdefault(pathID, {}).setdefault(version, set()).add(digest)
+    return True
+
+
+def _add_reference(pathID, version, source):
+    _References.setdefault(pathID, {}).setdefault(version, set()).add(source)
+
+
+def _pop_pending(pathID, version):
+    _Pending.get(pathID, {}).pop(version, None)
+    if pathID in _Pending and not _Pending[pathID]:
+        _Pending.pop(pathID)
+
+
+def _remove_version(pathID, version):
+    _pop_pending(pathID, version)
+    found = False
+    path_blocks = _Blocks.get(pathID, {})
+    for digest in _VersionBlocks.get(pathID, {}).pop(version, set()):
+        if path_blocks.get(digest, (None, ))[0] == version:
+            path_blocks.pop(digest)
+        found = True
+    if not path_blocks:
+        _Blocks.pop(pathID, None)
+        _VersionBlocks.pop(pathID, None)
+    if _References.get(pathID, {}).pop(version, None) is not None:
+        found = True
+    if pathID in _References and not _References[pathID]:
+        _References.pop(pathID)
+    if version in _Retired.get(pathID, set()):
+        _Retired[pathID].discard(version)
+        if not _Retired[pathID]:
+            _Retired.pop(pathID)
+        found = True
+    return found
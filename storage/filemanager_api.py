@@ -331,7 +331,8 @@ def _delete_version(params):
     if not backup_fs.ExistsID(remotePath, iterID=backup_fs.fsID(global_id.GlobalUserToIDURL(customerGlobalID))):
         return {'result': {"success": False, "error": "path %s not found" % remotePath}}
     if version:
-        backup_control.DeleteBackup(backupID, saveDB=False, calculate=False)
+        if not backup_control.DeleteBackup(backupID, saveDB=False, calculate=False):
+            return {'result': {"success": False, "error": "failed to remove version %s" % backupID}}
     backup_fs.Scan()
     backup_fs.Calculate()
     backup_control.Save()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# index_journal.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (index_journal.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: index_journal.
+
+Journal of changes in the backup data base index.
+
+Full index is written to the "index" file only from time to time - this is a snapshot.
+Every call to ``backup_control.Save()`` compares the ``backup_fs`` tree with its state
+after previous call and appends only changed and removed items to the "index_journal"
+file, one line per revision:
+
+    <revision> {"<customer global ID>": {"set": [<items>], "del": [<path IDs>]}}
+
+Changed and removed items are tracked by ``backup_fs`` itself when the tree is
+modified (see ``backup_fs.PopChanges()``), so only those items are serialized here.
+
+When journal becomes too big comparing to the snapshot, ``backup_control``
+writes a new snapshot and journal starts from scratch.
+Journal is also stored on suppliers next to the snapshot, so after a small change
+only the journal is uploaded and other devices apply the changes incrementally.
+"""
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+import os
+import json
+
+#------------------------------------------------------------------------------
+
+from logs import lg
+
+from system import bpio
+
+from main import settings
+
+from userid import global_id
+
+from storage import backup_fs
+
+#------------------------------------------------------------------------------
+
+# journal is compacted when it is bigger than that part of the snapshot
+SNAPSHOT_RATIO = 4
+
+# but small journals are never compacted
+MIN_JOURNAL_SIZE = 64 * 1024
+
+#------------------------------------------------------------------------------
+
+_Journal = None
+_JournalSize = 0
+_SnapshotRevision = -1
+_SnapshotSize = 0
+
+#------------------------------------------------------------------------------
+
+
+def shutdown():
+    lg.out(4, 'index_journal.shutdown')
+    close_journal()
+
+
+def snapshot_revision():
+    """
+    Revision of the latest snapshot, journal keeps the changes made after it.
+    """
+    return _SnapshotRevision
+
+
+def need_snapshot():
+    """
+    Return True if journal is too big and a new snapshot must be written.
+    """
+    if _SnapshotRevision < 0:
+        return True
+    return _JournalSize > max(MIN_JOURNAL_SIZE, _SnapshotSize / SNAPSHOT_RATIO)
+
+#------------------------------------------------------------------------------
+
+
+def make_delta(encoding='utf-8'):
+    """
+    Return items changed in the ``backup_fs`` tree since previous call.
+
+    Returns a dictionary, see module description, empty if nothing was changed.
+    """
+    delta = {}
+    for customer_idurl, (changed, removed) in backup_fs.PopChanges().items():
+        delta[global_id.UrlToGlobalID(customer_idurl)] = {
+            'set': [info.serialize(encoding=encoding, to_json=True) for info in changed],
+            'del': list(removed),
+        }
+    if _Debug:
+        lg.out(_DebugLevel, 'index_journal.make_delta %d customers changed' % len(delta))
+    return delta
+
+
+def apply_delta(delta, decoding='utf-8'):
+    """
+    Put changes from the journal record into ``backup_fs`` tree.
+
+    Returns number of items changed, raise ``ValueError`` if the tree
+    does not match the changes.
+    """
+    # those changes are already in the journal
+    backup_fs.TrackChanges(False)
+    try:
+        count = _apply_delta(delta, decoding)
+    finally:
+        backup_fs.TrackChanges(True)
+    return count
+
+#------------------------------------------------------------------------------
+
+
+def write(revision, delta):
+    """
+    Append one record to the journal file.
+    """
+    global _JournalSize
+    line = '%d %s\n' % (revision, json.dumps(delta))
+    try:
+        journal = open_journal()
+        journal.write(line)
+        journal.flush()
+    except:
+        lg.exc()
+        return False
+    _JournalSize += len(line)
+    return True
+
+
+def read(filepath=None):
+    """
+    Read the journal file, see ``unpack_records()``.
+    """
+    if filepath is None:
+        filepath = settings.BackupIndexJournalFilePath()
+    return unpack_records(bpio.ReadBinaryFile(filepath))
+
+
+def pack():
+    """
+    Return journal data to be stored on suppliers: the first line keeps
+    revision of the snapshot, journal records are following.
+    """
+    src = bpio.ReadBinaryFile(settings.BackupIndexJournalFilePath())
+    return '%d\n%s' % (_SnapshotRevision, src)
+
+
+def unpack(src):
+    """
+    Opposite to ``pack()``, returns a tuple (snapshot revision, list of records, completed flag).
+    """
+    snapshot_line, _, src = src.partition('\n')
+    records, complete = unpack_records(src)
+    return int(snapshot_line), records, complete
+
+
+def unpack_records(src):
+    """
+    Return a tuple (list of tuples (revision, delta), completed flag).
+
+    Flag is False if some record is broken, only records before it are returned.
+    """
+    records = []
+    if src and not src.endswith('\n'):
+        # last line is broken if the process was killed while writing
+        lg.warn('index journal is not finished')
+        src = src[:src.rfind('\n') + 1]
+        complete = False
+    else:
+        complete = True
+    for line in src.split('\n'):
+        if not line.strip():
+            continue
+        revision, _, raw_delta = line.partition(' ')
+        try:
+            records.append((int(revision), json.loads(raw_delta), ))
+        except:
+            lg.warn('broken record in the index journal: %r' % line[:100])
+            return records, False
+    return records, complete
+
+#------------------------------------------------------------------------------
+
+
+def reset(revision):
+    """
+    Must be called after the snapshot was written: journal starts from scratch
+    and the current state of the tree is remembered.
+    """
+    global _JournalSize
+    close_journal()
+    if not bpio.WriteFile(settings.BackupIndexJournalFilePath(), ''):
+        lg.err('failed cleaning index journal file')
+    _JournalSize = 0
+    loaded(revision)
+
+
+def loaded(revision):
+    """
+    Must be called after the index was read from the snapshot and the journal.
+    """
+    global _SnapshotRevision
+    global _SnapshotSize
+    global _JournalSize
+    _SnapshotRevision = revision
+    try:
+        _SnapshotSize = os.path.getsize(settings.BackupIndexFilePath())
+    except:
+        _SnapshotSize = 0
+    try:
+        _JournalSize = os.path.getsize(settings.BackupIndexJournalFilePath())
+    except:
+        _JournalSize = 0
+    backup_fs.ForgetChanges()
+    lg.out(4, 'index_journal.loaded snapshot revision %d, snapshot %d bytes, journal %d bytes' % (
+        _SnapshotRevision, _SnapshotSize, _JournalSize))
+
+#------------------------------------------------------------------------------
+
+
+def open_journal():
+    global _Journal
+    if _Journal is None:
+        _Journal = open(settings.BackupIndexJournalFilePath(), 'a')
+    return _Journal
+
+
+def close_journal():
+    global _Journal
+    if _Journal is not None:
+        try:
+            _Journal.close()
+        except:
+            lg.exc()
+    _Journal = None
+
+
+def _apply_delta(delta, decoding):
+    count = 0
+    for customer_id, changes in delta.items():
+        customer_idurl = global_id.GlobalUserToIDURL(customer_id)
+        iter = backup_fs.fs(customer_idurl)
+        iterID = backup_fs.fsID(customer_idurl)
+        # childs first when removing and parents first when adding
+        for path_id in sorted(changes.get('del', []), key=lambda p: p.count('/'), reverse=True):
+            backup_fs.DeleteByID(path_id, iter=iter, iterID=iterID)
+            count += 1
+        json_items = changes.get('set', [])
+        json_items.sort(key=lambda i: str(i['i']).count('/'))
+        for json_item in json_items:
+            item = backup_fs.FSItemInfo()
+            item.unserialize(json_item, decoding=decoding, from_json=True)
+            if item.type not in [backup_fs.FILE, backup_fs.DIR, ]:
+                raise ValueError('Incorrect entry type')
+            if not backup_fs.ReplaceItem(item, iter=iter, iterID=iterID):
+                lg.warn('Can not put item into the tree: %s' % str(item))
+                raise ValueError('Can not put item into the tree: %s' % str(item))
+            count += 1
+    return count
@@ -58,6 +58,10 @@ When new file arrives from supplier, "backup_control" starts a validation agains
 current local index file and update local copy if required.
 On next step index_synchronizer() sends a latest version of index file to all suppliers to hold.
 
+Index file is only a snapshot, recent changes are kept in the index journal file,
+see ``storage.index_journal``. Both files are requested from suppliers,
+but after a change only the journal is sent if supplier already have the latest snapshot.
+
 The backup_monitor() machine should be restarted every one hour
 or every time when your files were changed.
 It sends "restart" event to index_synchronizer() to synchronize index file.
@@ -130,6 +134,44 @@ def is_synchronized():
 #------------------------------------------------------------------------------
 
 
+def _index_packet_id():
+    return global_id.MakeGlobalID(
+        customer=my_id.getGlobalID(key_alias='master'),
+        path=settings.BackupIndexFileName(),
+    )
+
+
+def _journal_packet_id():
+    return global_id.MakeGlobalID(
+        customer=my_id.getGlobalID(key_alias='master'),
+        path=settings.BackupIndexJournalFileName(),
+    )
+
+
+def _packet_kind(packetID):
+    """
+    Return "journal" for the index journal packet and "index" for the index snapshot.
+    """
+    if packetID.endswith(settings.BackupIndexJournalFileName()):
+        return 'journal'
+    return 'index'
+
+
+def _make_payload(packetID, src):
+    b = encrypted.Block(
+        my_id.getLocalID(),
+        packetID,
+        0,
+        key.NewSessionKey(),
+        key.SessionKeyType(),
+        True,
+        src,
+    )
+    return b.Serialize()
+
+#------------------------------------------------------------------------------
+
+
 def A(event=None, arg=None):
     """
     Access method to interact with the state machine.
@@ -175,6 +217,9 @@ class IndexSynchronizer(automat.Automat):
         self.requested_suppliers_number = 0
         self.sending_suppliers = set()
         self.sent_suppliers_number = 0
+        # supplier idurl -> revision of the index snapshot stored there
+        self.supplier_snapshots = {}
+        self.sending_snapshots = {}
 
     def state_changed(self, oldstate, newstate, event, arg):
         """
@@ -292,10 +337,6 @@ class IndexSynchronizer(automat.Automat):
         self.latest_supplier_revision = -1
         self.requesting_suppliers.clear()
         self.requested_suppliers_number = 0
-        packetID = global_id.MakeGlobalID(
-            customer=my_id.getGlobalID(key_alias='master'),
-            path=settings.BackupIndexFileName(),
-        )
         # packetID = settings.BackupIndexFileName()
         localID = my_id.getLocalID()
         for supplierId in contactsdb.suppliers():
@@ -303,16 +344,17 @@ class IndexSynchronizer(automat.Automat):
                 continue
             if not contact_status.isOnline(supplierId):
                 continue
-            pkt_out = p2p_service.SendRetreive(
-                localID,
-                localID,
-                packetID,
-                supplierId,
-                callbacks={
-                    commands.Data(): self._on_supplier_response,
-                    commands.Fail(): self._on_supplier_response,
-                }
-            )
+            for packetID in [_index_packet_id(), _journal_packet_id(), ]:
+                pkt_out = p2p_service.SendRetreive(
+                    localID,
+                    localID,
+                    packetID,
+                    supplierId,
+                    callbacks={
+                        commands.Data(): self._on_supplier_response,
+                        commands.Fail(): self._on_supplier_response,
+                    }
+                )
 #             newpacket = signed.Packet(
 #                 commands.Retrieve(),
 #                 localID,
@@ -323,12 +365,12 @@ class IndexSynchronizer(automat.Automat):
 #             pkt_out = gateway.outbox(newpacket, callbacks={
 #                 commands.Data(): self._on_supplier_response,
 #                 commands.Fail(): self._on_supplier_response, })
-            if pkt_out:
-                self.requesting_suppliers.add(supplierId)
-                self.requested_suppliers_number += 1
-            if _Debug:
-                lg.out(_DebugLevel, '    %s sending to %s' %
-                       (pkt_out, nameurl.GetName(supplierId)))
+                if pkt_out:
+                    self.requesting_suppliers.add((supplierId, _packet_kind(packetID), ))
+                    self.requested_suppliers_number += 1
+                if _Debug:
+                    lg.out(_DebugLevel, '    %s sending to %s' %
+                           (pkt_out, nameurl.GetName(supplierId)))
 
     def doSuppliersSendIndexFile(self, arg):
         """
@@ -336,52 +378,25 @@ class IndexSynchronizer(automat.Automat):
         """
         if _Debug:
             lg.out(_DebugLevel, 'index_synchronizer.doSuppliersSendIndexFile')
-        packetID = global_id.MakeGlobalID(
-            customer=my_id.getGlobalID(key_alias='master'),
-            path=settings.BackupIndexFileName(),
-        )
+        from storage import index_journal
         self.sending_suppliers.clear()
         self.sent_suppliers_number = 0
-        src = bpio.ReadBinaryFile(settings.BackupIndexFilePath())
-        localID = my_id.getLocalID()
-        b = encrypted.Block(
-            localID,
-            packetID,
-            0,
-            key.NewSessionKey(),
-            key.SessionKeyType(),
-            True,
-            src,
-        )
-        Payload = b.Serialize()
+        self.sending_snapshots.clear()
+        snapshot_revision = index_journal.snapshot_revision()
+        index_payload = None
+        journal_payload = _make_payload(_journal_packet_id(), index_journal.pack())
         for supplierId in contactsdb.suppliers():
             if not supplierId:
                 continue
             if not contact_status.isOnline(supplierId):
                 continue
-            newpacket, pkt_out = p2p_service.SendData(
-                raw_data=Payload,
-                ownerID=localID,
-                creatorID=localID,
-                remoteID=supplierId,
-                packetID=packetID,
-                callbacks={
-                    commands.Ack(): self._on_supplier_acked,
-                    commands.Fail(): self._on_supplier_acked,
-                },
-            )
-            # newpacket = signed.Packet(
-            #     commands.Data(), localID, localID, packetID,
-            #     Payload, supplierId)
-            # pkt_out = gateway.outbox(newpacket, callbacks={
-            #     commands.Ack(): self._on_supplier_acked,
-            #     commands.Fail(): self._on_supplier_acked, })
-            if pkt_out:
-                self.sending_suppliers.add(supplierId)
-                self.sent_suppliers_number += 1
-            if _Debug:
-                lg.out(_DebugLevel, '    %s sending to %s' %
-                       (newpacket, nameurl.GetName(supplierId)))
+            if self.supplier_snapshots.get(supplierId) != snapshot_revision:
+                # supplier do not have latest snapshot, so journal is not enough
+                if index_payload is None:
+                    index_payload = _make_payload(_index_packet_id(), bpio.ReadBinaryFile(settings.BackupIndexFilePath()))
+                if self._send_payload(supplierId, _index_packet_id(), index_payload):
+                    self.sending_snapshots[supplierId] = snapshot_revision
+            self._send_payload(supplierId, _journal_packet_id(), journal_payload)
 
     def doCancelRequests(self, arg):
         """
@@ -402,9 +417,11 @@ class IndexSynchronizer(automat.Automat):
         """
         Action method.
         """
-        _, supplier_revision = arg
+        newpacket, supplier_revision = arg
         if supplier_revision > self.latest_supplier_revision:
             self.latest_supplier_revision = supplier_revision
+        if _packet_kind(newpacket.PacketID) == 'index':
+            self.supplier_snapshots[newpacket.RemoteID] = supplier_revision
 
     def doDestroyMe(self, arg):
         """
@@ -415,6 +432,33 @@ class IndexSynchronizer(automat.Automat):
         del _IndexSynchronizer
         _IndexSynchronizer = None
 
+    def _send_payload(self, supplierId, packetID, payload):
+        localID = my_id.getLocalID()
+        newpacket, pkt_out = p2p_service.SendData(
+            raw_data=payload,
+            ownerID=localID,
+            creatorID=localID,
+            remoteID=supplierId,
+            packetID=packetID,
+            callbacks={
+                commands.Ack(): self._on_supplier_acked,
+                commands.Fail(): self._on_supplier_acked,
+            },
+        )
+        # newpacket = signed.Packet(
+        #     commands.Data(), localID, localID, packetID,
+        #     Payload, supplierId)
+        # pkt_out = gateway.outbox(newpacket, callbacks={
+        #     commands.Ack(): self._on_supplier_acked,
+        #     commands.Fail(): self._on_supplier_acked, })
+        if pkt_out:
+            self.sending_suppliers.add((supplierId, _packet_kind(packetID), ))
+            self.sent_suppliers_number += 1
+        if _Debug:
+            lg.out(_DebugLevel, '    %s sending to %s' %
+                   (newpacket, nameurl.GetName(supplierId)))
+        return pkt_out
+
     def _on_supplier_response(self, newpacket, pkt_out):
         if newpacket.Command == commands.Data():
             wrapped_packet = signed.Unserialize(newpacket.Payload)
@@ -422,11 +466,14 @@ class IndexSynchronizer(automat.Automat):
                 lg.err('incoming Data() is not valid')
                 return
             from storage import backup_control
-            backup_control.IncomingSupplierBackupIndex(wrapped_packet)
+            if _packet_kind(wrapped_packet.PacketID) == 'journal':
+                backup_control.IncomingSupplierBackupIndexJournal(wrapped_packet)
+            else:
+                backup_control.IncomingSupplierBackupIndex(wrapped_packet)
             # p2p_service.SendAck(newpacket)
-            self.requesting_suppliers.discard(wrapped_packet.RemoteID)
+            self.requesting_suppliers.discard((wrapped_packet.RemoteID, _packet_kind(wrapped_packet.PacketID), ))
         elif newpacket.Command == commands.Fail():
-            self.requesting_suppliers.discard(newpacket.OwnerID)
+            self.requesting_suppliers.discard((newpacket.OwnerID, _packet_kind(newpacket.PacketID), ))
         else:
             raise Exception('wrong type of response')
         if _Debug:
@@ -441,7 +488,12 @@ class IndexSynchronizer(automat.Automat):
             sc.automat(newpacket.Command.lower(), newpacket)
         else:
             raise Exception('not found supplier connector')
-        self.sending_suppliers.discard(newpacket.OwnerID)
+        kind = _packet_kind(newpacket.PacketID)
+        if kind == 'index' and newpacket.OwnerID in self.sending_snapshots:
+            snapshot_revision = self.sending_snapshots.pop(newpacket.OwnerID)
+            if newpacket.Command == commands.Ack():
+                self.supplier_snapshots[newpacket.OwnerID] = snapshot_revision
+        self.sending_suppliers.discard((newpacket.OwnerID, kind, ))
         if _Debug:
             lg.out(_DebugLevel, 'index_synchronizer._on_supplier_acked %s, pending: %d, total: %d' % (
                 newpacket, len(self.sending_suppliers), self.sent_suppliers_number))
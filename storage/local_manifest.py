@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# local_manifest.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (local_manifest.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: local_manifest.
+
+Keeps a list of all Data and Parity pieces stored in the local backups folder
+together with their sizes.
+
+Pieces are added when they are created by RAID code or received from
+suppliers during restore and rebuilding, and removed when local files are erased.
+So ``backup_matrix`` can build the "local" matrix and count local backup sizes
+without touching the disk.
+
+All changes are appended to a journal file in the "metadata" folder
+and manifest is restored from there after restart, see ``system.journal_file``.
+
+The whole local backups folder is scanned only by ``verify()`` method -
+this is executed in a thread after start up to catch files which were created
+or removed behind our back.
+"""
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+import os
+
+from twisted.internet import threads
+
+#------------------------------------------------------------------------------
+
+from logs import lg
+
+from system import bpio
+from system import journal_file
+
+from lib import packetid
+
+from main import settings
+
+from userid import global_id
+
+#------------------------------------------------------------------------------
+
+# backup ID -> {piece name: size}, piece name is like "12-3-Data"
+_Pieces = {}
+# backup ID -> total size of local pieces
+_BackupSizes = {}
+
+_Journal = journal_file.JournalFile(
+    lambda: settings.LocalBackupsManifestFile(),
+    lambda: _snapshot_lines(),
+    lambda: _pieces_total(),
+)
+_Verifying = False
+# packet IDs and backup IDs changed while verification scan is running
+_ChangedDuringVerify = set()
+
+#------------------------------------------------------------------------------
+
+
+def init():
+    lg.out(4, 'local_manifest.init')
+    return load()
+
+
+def shutdown():
+    lg.out(4, 'local_manifest.shutdown')
+    _Journal.close()
+
+#------------------------------------------------------------------------------
+
+
+def backups():
+    """
+    List of backup IDs which have at least one piece stored locally.
+    """
+    return _Pieces.keys()
+
+
+def pieces(backupID):
+    """
+    Return a dictionary of pieces stored locally for given backup, piece name -> size.
+    """
+    return _Pieces.get(backupID, {})
+
+
+def piece_size(packetID):
+    """
+    Return size of the local piece or None if it is not stored locally.
+    """
+    backupID, name = _split(packetID)
+    return _Pieces.get(backupID, {}).get(name)
+
+
+def backup_size(backupID):
+    """
+    Total size of all pieces of that backup stored locally.
+    """
+    return _BackupSizes.get(backupID, 0)
+
+#------------------------------------------------------------------------------
+
+
+def piece_written(packetID, size):
+    """
+    Must be called after a Data or Parity piece was written into local backups folder.
+    """
+    backupID, name = _split(packetID)
+    if not backupID:
+        lg.warn('incorrect packet ID: %s' % packetID)
+        return False
+    if _Pieces.get(backupID, {}).get(name) == size:
+        return True
+    _add(backupID, name, size)
+    if _Verifying:
+        _ChangedDuringVerify.add(backupID + '/' + name)
+    _Journal.write(['+ %d %s/%s' % (size, backupID, name), ])
+    return True
+
+
+def piece_removed(packetID):
+    """
+    Must be called after a piece was erased from local backups folder.
+    """
+    backupID, name = _split(packetID)
+    if not _remove(backupID, name):
+        return False
+    if _Verifying:
+        _ChangedDuringVerify.add(backupID + '/' + name)
+    _Journal.write(['- %s/%s' % (backupID, name), ])
+    return True
+
+
+def backup_removed(backupID):
+    """
+    Must be called after all local files of given backup were erased.
+    """
+    if _Verifying:
+        _ChangedDuringVerify.add(backupID)
+    if backupID not in _Pieces:
+        return False
+    _Pieces.pop(backupID, None)
+    _BackupSizes.pop(backupID, None)
+    _Journal.write(['x %s' % backupID, ])
+    return True
+
+
+def path_removed(pathID):
+    """
+    Must be called after local folder with all backups of given path was erased.
+    """
+    prefix = pathID.rstrip('/') + '/'
+    for backupID in [b for b in _Pieces.keys() if b.startswith(prefix)]:
+        backup_removed(backupID)
+
+#------------------------------------------------------------------------------
+
+
+def load():
+    """
+    Read journal file and restore the manifest.
+
+    Return False if journal not exist yet or can not be read,
+    the manifest is empty in that case until ``verify()`` is finished.
+    """
+    _clear()
+    if not _Journal.exist():
+        lg.info('local backups manifest not found, need to scan local files')
+        return False
+    if not _Journal.read(_apply_record):
+        _clear()
+        return False
+    _Journal.compact()
+    lg.out(4, 'local_manifest.load %d backups, %d pieces, %d journal records' % (
+        len(_Pieces), _pieces_total(), _Journal.records))
+    return True
+
+
+def _apply_record(line):
+    if line.startswith('+ '):
+        _, size, packetID = line.split(' ', 2)
+        backupID, name = _split(packetID)
+        _add(backupID, name, int(size))
+    elif line.startswith('- '):
+        backupID, name = _split(line[2:])
+        _remove(backupID, name)
+    elif line.startswith('x '):
+        _Pieces.pop(line[2:], None)
+        _BackupSizes.pop(line[2:], None)
+
+
+def verify():
+    """
+    Scan local backups folder in a thread and fix the manifest.
+
+    Returns Deferred object, the result is number of pieces which were
+    missed or wrong in the manifest.
+    """
+    global _Verifying
+    if _Verifying:
+        return None
+    _Verifying = True
+    _ChangedDuringVerify.clear()
+    lg.out(4, 'local_manifest.verify started')
+    d = threads.deferToThread(_scan_local_backups_dir, settings.getLocalBackupsDir())
+    d.addCallback(_on_verify_finished)
+    d.addErrback(_on_verify_failed)
+    return d
+
+
+def _scan_local_backups_dir(backups_dir):
+    result = {}
+    if not os.path.isdir(backups_dir):
+        return result
+
+    def cb(customer, realpath, subpath, name):
+        # subpath is something like 0/0/1/0/F20131120053803PM/0-1-Data
+        if not os.path.isfile(realpath):
+            return True
+        if realpath.startswith('newblock-'):
+            return False
+        if subpath in [settings.BackupIndexFileName(), settings.BackupIndexJournalFileName(), settings.BackupInfoFileName(), settings.BackupInfoFileNameOld(), settings.BackupInfoEncryptedFileName()]:
+            return False
+        try:
+            pathID, version, piece = subpath.rsplit('/', 2)
+        except:
+            return False
+        if not packetid.IsCanonicalVersion(version):
+            return True
+        if not packetid.IsPacketNameCorrect(piece):
+            return False
+        backupID = packetid.MakeBackupID(customer, pathID, version)
+        result.setdefault(backupID, {})[piece] = os.path.getsize(realpath)
+        return False
+
+    for customer in os.listdir(backups_dir):
+        customer_path = os.path.join(backups_dir, customer)
+        if not global_id.IsValidGlobalUser(customer):
+            continue
+        if os.path.isdir(customer_path):
+            bpio.traverse_dir_recursive(
+                lambda r, s, n: cb(customer, r, s, n), customer_path)
+    return result
+
+
+def _on_verify_finished(result):
+    global _Verifying
+    _Verifying = False
+    changes = 0
+    for backupID in set(_Pieces.keys() + result.keys()):
+        if backupID in _ChangedDuringVerify:
+            # all local files of that backup were removed after scan started
+            continue
+        old_pieces = _Pieces.get(backupID, {})
+        new_pieces = result.get(backupID, {})
+        for name in set(old_pieces.keys() + new_pieces.keys()):
+            if backupID + '/' + name in _ChangedDuringVerify:
+                # we already know better, piece was changed after scan started
+                continue
+            if old_pieces.get(name) == new_pieces.get(name):
+                continue
+            changes += 1
+            if name in new_pieces:
+                _add(backupID, name, new_pieces[name])
+            else:
+                _remove(backupID, name)
+    _ChangedDuringVerify.clear()
+    if changes or not _Journal.exist():
+        _Journal.save_snapshot()
+    lg.out(4, 'local_manifest.verify finished with %d backups and %d pieces, %d changes found' % (
+        len(_Pieces), _pieces_total(), changes))
+    return changes
+
+
+def _on_verify_failed(err):
+    global _Verifying
+    _Verifying = False
+    _ChangedDuringVerify.clear()
+    lg.err('local backups verification failed: %s' % err)
+    return 0
+
+#------------------------------------------------------------------------------
+
+
+def _snapshot_lines():
+    lines = []
+    for backupID, backup_pieces in _Pieces.items():
+        for name, size in backup_pieces.items():
+            lines.append('+ %d %s/%s' % (size, backupID, name))
+    return lines
+
+#------------------------------------------------------------------------------
+
+
+def _clear():
+    _Pieces.clear()
+    _BackupSizes.clear()
+
+
+def _pieces_total():
+    return sum(map(len, _Pieces.values()))
+
+
+def _split(packetID):
+    backupID, _, name = packetID.rpartition('/')
+    if not backupID or not packetid.IsPacketNameCorrect(name):
+        return None, None
+    if '$' not in backupID:
+        backupID = 'master$' + backupID
+    return backupID, name
+
+
+def _add(backupID, name, size):
+    backup_pieces = _Pieces.setdefault(backupID, {})
+    old = backup_pieces.get(name)
+    if old is not None:
+        _BackupSizes[backupID] = _BackupSizes.get(backupID, 0) - old
+    backup_pieces[name] = size
+    _BackupSizes[backupID] = _BackupSizes.get(backupID, 0) + size
+
+
+def _remove(backupID, name):
+    backup_pieces = _Pieces.get(backupID)
+    if not backup_pieces or name not in backup_pieces:
+        return False
+    _BackupSizes[backupID] = _BackupSizes.get(backupID, 0) - backup_pieces.pop(name)
+    if not backup_pieces:
+        _Pieces.pop(backupID, None)
+        _BackupSizes.pop(backupID, None)
+    return True
@@ -41,10 +41,24 @@ EVENTS:
     * :red:`timer-5sec`
 
 
-At least for now we will work one block at a time, though packets in parallel.
+The state machine works with one "current" block at a time, though packets in parallel.
 We ask transport_control for all the data packets for a block then see if we
 get them all or need to ask for some parity packets.  We do this till we have
-gotten a block with the "LastBlock" flag set.  If we have tried several times
+gotten a block with the "LastBlock" flag set.
+
+To not wait for network round-trips on every block, pieces of the next blocks
+(up to "services/restores/blocks-in-flight" blocks in total) are requested
+while the current block is received or decoded, and every block which is
+fixable is passed to the raid worker right away. Decoded blocks are waiting
+in temporary files until they become current, so the output is written in order.
+Requests for the next blocks which failed are simply made again
+when that block becomes current.
+
+Block created with "services/backups/dedup-enabled" option can be only a
+reference to the same data stored in an older version of that path.
+In that case pieces of the older block are requested and decoded instead and
+the real data is taken from there - see ``storage.dedup_index``. Reference also keeps
+the hash of the data, restore fails if the decoded older block does not match it.  If we have tried several times
 and not gotten data packets from a supplier we can flag him as suspect-bad
 and start requesting a parity packet to cover him right away.
 
@@ -118,6 +132,9 @@ from customer import data_receiver
 from raid import raid_worker
 from raid import eccmap
 
+from storage import local_manifest
+from storage import chunker
+
 #------------------------------------------------------------------------------
 
 class RestoreWorker(automat.Automat):
@@ -163,6 +180,16 @@ class RestoreWorker(automat.Automat):
         self.LastAction = time.time()
         self.RequestFails = []
         self.AlreadyRequestedCounts = {}
+        self.BlocksInFlight = settings.getRestoreBlocksInFlight()
+        # packets requested for the blocks after current one
+        self.RequestedAhead = set()
+        # (version, block number) -> [raid output file name, result], result is None until raid finished
+        self.RaidTasks = {}
+        # pieces of that block are requested, differs from current block only if it is a reference
+        self.source_version = self.version
+        self.source_block_number = self.block_number
+        # (version, block number, length) of the block current block refers to
+        self.Reference = None
         # For anyone who wants to know when we finish
         self.MyDeferred = Deferred()
         self.packetInCallback = None
@@ -260,7 +287,14 @@ class RestoreWorker(automat.Automat):
                 self.doDestroyMe(arg)
         #---BLOCK---
         elif self.state == 'BLOCK':
-            if event == 'block-restored' and not self.isLastBlock(arg):
+            if event == 'block-restored' and self.isReference(arg):
+                self.state = 'REQUESTED'
+                self.doRemoveTempFile(arg)
+                self.doFollowReference(arg)
+                self.doScanExistingPackets(arg)
+                self.doRequestPackets(arg)
+                self.Attempts=1
+            elif event == 'block-restored' and not self.isLastBlock(arg):
                 self.state = 'REQUESTED'
                 self.doWriteRestoredData(arg)
                 self.doRemoveTempFile(arg)
@@ -298,6 +332,13 @@ class RestoreWorker(automat.Automat):
         NewBlock = arg[0]
         return NewBlock.LastBlock
 
+    def isReference(self, arg):
+        """
+        Condition method.
+        """
+        NewBlock = arg[0]
+        return getattr(NewBlock, 'Reference', False)
+
     def isStillCorrectable(self, arg):
         """
         Condition method.
@@ -358,6 +399,25 @@ class RestoreWorker(automat.Automat):
         self.OnHandParity = [False, ] * self.EccMap.paritysegments
         self.RequestFails = []
         self.AlreadyRequestedCounts = {}
+        self.source_version = self.version
+        self.source_block_number = self.block_number
+        self.Reference = None
+
+    def doFollowReference(self, arg):
+        """
+        Action method.
+        """
+        NewBlock = arg[0]
+        version, block_number, length, digest = NewBlock.Data().split(' ')
+        self.LastAction = time.time()
+        self.source_version = version
+        self.source_block_number = int(block_number)
+        self.Reference = (version, int(block_number), int(length), digest, )
+        if _Debug:
+            lg.out(_DebugLevel, 'restore_worker.doFollowReference block %d refers to %s/%d' % (
+                self.block_number, self.source_version, self.source_block_number))
+        self.RequestFails = []
+        self.AlreadyRequestedCounts = {}
 
     def doPingSuppliers(self, arg):
         """
@@ -369,16 +429,7 @@ class RestoreWorker(automat.Automat):
         """
         Action method.
         """
-        for SupplierNumber in range(self.EccMap.datasegments):
-            PacketID = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Data')
-            customerID, remotePath = packetid.SplitPacketID(PacketID)
-            self.OnHandData[SupplierNumber] = bool(os.path.exists(os.path.join(
-                settings.getLocalBackupsDir(), customerID, remotePath)))
-        for SupplierNumber in range(self.EccMap.paritysegments):
-            PacketID = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Parity')
-            customerID, remotePath = packetid.SplitPacketID(PacketID)
-            self.OnHandParity[SupplierNumber] = bool(os.path.exists(os.path.join(
-                settings.getLocalBackupsDir(), customerID, remotePath)))
+        self.OnHandData, self.OnHandParity = self._scan_existing_packets(self.source_version, self.source_block_number)
 
     def doRestoreBlock(self, arg):
         """
@@ -399,6 +450,16 @@ class RestoreWorker(automat.Automat):
             lg.exc()
             self.automat('block-failed')
             return
+        if self.Reference is not None:
+            if (newblock.BlockNumber, newblock.Length, ) != self.Reference[1:3]:
+                lg.warn('block %d refers to %r, but %r was restored' % (self.block_number, self.Reference, newblock))
+                self.automat('block-failed')
+                return
+            if chunker.block_hash(newblock.Data()) != self.Reference[3]:
+                # do not write wrong data into the output, referred block was changed or damaged
+                lg.warn('block %d refers to %r, but restored data has different hash' % (self.block_number, self.Reference, ))
+                self.automat('block-failed')
+                return
         self.automat('block-restored', (newblock, filename, ))
 
     def doRequestPackets(self, arg):
@@ -408,6 +469,7 @@ class RestoreWorker(automat.Automat):
         if _Debug:
             lg.out(_DebugLevel, 'restore_worker.doRequestPackets for %s at block %d' % (self.backup_id, self.block_number, ))
         from customer import io_throttle
+        source_backup_id = self._backup_id(self.source_version)
         packetsToRequest = []
         for SupplierNumber in range(self.EccMap.datasegments):
             SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
@@ -421,7 +483,7 @@ class RestoreWorker(automat.Automat):
                 if _Debug:
                     lg.out(_DebugLevel, '        OnHandData is True for supplier %d' % SupplierNumber)
                 continue
-            packetsToRequest.append((SupplierID, packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Data')))
+            packetsToRequest.append((SupplierID, packetid.MakePacketID(source_backup_id, self.source_block_number, SupplierNumber, 'Data')))
         for SupplierNumber in range(self.EccMap.paritysegments):
             SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
             if not SupplierID:
@@ -434,7 +496,7 @@ class RestoreWorker(automat.Automat):
                 if _Debug:
                     lg.out(_DebugLevel, '        OnHandParity is True for supplier %d' % SupplierNumber)
                 continue
-            packetsToRequest.append((SupplierID, packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Parity')))
+            packetsToRequest.append((SupplierID, packetid.MakePacketID(source_backup_id, self.source_block_number, SupplierNumber, 'Parity')))
         if _Debug:
             lg.out(_DebugLevel, '        packets to request: %s' % packetsToRequest)
         requests_made = 0
@@ -456,6 +518,7 @@ class RestoreWorker(automat.Automat):
                 SupplierID)
             requests_made += 1
         del packetsToRequest
+        self._request_blocks_ahead()
         if requests_made:
             if _Debug:
                 lg.out(_DebugLevel, "        requested %d packets for block %d" % (
@@ -483,11 +546,12 @@ class RestoreWorker(automat.Automat):
         NewPacket, PacketID = arg
         glob_path = global_id.ParseGlobalID(PacketID, detect_version=True)
         packetID = global_id.CanonicalID(PacketID)
-        customer_id, _, _, _, SupplierNumber, dataORparity = packetid.SplitFull(packetID)
-        if dataORparity == 'Data':
-            self.OnHandData[SupplierNumber] = True
-        elif dataORparity == 'Parity':
-            self.OnHandParity[SupplierNumber] = True
+        customer_id, _, version, BlockNumber, SupplierNumber, dataORparity = packetid.SplitFull(packetID)
+        if (version, BlockNumber, ) == (self.source_version, self.source_block_number, ):
+            if dataORparity == 'Data':
+                self.OnHandData[SupplierNumber] = True
+            elif dataORparity == 'Parity':
+                self.OnHandParity[SupplierNumber] = True
         if NewPacket:
             filename = os.path.join(settings.getLocalBackupsDir(), customer_id, glob_path['path'])
             dirpath = os.path.dirname(filename)
@@ -500,6 +564,7 @@ class RestoreWorker(automat.Automat):
             if not bpio.WriteFile(filename, NewPacket.Payload):
                 lg.warn("unable to write to %s" % filename)
                 return
+            local_manifest.piece_written(packetID, len(NewPacket.Payload))
             if self.packetInCallback is not None:
                 self.packetInCallback(self.backup_id, NewPacket)
             if _Debug:
@@ -511,18 +576,12 @@ class RestoreWorker(automat.Automat):
         """
         Action method.
         """
-        fd, outfilename = tmpfile.make(
-            'restore',
-            extension='.raid',
-            prefix=self.backup_id.replace(':', '_').replace('@', '_').replace('/', '_') + '_' + str(self.block_number) + '_',
-        )
-        os.close(fd)
-        inputpath = os.path.join(settings.getLocalBackupsDir(), self.customer_id, self.path_id)
-        task_params = (outfilename, self.EccMap.name, self.version, self.block_number, inputpath)
-        raid_worker.add_task(
-            'read',
-            task_params,
-            lambda cmd, params, result: self._on_block_restored(result, outfilename))
+        task_key = (self.source_version, self.source_block_number, )
+        if task_key not in self.RaidTasks:
+            self._start_raid(*task_key)
+        elif self.RaidTasks[task_key][1] is not None:
+            # that block was already decoded while we were busy with previous blocks
+            reactor.callLater(0, self._report_raid_result, task_key)
 
     def doRemoveTempFile(self, arg):
         """
@@ -549,7 +608,7 @@ class RestoreWorker(automat.Automat):
             if not supplierIDURL:
                 continue
             for dataORparity in ['Data', 'Parity', ]:
-                packetID = packetid.MakePacketID(self.backup_id, self.block_number,
+                packetID = packetid.MakePacketID(self._backup_id(self.source_version), self.source_block_number,
                                                  supplierNum, dataORparity)
                 customer, remotePath = packetid.SplitPacketID(packetID)
                 filename = os.path.join(settings.getLocalBackupsDir(), customer, remotePath)
@@ -560,7 +619,8 @@ class RestoreWorker(automat.Automat):
                         lg.exc()
                         continue
                     count += 1
-        backup_matrix.LocalBlockReport(self.backup_id, self.block_number, arg)
+                local_manifest.piece_removed(packetID)
+        backup_matrix.LocalBlockReport(self._backup_id(self.source_version), self.source_block_number, arg)
         if _Debug:
             lg.out(_DebugLevel, 'restore_worker.doRemoveTempFile %d files were removed' % count)
 
@@ -587,6 +647,8 @@ class RestoreWorker(automat.Automat):
         """
         from customer import io_throttle
         io_throttle.DeleteBackupRequests(self.backup_id)
+        if self.source_version != self.version:
+            io_throttle.DeleteBackupRequests(self._backup_id(self.source_version))
 
     def doReportDone(self, arg):
         """
@@ -614,6 +676,10 @@ class RestoreWorker(automat.Automat):
         """
         if data_receiver.A():
             data_receiver.A().removeStateChangedCallback(self._on_data_receiver_state_changed)
+        for outfilename, _ in self.RaidTasks.values():
+            tmpfile.throw_out(outfilename, 'restore finished')
+        self.RaidTasks.clear()
+        self.RequestedAhead.clear()
         self.OnHandData = None
         self.OnHandParity = None
         self.EccMap = None
@@ -624,17 +690,140 @@ class RestoreWorker(automat.Automat):
         self.output_stream = None
         self.destroy()
 
-    def _on_block_restored(self, restored_blocks, filename):
+    def _backup_id(self, version):
+        return packetid.MakeBackupID(self.customer_id, self.path_id, version)
+
+    def _scan_existing_packets(self, version, block_number):
+        backup_id = self._backup_id(version)
+        OnHandData = [False, ] * self.EccMap.datasegments
+        OnHandParity = [False, ] * self.EccMap.paritysegments
+        for SupplierNumber in range(self.EccMap.datasegments):
+            PacketID = packetid.MakePacketID(backup_id, block_number, SupplierNumber, 'Data')
+            customerID, remotePath = packetid.SplitPacketID(PacketID)
+            OnHandData[SupplierNumber] = bool(os.path.exists(os.path.join(
+                settings.getLocalBackupsDir(), customerID, remotePath)))
+        for SupplierNumber in range(self.EccMap.paritysegments):
+            PacketID = packetid.MakePacketID(backup_id, block_number, SupplierNumber, 'Parity')
+            customerID, remotePath = packetid.SplitPacketID(PacketID)
+            OnHandParity[SupplierNumber] = bool(os.path.exists(os.path.join(
+                settings.getLocalBackupsDir(), customerID, remotePath)))
+        return OnHandData, OnHandParity
+
+    def _request_blocks_ahead(self):
+        """
+        Request missing pieces of the next blocks and start decoding
+        those which are already fixable.
+        """
+        if self.BlocksInFlight <= 1:
+            return
+        from customer import io_throttle
+        from storage import backup_matrix
+        max_block_number = backup_matrix.GetKnownMaxBlockNum(self.backup_id)
+        requests_made = 0
+        for block_number in range(self.block_number + 1, self.block_number + self.BlocksInFlight):
+            if max_block_number >= 0 and block_number > max_block_number:
+                break
+            if (self.version, block_number, ) in self.RaidTasks:
+                continue
+            OnHandData, OnHandParity = self._scan_existing_packets(self.version, block_number)
+            if self.EccMap.Fixable(OnHandData, OnHandParity):
+                self._start_raid(self.version, block_number)
+                continue
+            for dataORparity, OnHand in (('Data', OnHandData), ('Parity', OnHandParity), ):
+                for SupplierNumber in range(len(OnHand)):
+                    if OnHand[SupplierNumber]:
+                        continue
+                    SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
+                    if not SupplierID or contact_status.isOffline(SupplierID):
+                        continue
+                    packetID = packetid.MakePacketID(self.backup_id, block_number, SupplierNumber, dataORparity)
+                    if packetID in self.RequestedAhead:
+                        continue
+                    if io_throttle.HasPacketInRequestQueue(SupplierID, packetID):
+                        continue
+                    self.RequestedAhead.add(packetID)
+                    io_throttle.QueueRequestFile(
+                        self._on_packet_request_result,
+                        self.creator_id,
+                        packetID,
+                        self.creator_id,
+                        SupplierID)
+                    requests_made += 1
+        if _Debug and requests_made:
+            lg.out(_DebugLevel, 'restore_worker._request_blocks_ahead requested %d packets after block %d' % (
+                requests_made, self.block_number))
+
+    def _on_packet_ahead_result(self, NewPacketOrPacketID, result, PacketID, BlockNumber):
+        if self.EccMap is None or BlockNumber <= self.block_number:
+            # restore is finished or that block is already restored
+            return
+        self.RequestedAhead.discard(PacketID)
+        if result == 'received':
+            self.doSavePacket((NewPacketOrPacketID, NewPacketOrPacketID.PacketID, ))
+        elif result != 'exist':
+            # will be requested again when that block become current
+            if _Debug:
+                lg.out(_DebugLevel, 'restore_worker._on_packet_ahead_result %s : %s' % (result, PacketID))
+            return
+        if (self.version, BlockNumber, ) in self.RaidTasks:
+            return
+        if self.EccMap.Fixable(*self._scan_existing_packets(self.version, BlockNumber)):
+            self._start_raid(self.version, BlockNumber)
+
+    def _start_raid(self, version, block_number):
+        task_key = (version, block_number, )
+        fd, outfilename = tmpfile.make(
+            'restore',
+            extension='.raid',
+            prefix=self._backup_id(version).replace(':', '_').replace('@', '_').replace('/', '_') + '_' + str(block_number) + '_',
+        )
+        os.close(fd)
+        self.RaidTasks[task_key] = [outfilename, None, ]
+        inputpath = os.path.join(settings.getLocalBackupsDir(), self.customer_id, self.path_id)
+        task_params = (outfilename, self.EccMap.name, version, block_number, inputpath)
+        raid_worker.add_task(
+            'read',
+            task_params,
+            lambda cmd, params, result: self._on_block_restored(result, outfilename, task_key))
         if _Debug:
-            lg.out(_DebugLevel, 'restore_worker._on_block_restored at %s with result: %s' % (filename, restored_blocks))
-        if restored_blocks is None:
-            self.automat('raid-failed', (None, filename))
+            lg.out(_DebugLevel, 'restore_worker._start_raid for block %s, current block is %d, %d blocks in progress' % (
+                task_key, self.block_number, len(self.RaidTasks)))
+
+    def _report_raid_result(self, task_key):
+        if self.RaidTasks is None or task_key not in self.RaidTasks:
+            return
+        outfilename, success = self.RaidTasks.pop(task_key)
+        if success:
+            self.automat('raid-done', outfilename)
         else:
-            self.automat('raid-done', filename)
+            self.automat('raid-failed', (None, outfilename))
+
+    def _on_block_restored(self, restored_blocks, filename, task_key):
+        if _Debug:
+            lg.out(_DebugLevel, 'restore_worker._on_block_restored at %s with result: %s' % (filename, restored_blocks))
+        if self.RaidTasks is None or task_key not in self.RaidTasks:
+            # restore was finished or aborted already
+            tmpfile.throw_out(filename, 'restore finished')
+            return
+        self.RaidTasks[task_key][1] = restored_blocks is not None
+        if task_key == (self.source_version, self.source_block_number, ) and self.state == 'RAID':
+            self._report_raid_result(task_key)
 
     def _on_packet_request_result(self, NewPacketOrPacketID, result):
         if _Debug:
             lg.out(_DebugLevel, 'restore_worker._on_packet_request_result %s : %s' % (result, NewPacketOrPacketID))
+        if isinstance(NewPacketOrPacketID, str):
+            PacketID = NewPacketOrPacketID
+        else:
+            PacketID = getattr(NewPacketOrPacketID, 'PacketID', None)
+        try:
+            _, _, version, BlockNumber, _, _ = packetid.SplitFull(global_id.CanonicalID(PacketID))
+        except:
+            version, BlockNumber = None, None
+        if BlockNumber is not None and (version, BlockNumber, ) != (self.source_version, self.source_block_number, ):
+            if version == self.version:
+                self._on_packet_ahead_result(NewPacketOrPacketID, result, PacketID, BlockNumber)
+            return
         if result == 'received':
             self.automat('data-received', (NewPacketOrPacketID, NewPacketOrPacketID.PacketID, ))
         elif result == 'exist':
@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+# customer_space.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (customer_space.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: customer_space.
+
+Keeps track of files stored on that machine for remote customers.
+
+For every customer we remember size and age of each stored file,
+total amount of used bytes and a heap of files ordered by age,
+so old files can be quickly removed when customer goes over his quota.
+
+We also remember if signature of the stored packet was already verified,
+so the file can be sent back to customer without reading the packet again.
+
+Index is updated incrementally when supplier writes or erases a file.
+All changes are appended to a journal file in the "metadata" folder
+and index is restored from there after restart.
+
+The whole customers folder is scanned only by ``rescan()`` method -
+this is a repair procedure, it is also executed when journal file not exist yet
+and can be started by user with ``api.space_rescan()``.
+Changes made while the scan is running are replayed on top of its result.
+
+Files erased by ``bptester`` child process are reported with ``path_removed()``.
+"""
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+import os
+import time
+import heapq
+
+from twisted.internet import reactor
+from twisted.internet import threads
+
+#------------------------------------------------------------------------------
+
+from logs import lg
+
+from system import bpio
+from system import journal_file
+
+from lib import misc
+
+from main import settings
+
+from userid import global_id
+
+#------------------------------------------------------------------------------
+
+# customer idurl -> {relative path: (age, size, verified)}
+_Files = {}
+# customer idurl -> heap of (age, relative path), may contain outdated records
+_AgeHeap = {}
+# customer idurl -> total size of stored files
+_UsedBytes = {}
+
+_Journal = journal_file.JournalFile(
+    lambda: settings.CustomersSpaceIndexFile(),
+    lambda: _snapshot_lines(),
+    lambda: _files_total(),
+)
+_SaveUsageTask = None
+_Rescanning = False
+# journal records written while rescan is running in the thread
+_RescanChanges = []
+
+#------------------------------------------------------------------------------
+
+
+def init():
+    lg.out(4, 'customer_space.init')
+    load()
+
+
+def shutdown():
+    global _SaveUsageTask
+    lg.out(4, 'customer_space.shutdown')
+    if _SaveUsageTask and _SaveUsageTask.active():
+        _SaveUsageTask.cancel()
+    _SaveUsageTask = None
+    save_usage()
+    _Journal.close()
+
+#------------------------------------------------------------------------------
+
+
+def used_bytes(customer_idurl):
+    """
+    Total size of all files stored for given customer.
+    """
+    return _UsedBytes.get(customer_idurl, 0)
+
+
+def files_count(customer_idurl):
+    return len(_Files.get(customer_idurl, {}))
+
+
+def file_size(customer_idurl, filename):
+    info = _Files.get(customer_idurl, {}).get(_relative_path(filename))
+    if info is None:
+        return None
+    return info[1]
+
+
+def is_verified(customer_idurl, filename, size=None):
+    """
+    Return True if stored packet was verified before and file size is not changed since.
+    """
+    info = _Files.get(customer_idurl, {}).get(_relative_path(filename))
+    if info is None or not info[2]:
+        return False
+    if size is not None and size != info[1]:
+        return False
+    return True
+
+
+def usage():
+    """
+    Return a copy of current usage in same format as ``CustomersUsedSpaceFile()``.
+    """
+    return {idurl: str(sz) for idurl, sz in _UsedBytes.items()}
+
+#------------------------------------------------------------------------------
+
+
+def file_written(customer_idurl, filename, size, age=None, verified=False):
+    """
+    Must be called after a new file for that customer was stored on disk.
+
+    Set ``verified`` to True if signature of the stored packet was checked already.
+    """
+    relpath = _relative_path(filename)
+    if age is None:
+        age = time.time()
+    _add(customer_idurl, relpath, age, size, verified)
+    _write_journal('+ %r %d %d %s %s' % (age, size, int(verified), customer_idurl, relpath))
+    _schedule_save_usage()
+
+
+def file_verified(customer_idurl, filename):
+    """
+    Remember that signature of the stored packet is valid.
+    """
+    relpath = _relative_path(filename)
+    info = _Files.get(customer_idurl, {}).get(relpath)
+    if info is None or info[2]:
+        return
+    _Files[customer_idurl][relpath] = (info[0], info[1], True, )
+    _write_journal('+ %r %d %d %s %s' % (info[0], info[1], 1, customer_idurl, relpath))
+
+
+def file_removed(customer_idurl, filename):
+    """
+    Must be called after a file stored for that customer was erased from disk.
+    """
+    relpath = _relative_path(filename)
+    if _remove(customer_idurl, relpath):
+        _write_journal('- %s %s' % (customer_idurl, relpath))
+        _schedule_save_usage()
+
+
+def path_removed(path):
+    """
+    Must be called when a file or a folder of some customer was erased by
+    another process, for example by ``bptester``.
+
+    Records about files which exist again are kept.
+    """
+    relpath = _relative_path(path)
+    customer_idurl = global_id.GlobalUserToIDURL(relpath.split('/')[0])
+    files = _Files.get(customer_idurl)
+    if not files:
+        return False
+    if relpath in files:
+        relpaths = [relpath, ]
+    else:
+        prefix = relpath.rstrip('/') + '/'
+        relpaths = [p for p in files.keys() if p.startswith(prefix)]
+    count = 0
+    for p in relpaths:
+        if os.path.isfile(_absolute_path(p)):
+            continue
+        _remove(customer_idurl, p)
+        _write_journal('- %s %s' % (customer_idurl, p))
+        count += 1
+    if count:
+        _schedule_save_usage()
+    return count > 0
+
+
+def folder_removed(customer_idurl, dirname):
+    """
+    Must be called after a whole folder stored for that customer was erased from disk.
+    """
+    prefix = _relative_path(dirname).rstrip('/') + '/'
+    for relpath in [p for p in _Files.get(customer_idurl, {}).keys() if p.startswith(prefix)]:
+        _remove(customer_idurl, relpath)
+        _write_journal('- %s %s' % (customer_idurl, relpath))
+    _schedule_save_usage()
+
+
+def customer_removed(customer_idurl):
+    """
+    Forget all records about that customer.
+    """
+    if customer_idurl not in _Files:
+        return
+    _Files.pop(customer_idurl, None)
+    _AgeHeap.pop(customer_idurl, None)
+    _UsedBytes.pop(customer_idurl, None)
+    _write_journal('x %s' % customer_idurl)
+    _schedule_save_usage()
+
+
+def release_space(customer_idurl, max_bytes):
+    """
+    Remove oldest files of that customer until he fits into given quota.
+
+    Returns list of removed files.
+    """
+    removed = []
+    heap = _AgeHeap.get(customer_idurl)
+    files = _Files.get(customer_idurl)
+    while heap and used_bytes(customer_idurl) >= max_bytes:
+        age, relpath = heapq.heappop(heap)
+        info = files.get(relpath)
+        if info is None or info[0] != age:
+            # file was already removed or re-written
+            continue
+        path = _absolute_path(relpath)
+        try:
+            if os.path.isfile(path):
+                os.remove(path)
+        except:
+            lg.exc()
+            heapq.heappush(heap, (age, relpath, ))
+            break
+        _remove(customer_idurl, relpath)
+        _write_journal('- %s %s' % (customer_idurl, relpath))
+        removed.append(path)
+        lg.out(_DebugLevel, 'customer_space.release_space %s removed, %d bytes used by %s, max is %d' % (
+            path, used_bytes(customer_idurl), customer_idurl, max_bytes))
+    if removed:
+        _schedule_save_usage()
+    return removed
+
+#------------------------------------------------------------------------------
+
+
+def load():
+    """
+    Read journal file and restore the index, if journal not exist yet - run ``rescan()``.
+    """
+    _clear()
+    if not _Journal.exist():
+        lg.info('space index not found, will scan customers files now')
+        rescan()
+        return False
+    if not _Journal.read(_apply_record):
+        rescan()
+        return False
+    for idurl in _AgeHeap.keys():
+        _compact_heap(idurl)
+    _Journal.compact()
+    lg.out(4, 'customer_space.load %d customers, %d files, %d journal records' % (
+        len(_Files), _files_total(), _Journal.records))
+    return True
+
+
+def rescan():
+    """
+    Full scan of customers folder, this is a repair procedure.
+
+    Walks all stored files in a thread and then replaces the whole index.
+    """
+    global _Rescanning
+    if _Rescanning:
+        return None
+    _Rescanning = True
+    del _RescanChanges[:]
+    lg.out(4, 'customer_space.rescan started')
+    d = threads.deferToThread(_scan_customers_dir, settings.getCustomersFilesDir())
+    d.addCallback(_on_rescan_finished)
+    d.addErrback(_on_rescan_failed)
+    return d
+
+
+def _scan_customers_dir(customers_dir):
+    result = {}
+    if not os.path.isdir(customers_dir):
+        return result
+    for customer_dirname in os.listdir(customers_dir):
+        onecustdir = os.path.join(customers_dir, customer_dirname)
+        if not os.path.isdir(onecustdir):
+            continue
+        idurl = global_id.GlobalUserToIDURL(customer_dirname)
+        if not idurl:
+            continue
+        files = result.setdefault(idurl, [])
+
+        def cb(path, subpath, name):
+            if not os.path.isfile(path):
+                return True
+            stats = os.stat(path)
+            files.append((customer_dirname + '/' + key_alias + '/' + subpath, stats.st_ctime, stats.st_size, ))
+            return False
+
+        for key_alias in os.listdir(onecustdir):
+            if not misc.ValidKeyAlias(key_alias):
+                continue
+            keyaliasdir = os.path.join(onecustdir, key_alias)
+            if os.path.isdir(keyaliasdir):
+                bpio.traverse_dir_recursive(cb, keyaliasdir)
+    return result
+
+
+def _on_rescan_finished(result):
+    global _Rescanning
+    _Rescanning = False
+    _clear()
+    for idurl, files in result.items():
+        for relpath, age, size in files:
+            _add(idurl, relpath, age, size, False)
+    # files were written and erased while scanning in the thread
+    for line in _RescanChanges:
+        _apply_record(line)
+    del _RescanChanges[:]
+    for idurl in _AgeHeap.keys():
+        _compact_heap(idurl)
+    _Journal.save_snapshot()
+    save_usage()
+    lg.out(4, 'customer_space.rescan finished with %d customers and %d files' % (len(_Files), _files_total()))
+    return result
+
+
+def _on_rescan_failed(err):
+    global _Rescanning
+    _Rescanning = False
+    del _RescanChanges[:]
+    lg.err('customers space rescan failed: %s' % err)
+    return None
+
+#------------------------------------------------------------------------------
+
+
+def save_usage():
+    global _SaveUsageTask
+    _SaveUsageTask = None
+    return bpio._write_dict(settings.CustomersUsedSpaceFile(), usage())
+
+
+def _schedule_save_usage():
+    global _SaveUsageTask
+    if _SaveUsageTask is None:
+        _SaveUsageTask = reactor.callLater(5, save_usage)
+
+#------------------------------------------------------------------------------
+
+
+def _write_journal(line):
+    if not _Journal.write([line, ]):
+        return False
+    if _Rescanning:
+        _RescanChanges.append(line)
+    return True
+
+
+def _snapshot_lines():
+    lines = []
+    for idurl, files in _Files.items():
+        for relpath, info in files.items():
+            lines.append('+ %r %d %d %s %s' % (info[0], info[1], int(info[2]), idurl, relpath))
+    return lines
+
+#------------------------------------------------------------------------------
+
+
+def _apply_record(line):
+    if line.startswith('+ '):
+        _, age, size, verified, idurl, relpath = line.split(' ', 5)
+        _add(idurl, relpath, float(age), int(size), verified == '1')
+    elif line.startswith('- '):
+        _, idurl, relpath = line.split(' ', 2)
+        _remove(idurl, relpath)
+    elif line.startswith('x '):
+        idurl = line[2:]
+        _Files.pop(idurl, None)
+        _AgeHeap.pop(idurl, None)
+        _UsedBytes.pop(idurl, None)
+
+
+def _clear():
+    _Files.clear()
+    _AgeHeap.clear()
+    _UsedBytes.clear()
+
+
+def _files_total():
+    return sum(map(len, _Files.values()))
+
+
+def _add(idurl, relpath, age, size, verified):
+    files = _Files.setdefault(idurl, {})
+    heap = _AgeHeap.setdefault(idurl, [])
+    old = files.get(relpath)
+    if old is not None:
+        _UsedBytes[idurl] = _UsedBytes.get(idurl, 0) - old[1]
+    files[relpath] = (age, size, verified, )
+    _UsedBytes[idurl] = _UsedBytes.get(idurl, 0) + size
+    heapq.heappush(heap, (age, relpath, ))
+    if len(heap) > 2 * len(files) + 100:
+        _compact_heap(idurl)
+
+
+def _remove(idurl, relpath):
+    files = _Files.get(idurl)
+    if not files or relpath not in files:
+        return False
+    size = files.pop(relpath)[1]
+    _UsedBytes[idurl] = _UsedBytes.get(idurl, 0) - size
+    heap = _AgeHeap.get(idurl)
+    if heap and len(heap) > 2 * len(files) + 100:
+        _compact_heap(idurl)
+    return True
+
+
+def _compact_heap(idurl):
+    heap = [(info[0], relpath, ) for relpath, info in _Files.get(idurl, {}).items()]
+    heapq.heapify(heap)
+    _AgeHeap[idurl] = heap
+
+
+def _relative_path(filename):
+    customers_dir = settings.getCustomersFilesDir()
+    relpath = os.path.relpath(os.path.abspath(filename), os.path.abspath(customers_dir))
+    return relpath.replace('\\', '/')
+
+
+def _absolute_path(relpath):
+    return os.path.join(settings.getCustomersFilesDir(), *relpath.split('/'))
@@ -221,7 +221,7 @@ class CustomersRejector(automat.Automat):
         lg.out(8, '        spent=%d' % spent_bytes)
         if spent_bytes < donated_bytes:
             space_dict['free'] = donated_bytes - spent_bytes
-            bpio._write_dict(settings.CustomersSpaceFile(), space_dict)
+            accounting.write_customers_quotas(space_dict)
             lg.out(8, '        space is OK !!!!!!!!')
             self.automat('space-enough')
             return
@@ -309,4 +309,4 @@ class CustomersRejector(automat.Automat):
         Action method.
         """
         from supplier import local_tester
-        local_tester.TestSpaceTime()
+        local_tester.TestUpdateCustomers()
@@ -54,6 +54,15 @@ from userid import my_id
 
 #------------------------------------------------------------------------------
 
+# key alias folder -> {subpath: summary text}
+_TreeSummaries = {}
+# key alias folder -> {subpath: True to re-build entry or False to build only if missed}
+_DirtyEntries = {}
+# (customer folder, key_id, format) -> serialized encrypted Block
+_ListFilesCache = {}
+
+#------------------------------------------------------------------------------
+
 def send(customer_idurl, packet_id, format_type, key_id, remote_idurl):
     if not my_keys.is_key_registered(key_id):
         lg.warn('not able to return Files() for customer %s, key %s not registered' % (
@@ -63,9 +72,30 @@ def send(customer_idurl, packet_id, format_type, key_id, remote_idurl):
         lg.out(_DebugLevel, "list_files.send to %s, customer_idurl=%s, key_id=%s" % (
             remote_idurl, customer_idurl, key_id, ))
     ownerdir = settings.getCustomerFilesDir(customer_idurl)
+    cache_key = (ownerdir, key_id, format_type, )
+    encrypted_list_files = _ListFilesCache.get(cache_key)
+    if encrypted_list_files is None:
+        encrypted_list_files = _pack_list_files(ownerdir, format_type, key_id)
+        _ListFilesCache[cache_key] = encrypted_list_files
+    elif _Debug:
+        lg.out(_DebugLevel, "    using cached list of files for %s" % ownerdir)
+    newpacket = p2p_service.SendFiles(
+        idurl=remote_idurl,
+        raw_list_files_info=encrypted_list_files,
+        packet_id=packet_id,
+        callbacks={
+            commands.Ack(): on_acked,
+            commands.Fail(): on_failed,
+            None: on_timeout,
+        },
+    )
+    return newpacket
+
+
+def _pack_list_files(ownerdir, format_type, key_id):
     plaintext = ''
     if os.path.isdir(ownerdir):
-        for key_alias in os.listdir(ownerdir):
+        for key_alias in sorted(os.listdir(ownerdir)):
             if not misc.ValidKeyAlias(str(key_alias)):
                 continue
             key_alias_dir = os.path.join(ownerdir, key_alias)
@@ -82,21 +112,143 @@ def send(customer_idurl, packet_id, format_type, key_id, remote_idurl):
         SessionKey=key.NewSessionKey(),
         EncryptKey=key_id,
     )
-    encrypted_list_files = block.Serialize()
-    newpacket = p2p_service.SendFiles(
-        idurl=remote_idurl,
-        raw_list_files_info=encrypted_list_files,
-        packet_id=packet_id,
-        callbacks={
-            commands.Ack(): on_acked,
-            commands.Fail(): on_failed,
-            None: on_timeout,
-        },
-    )
-    return newpacket
+    return block.Serialize()
 
 #------------------------------------------------------------------------------
 
+def file_changed(filename):
+    """
+    Must be called when a file stored for one of customers was written or removed.
+
+    Only the entry for that file (or the whole version folder it belongs to) is
+    marked to be updated in the summary when it is requested next time,
+    cached packed lists for that customer are dropped.
+    """
+    _on_path_modified(filename)
+
+
+def folder_removed(dirname):
+    """
+    Must be called when a folder stored for one of customers was removed.
+    """
+    _on_path_modified(dirname, removed_folder=True)
+
+
+def path_removed(path):
+    """
+    Must be called when a file or a folder of some customer was erased by
+    another process, for example by ``bptester``.
+    """
+    _on_path_modified(path, removed_folder=not os.path.exists(path))
+
+
+def forget_customer(customer_idurl):
+    """
+    Erase all cached info about files of that customer.
+    """
+    _forget_owner_dir(settings.getCustomerFilesDir(customer_idurl))
+
+
+def _forget_owner_dir(ownerdir):
+    _drop_cache(ownerdir)
+    for key_alias_dir in list(_TreeSummaries.keys()):
+        if os.path.dirname(key_alias_dir) == ownerdir:
+            _TreeSummaries.pop(key_alias_dir, None)
+            _DirtyEntries.pop(key_alias_dir, None)
+
+
+def _drop_cache(ownerdir):
+    for cache_key in list(_ListFilesCache.keys()):
+        if cache_key[0] == ownerdir:
+            _ListFilesCache.pop(cache_key, None)
+
+
+def _on_path_modified(path, removed_folder=False):
+    customers_dir = os.path.abspath(settings.getCustomersFilesDir())
+    relpath = os.path.relpath(os.path.abspath(path), customers_dir).replace('\\', '/')
+    parts = relpath.split('/')
+    if not parts[0] or parts[0] in ['.', '..', ]:
+        lg.warn('path %s is not stored for a customer' % path)
+        return
+    ownerdir = os.path.join(customers_dir, parts[0])
+    if len(parts) == 1:
+        # the whole customer folder was changed
+        _forget_owner_dir(ownerdir)
+        return
+    _drop_cache(ownerdir)
+    key_alias_dir = os.path.join(ownerdir, parts[1])
+    summary = _TreeSummaries.get(key_alias_dir)
+    if summary is None:
+        # summary for that key was not created yet, it will be built when requested
+        return
+    if len(parts) == 2:
+        # the whole key folder was changed
+        _TreeSummaries.pop(key_alias_dir, None)
+        _DirtyEntries.pop(key_alias_dir, None)
+        return
+    subparts = parts[2:]
+    dirty = _DirtyEntries.setdefault(key_alias_dir, {})
+    # files inside of a version folder are all summarized in a single entry
+    for pos in xrange(len(subparts)):
+        if packetid.IsCanonicalVersion(subparts[pos]):
+            subpath = '/'.join(subparts[:pos + 1])
+            if pos == len(subparts) - 1 and removed_folder:
+                summary.pop(subpath, None)
+                dirty.pop(subpath, None)
+            else:
+                dirty[subpath] = True
+            _mark_summary_parents(dirty, subparts[:pos])
+            return
+    subpath = '/'.join(subparts)
+    if removed_folder:
+        for entry in list(summary.keys()):
+            if entry == subpath or entry.startswith(subpath + '/'):
+                summary.pop(entry)
+        for entry in list(dirty.keys()):
+            if entry == subpath or entry.startswith(subpath + '/'):
+                dirty.pop(entry)
+    else:
+        dirty[subpath] = True
+    _mark_summary_parents(dirty, subparts[:-1])
+
+
+def _mark_summary_parents(dirty, subparts):
+    for pos in xrange(len(subparts)):
+        dirty.setdefault('/'.join(subparts[:pos + 1]), False)
+
+
+def _refresh_summary(key_alias_dir, summary):
+    """
+    Re-build entries changed since previous request, every version folder is read
+    only once no matter how many files were written there.
+    """
+    dirty = _DirtyEntries.pop(key_alias_dir, None)
+    if not dirty:
+        return
+    # parents first, a new folder is summarized with all of its content
+    for subpath in sorted(dirty.keys(), key=lambda p: p.count('/')):
+        if dirty[subpath] or subpath not in summary:
+            _update_summary_entry(summary, key_alias_dir, subpath)
+    if _Debug:
+        lg.out(_DebugLevel, 'list_files._refresh_summary %d entries updated in %s' % (len(dirty), key_alias_dir))
+
+
+def _update_summary_entry(summary, key_alias_dir, subpath):
+    realpath = os.path.join(key_alias_dir, *subpath.split('/'))
+    summary.pop(subpath, None)
+    if not os.path.exists(realpath):
+        return
+    out = cStringIO.StringIO()
+    go_down = _summarize_path(out, realpath, subpath, os.path.basename(realpath))
+    summary[subpath] = out.getvalue()
+    out.close()
+    if go_down:
+        # a new folder appeared, summarize all of its content
+        summary.update(_summarize_tree(realpath, subpath))
+
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+
 def on_acked(response, info):
     if _Debug:
         lg.out(_DebugLevel, 'list_files.on_acked with %s in %s' % (response, info, ))
@@ -129,90 +281,122 @@ def UnpackListFiles(payload, method):
 #------------------------------------------------------------------------------
 
 def TreeSummary(ownerdir, key_alias):
+    """
+    Return text summary of all files stored in given folder, one line per entry.
+
+    Summary is built with a full walk only for the first time, after that it is
+    kept in memory and entries marked by ``file_changed()`` and ``folder_removed()``
+    are updated here.
+    """
+    summary = _TreeSummaries.get(ownerdir)
+    if summary is None:
+        summary = _summarize_tree(ownerdir)
+        _TreeSummaries[ownerdir] = summary
+        _DirtyEntries.pop(ownerdir, None)
+    else:
+        _refresh_summary(ownerdir, summary)
     out = cStringIO.StringIO()
     out.write('K%s\n' % key_alias)
-
-    def cb(result, realpath, subpath, name):
-        if not os.access(realpath, os.R_OK):
-            return False
-        if os.path.isfile(realpath):
-            try:
-                filesz = os.path.getsize(realpath)
-            except:
-                filesz = -1
-            result.write('F%s %d\n' % (subpath, filesz))
-            return False
-        if not packetid.IsCanonicalVersion(name):
-            result.write('D%s\n' % subpath)
-            return True
-        maxBlock = -1
-        versionSize = {}
-        dataBlocks = {}
-        parityBlocks = {}
-        dataMissing = {}
-        parityMissing = {}
-        for filename in os.listdir(realpath):
-            packetID = subpath + '/' + filename
-            pth = os.path.join(realpath, filename)
-            try:
-                filesz = os.path.getsize(pth)
-            except:
-                filesz = -1
-            if os.path.isdir(pth):
-                result.write('D%s\n' % packetID)
-                continue
-            if not packetid.Valid(packetID):
-                result.write('F%s %d\n' % (packetID, filesz))
-                continue
-            customer, pathID, versionName, blockNum, supplierNum, dataORparity = packetid.SplitFull(packetID)
-            if None in [pathID, versionName, blockNum, supplierNum, dataORparity]:
-                result.write('F%s %d\n' % (packetID, filesz))
-                continue
-            if dataORparity != 'Data' and dataORparity != 'Parity':
-                result.write('F%s %d\n' % (packetID, filesz))
-                continue
-            if maxBlock < blockNum:
-                maxBlock = blockNum
-            if supplierNum not in versionSize:
-                versionSize[supplierNum] = 0
-            if supplierNum not in dataBlocks:
-                dataBlocks[supplierNum] = {}
-            if supplierNum not in parityBlocks:
-                parityBlocks[supplierNum] = {}
-            if dataORparity == 'Data':
-                dataBlocks[supplierNum][blockNum] = filesz
-            elif dataORparity == 'Parity':
-                parityBlocks[supplierNum][blockNum] = filesz
-        for supplierNum in versionSize.keys():
-            dataMissing[supplierNum] = set(range(maxBlock + 1))
-            parityMissing[supplierNum] = set(range(maxBlock + 1))
-            for blockNum in range(maxBlock + 1):
-                if blockNum in dataBlocks[supplierNum].keys():
-                    versionSize[supplierNum] += dataBlocks[supplierNum][blockNum]
-                    dataMissing[supplierNum].discard(blockNum)
-                if blockNum in parityBlocks[supplierNum].keys():
-                    versionSize[supplierNum] += parityBlocks[supplierNum][blockNum]
-                    parityMissing[supplierNum].discard(blockNum)
-        suppliers = set(dataBlocks.keys() + parityBlocks.keys())
-        for supplierNum in suppliers:
-            versionString = '%s %d 0-%d %d' % (
-                subpath, supplierNum, maxBlock, versionSize[supplierNum])
-            if len(dataMissing[supplierNum]) > 0 or len(parityMissing[supplierNum]) > 0:
-                versionString += ' missing'
-                if len(dataMissing[supplierNum]) > 0:
-                    versionString += ' Data:' + (','.join(map(str, dataMissing[supplierNum])))
-                if len(parityMissing[supplierNum]) > 0:
-                    versionString += ' Parity:' + (','.join(map(str, parityMissing[supplierNum])))
-            result.write('V%s\n' % versionString)
-        del dataBlocks
-        del parityBlocks
-        del dataMissing
-        del parityMissing
-        return False
-
-    bpio.traverse_dir_recursive(lambda realpath, subpath, name: cb(out, realpath, subpath, name), ownerdir)
+    for subpath in sorted(summary.keys()):
+        out.write(summary[subpath])
     src = out.getvalue()
     out.close()
     return src
 
+
+def _summarize_tree(basedir, basesubpath=''):
+    """
+    Walk the folder and return a dictionary with a piece of summary text for every entry.
+    """
+    summary = {}
+
+    def cb(realpath, subpath, name):
+        out = cStringIO.StringIO()
+        go_down = _summarize_path(out, realpath, subpath, name)
+        summary[subpath] = out.getvalue()
+        out.close()
+        return go_down
+
+    bpio.traverse_dir_recursive(cb, basedir, basesubpath)
+    return summary
+
+
+def _summarize_path(result, realpath, subpath, name):
+    if not os.access(realpath, os.R_OK):
+        return False
+    if os.path.isfile(realpath):
+        try:
+            filesz = os.path.getsize(realpath)
+        except:
+            filesz = -1
+        result.write('F%s %d\n' % (subpath, filesz))
+        return False
+    if not packetid.IsCanonicalVersion(name):
+        result.write('D%s\n' % subpath)
+        return True
+    maxBlock = -1
+    versionSize = {}
+    dataBlocks = {}
+    parityBlocks = {}
+    dataMissing = {}
+    parityMissing = {}
+    for filename in os.listdir(realpath):
+        packetID = subpath + '/' + filename
+        pth = os.path.join(realpath, filename)
+        try:
+            filesz = os.path.getsize(pth)
+        except:
+            filesz = -1
+        if os.path.isdir(pth):
+            result.write('D%s\n' % packetID)
+            continue
+        if not packetid.Valid(packetID):
+            result.write('F%s %d\n' % (packetID, filesz))
+            continue
+        customer, pathID, versionName, blockNum, supplierNum, dataORparity = packetid.SplitFull(packetID)
+        if None in [pathID, versionName, blockNum, supplierNum, dataORparity]:
+            result.write('F%s %d\n' % (packetID, filesz))
+            continue
+        if dataORparity != 'Data' and dataORparity != 'Parity':
+            result.write('F%s %d\n' % (packetID, filesz))
+            continue
+        if maxBlock < blockNum:
+            maxBlock = blockNum
+        if supplierNum not in versionSize:
+            versionSize[supplierNum] = 0
+        if supplierNum not in dataBlocks:
+            dataBlocks[supplierNum] = {}
+        if supplierNum not in parityBlocks:
+            parityBlocks[supplierNum] = {}
+        if dataORparity == 'Data':
+            dataBlocks[supplierNum][blockNum] = filesz
+        elif dataORparity == 'Parity':
+            parityBlocks[supplierNum][blockNum] = filesz
+    for supplierNum in versionSize.keys():
+        dataMissing[supplierNum] = set(range(maxBlock + 1))
+        parityMissing[supplierNum] = set(range(maxBlock + 1))
+        for blockNum in range(maxBlock + 1):
+            if blockNum in dataBlocks[supplierNum].keys():
+                versionSize[supplierNum] += dataBlocks[supplierNum][blockNum]
+                dataMissing[supplierNum].discard(blockNum)
+            if blockNum in parityBlocks[supplierNum].keys():
+                versionSize[supplierNum] += parityBlocks[supplierNum][blockNum]
+                parityMissing[supplierNum].discard(blockNum)
+    suppliers = set(dataBlocks.keys() + parityBlocks.keys())
+    for supplierNum in suppliers:
+        versionString = '%s %d 0-%d %d' % (
+            subpath, supplierNum, maxBlock, versionSize[supplierNum])
+        if len(dataMissing[supplierNum]) > 0 or len(parityMissing[supplierNum]) > 0:
+            versionString += ' missing'
+            if len(dataMissing[supplierNum]) > 0:
+                versionString += ' Data:' + (','.join(map(str, dataMissing[supplierNum])))
+            if len(parityMissing[supplierNum]) > 0:
+                versionString += ' Parity:' + (','.join(map(str, parityMissing[supplierNum])))
+        result.write('V%s\n' % versionString)
+    del dataBlocks
+    del parityBlocks
+    del dataMissing
+    del parityMissing
+    return False
+
 #------------------------------------------------------------------------------
@@ -91,7 +91,6 @@ _CurrentProcess = None
 _Loop = None
 _LoopValidate = None
 _LoopUpdateCustomers = None
-_LoopSpaceTime = None
 
 #------------------------------------------------------------------------------
 
@@ -104,14 +103,14 @@ def init():
     _Loop = reactor.callLater(5, loop)
     _LoopValidate = reactor.callLater(0, loop_validate)
     _LoopUpdateCustomers = reactor.callLater(0, loop_update_customers)
-    _LoopSpaceTime = reactor.callLater(0, loop_space_time)
+    # space used by customers is tracked in supplier.customer_space,
+    # full scan of customers files is started only on demand with customer_space.rescan()
 
 
 def shutdown():
     global _Loop
     global _LoopValidate
     global _LoopUpdateCustomers
-    global _LoopSpaceTime
     global _CurrentProcess
     lg.out(4, 'localtester.shutdown ')
 
@@ -124,9 +123,6 @@ def shutdown():
     if _LoopUpdateCustomers:
         if _LoopUpdateCustomers.active():
             _LoopUpdateCustomers.cancel()
-    if _LoopSpaceTime:
-        if _LoopSpaceTime.active():
-            _LoopSpaceTime.cancel()
 
     if alive():
         lg.out(4, 'localtester.shutdown is killing bptester')
@@ -216,6 +212,8 @@ def alive():
 def loop():
     global _Loop
     if not alive():
+        if _CurrentProcess is not None:
+            on_tester_finished()
         Tester = _popTester()
         if Tester:
             run(Tester)
@@ -233,11 +231,30 @@ def loop_update_customers():
     TestUpdateCustomers()
     _LoopUpdateCustomers = reactor.callLater(settings.DefaultLocaltesterUpdateCustomersTimeout(), loop_update_customers)
 
+#-------------------------------------------------------------------------------
+
 
-def loop_space_time():
-    global _LoopSpaceTime
-    TestSpaceTime()
-    _LoopSpaceTime = reactor.callLater(settings.DefaultLocaltesterSpaceTimeTimeout(), loop_space_time)
+def on_tester_finished():
+    """
+    Called when ``bptester`` child process is finished, files it removed
+    must be also removed from the customers space index and list of files.
+    """
+    global _CurrentProcess
+    _CurrentProcess = None
+    removed_paths_file = settings.LocalTesterRemovedPathsFile()
+    if not os.path.isfile(removed_paths_file):
+        return
+    src = bpio.ReadTextFile(removed_paths_file)
+    try:
+        os.remove(removed_paths_file)
+    except:
+        lg.exc()
+    from supplier import customer_space
+    from supplier import list_files
+    for path in src.splitlines():
+        if path:
+            customer_space.path_removed(path)
+            list_files.path_removed(path)
 
 #-------------------------------------------------------------------------------
 
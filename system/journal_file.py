@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# journal_file.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (journal_file.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: journal_file.
+
+Append-only text file used to keep an index in the "metadata" folder:
+every change of the index is a single line appended to the end of the file
+and the whole index is restored by reading all lines after restart.
+
+When the file has too many outdated records comparing to the actual
+state of the index it is re-written from scratch with only actual records,
+see ``JournalFile.save_snapshot()``.
+
+Used by ``storage.local_manifest``, ``storage.dedup_index`` and
+``supplier.customer_space``.
+"""
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+import os
+
+#------------------------------------------------------------------------------
+
+from logs import lg
+
+from system import bpio
+
+#------------------------------------------------------------------------------
+
+
+class JournalFile(object):
+    """
+    ``filepath_cb()`` returns location of the file, ``snapshot_cb()`` returns
+    a list of lines describing the actual state of the index and ``total_cb()``
+    returns number of such lines.
+    """
+
+    def __init__(self, filepath_cb, snapshot_cb, total_cb):
+        self.filepath_cb = filepath_cb
+        self.snapshot_cb = snapshot_cb
+        self.total_cb = total_cb
+        self.file = None
+        self.records = 0
+
+    def exist(self):
+        return os.path.isfile(self.filepath_cb())
+
+    def read(self, record_cb):
+        """
+        Call ``record_cb(line)`` for every record in the file.
+
+        Returns False if file not exist or can not be read,
+        caller must reset the index in that case.
+        """
+        self.close()
+        self.records = 0
+        filepath = self.filepath_cb()
+        if not os.path.isfile(filepath):
+            return False
+        count = 0
+        try:
+            fin = open(filepath, 'r')
+            for line in fin:
+                count += 1
+                line = line.rstrip('\n')
+                if not line:
+                    continue
+                record_cb(line)
+            fin.close()
+        except:
+            lg.exc()
+            return False
+        self.records = count
+        if _Debug:
+            lg.out(_DebugLevel, 'journal_file.read %d records from %s' % (count, filepath))
+        return True
+
+    def write(self, lines):
+        """
+        Append records to the end of the file.
+        """
+        if not lines:
+            return True
+        try:
+            if self.file is None:
+                self.file = open(self.filepath_cb(), 'a')
+            self.file.write(''.join([line + '\n' for line in lines]))
+            self.file.flush()
+        except:
+            lg.exc()
+            return False
+        self.records += len(lines)
+        self.compact()
+        return True
+
+    def compact(self):
+        """
+        Re-write the file if it is more than twice bigger than needed.
+        """
+        if self.records > 2 * self.total_cb() + 1000:
+            return self.save_snapshot()
+        return True
+
+    def save_snapshot(self):
+        """
+        Re-write the file with only actual records.
+        """
+        self.close()
+        lines = self.snapshot_cb()
+        if not bpio.AtomicWriteFile(self.filepath_cb(), ''.join([line + '\n' for line in lines])):
+            lg.err('failed writing journal file %s' % self.filepath_cb())
+            return False
+        self.records = len(lines)
+        return True
+
+    def close(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except:
+                lg.exc()
+        self.file = None
@@ -30,6 +30,12 @@
 Keep track of temporary files created in the program. The temp folder is
 placed in the BitDust data directory. All files are divided into several
 sub folders.
+
+Small packets passed between the gateway and transport plug-ins running in the
+same process are kept in memory instead: a "memory file" gets a path in the
+sub folder like a regular temp file, but the data is never written on disk
+unless ``flush_memory()`` is called. Use ``exists()``, ``size()``, ``read()``
+and ``open_read()`` to access both kinds of files.
 """
 
 #------------------------------------------------------------------------------
@@ -42,6 +48,7 @@ _DebugLevel = 10
 import os
 import tempfile
 import time
+import cStringIO
 
 from twisted.internet import task
 
@@ -56,6 +63,9 @@ from system import bpio
 _TempDirPath = None
 _FilesDict = {}
 _CollectorTask = None
+_MemoryFiles = {}
+_MemoryFilesSize = 0
+_MemoryFilesCounter = 0
 _SubDirs = {
 
     'outbox': 60 * 60 * 1,
@@ -100,6 +110,11 @@ _SubDirs = {
 
 }
 
+# bigger files are always written on disk
+MEMORY_FILE_MAX_SIZE = 1024 * 1024
+# total size of all files kept in memory at once
+MEMORY_FILES_MAX_TOTAL_SIZE = 64 * 1024 * 1024
+
 #------------------------------------------------------------------------------
 
 
@@ -165,10 +180,13 @@ def shutdown():
     """
     lg.out(4, 'tmpfile.shutdown')
     global _CollectorTask
+    global _MemoryFilesSize
     if _CollectorTask is not None:
         _CollectorTask.stop()
         del _CollectorTask
         _CollectorTask = None
+    _MemoryFiles.clear()
+    _MemoryFilesSize = 0
 
 
 def subdir(name):
@@ -223,6 +241,109 @@ def make(name, extension='', prefix=''):
     return fd, filename
 
 
+def memory_available(size):
+    """
+    Return True if a file of given size can be kept in memory.
+    """
+    return size <= MEMORY_FILE_MAX_SIZE and _MemoryFilesSize + size <= MEMORY_FILES_MAX_TOTAL_SIZE
+
+
+def make_memory(name, extension='', prefix=''):
+    """
+    Same as ``make()`` but the file is kept in memory, returns only a path.
+
+    Use ``write_memory()`` to fill the file, it can be removed with
+    ``throw_out()`` or will be removed by collector as a regular temp file.
+    """
+    global _MemoryFilesCounter
+    if _TempDirPath is None:
+        init()
+    if name not in _FilesDict.keys():
+        name = 'all'
+    while True:
+        _MemoryFilesCounter += 1
+        filename = os.path.join(subdir(name), '%smem%d%s' % (prefix, _MemoryFilesCounter, extension))
+        if filename not in _MemoryFiles and not os.path.exists(filename):
+            break
+    _MemoryFiles[filename] = []
+    _FilesDict[name][filename] = time.time()
+    if _Debug:
+        lg.out(_DebugLevel, 'tmpfile.make_memory ' + filename)
+    return filename
+
+
+def write_memory(filename, data):
+    """
+    Append data to the memory file.
+    """
+    global _MemoryFilesSize
+    _MemoryFiles[filename].append(data)
+    _MemoryFilesSize += len(data)
+
+
+def is_memory(filename):
+    """
+    Return True if this file is kept in memory.
+    """
+    return filename in _MemoryFiles
+
+
+def exists(filename):
+    """
+    Check existence of memory file or a file on disk.
+    """
+    return filename in _MemoryFiles or os.path.isfile(filename)
+
+
+def size(filename):
+    """
+    Return size of memory file or a file on disk.
+    """
+    if filename in _MemoryFiles:
+        return sum(map(len, _MemoryFiles[filename]))
+    return os.path.getsize(filename)
+
+
+def read(filename):
+    """
+    Return whole content of memory file or a file on disk.
+    """
+    if filename in _MemoryFiles:
+        parts = _MemoryFiles[filename]
+        if len(parts) > 1:
+            parts[:] = [''.join(parts), ]
+        return parts[0] if parts else ''
+    return bpio.ReadBinaryFile(filename)
+
+
+def open_read(filename):
+    """
+    Open memory file or a file on disk for reading.
+    """
+    if filename in _MemoryFiles:
+        return cStringIO.StringIO(read(filename))
+    return open(filename, 'rb')
+
+
+def flush_memory(filename):
+    """
+    Write memory file on disk at the same path, so it can be passed
+    to another process. Return False if writing failed.
+    """
+    global _MemoryFilesSize
+    if filename not in _MemoryFiles:
+        return os.path.isfile(filename)
+    data = read(filename)
+    if not bpio.WriteFile(filename, data):
+        lg.warn('failed writing memory file %s on disk' % filename)
+        return False
+    _MemoryFiles.pop(filename)
+    _MemoryFilesSize -= len(data)
+    if _Debug:
+        lg.out(_DebugLevel, 'tmpfile.flush_memory %s : %d bytes' % (filename, len(data)))
+    return True
+
+
 def make_dir(name, extension='', prefix=''):
     """
     """
@@ -252,6 +373,7 @@ def erase(name, filename, why='no reason'):
     But outside of this module you better use method ``throw_out``.
     """
     global _FilesDict
+    global _MemoryFilesSize
     if name in _FilesDict.keys():
         try:
             _FilesDict[name].pop(filename, '')
@@ -260,6 +382,12 @@ def erase(name, filename, why='no reason'):
     else:
         lg.warn('we do not know sub folder: [%s]' % name)
 
+    if filename in _MemoryFiles:
+        _MemoryFilesSize -= sum(map(len, _MemoryFiles.pop(filename)))
+        if _Debug:
+            lg.out(_DebugLevel, 'tmpfile.erase memory file [%s] : "%s"' % (filename, why))
+        return
+
     if not os.path.exists(filename):
         lg.warn('[%s] not exist' % filename)
         return
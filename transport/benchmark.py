@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# benchmark.py
+#
+# Copyright (C) 2008-2018 Veselin Penev, https://bitdust.io
+#
+# This file (benchmark.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: benchmark.
+
+Measure how many packets per second can be passed between the gateway and
+transport plug-ins through temporary files on disk and through memory files.
+
+Every packet makes the same trip as in the real program, without the network:
+``packet_out`` serializes it into the "outbox", transport reads it in chunks
+and writes received data into "tcp-in", ``gateway.inbox()`` reads and
+unserializes it and finally both files are thrown out.
+
+    python transport/benchmark.py
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+if __name__ == '__main__':
+    dirpath = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sys.path.insert(0, os.path.abspath(os.path.join(dirpath, '..')))
+
+from logs import lg
+
+from system import tmpfile
+
+from crypt import signed
+
+#------------------------------------------------------------------------------
+
+PAYLOAD_SIZES = [
+    1024,
+    16 * 1024,
+    64 * 1024,
+    256 * 1024,
+    1024 * 1024,
+]
+
+CHUNK_SIZE = 2 ** 14
+
+#------------------------------------------------------------------------------
+
+
+class _BenchmarkPacket(signed.Packet):
+
+    def Sign(self):
+        # no keys are loaded here, signature is not checked anyway
+        self.Signature = 'signature'
+
+
+def _make_packet(payload_size):
+    return _BenchmarkPacket(
+        'Data',
+        'http://127.0.0.1/alice.xml',
+        'http://127.0.0.1/alice.xml',
+        '0/0/1/0/F20180101000000AM/0-1-Data',
+        os.urandom(payload_size),
+        'http://127.0.0.1/bob.xml',
+        KeyID='master$alice@127.0.0.1',
+    )
+
+
+def _write_outbox(outpacket, in_memory):
+    parts = outpacket.SerializeParts()
+    if in_memory:
+        filename = tmpfile.make_memory('outbox', extension='.out')
+        tmpfile.write_memory(filename, ''.join(parts))
+    else:
+        fileno, filename = tmpfile.make('outbox', extension='.out')
+        for part in parts:
+            os.write(fileno, part)
+        os.close(fileno)
+    return filename
+
+
+def _transfer(filename, in_memory):
+    fin = tmpfile.open_read(filename)
+    if in_memory:
+        fout = None
+        received = tmpfile.make_memory('tcp-in', extension='.tcp')
+    else:
+        fout, received = tmpfile.make('tcp-in', extension='.tcp')
+    while True:
+        chunk = fin.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if fout is None:
+            tmpfile.write_memory(received, chunk)
+        else:
+            os.write(fout, chunk)
+    fin.close()
+    if fout is not None:
+        os.close(fout)
+    return received
+
+
+def _one_packet(outpacket, in_memory):
+    outbox_filename = _write_outbox(outpacket, in_memory)
+    inbox_filename = _transfer(outbox_filename, in_memory)
+    newpacket = signed.Unserialize(tmpfile.read(inbox_filename))
+    tmpfile.throw_out(inbox_filename, 'received')
+    tmpfile.throw_out(outbox_filename, 'sent')
+    return newpacket
+
+
+def _measure(outpacket, in_memory):
+    count = 0
+    t = time.time()
+    while True:
+        newpacket = _one_packet(outpacket, in_memory)
+        count += 1
+        dt = time.time() - t
+        if dt > 1.0:
+            break
+    ok = newpacket.Payload == outpacket.Payload and newpacket.PacketID == outpacket.PacketID
+    return count / dt, ok
+
+
+def main():
+    lg.set_debug_level(0)
+    temp_dir = tempfile.mkdtemp(prefix='bitdust-benchmark-')
+    tmpfile.init(temp_dir)
+    try:
+        print '%12s %14s %14s %8s  %s' % (
+            'payload', 'files pkt/s', 'memory pkt/s', 'ratio', 'same')
+        for payload_size in PAYLOAD_SIZES:
+            outpacket = _make_packet(payload_size)
+            files_rate, files_ok = _measure(outpacket, False)
+            memory_rate, memory_ok = _measure(outpacket, True)
+            print '%12d %14.1f %14.1f %8.2f  %s' % (
+                payload_size, files_rate, memory_rate, memory_rate / files_rate, files_ok and memory_ok)
+    finally:
+        tmpfile.shutdown()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -164,6 +164,17 @@ def can_send(proto):
     return transport(proto).state == 'LISTENING'
 
 
+def memory_files_supported(proto):
+    """
+    Return True if given transport is running in our process and can read
+    outgoing packets kept in memory, see ``tmpfile.make_memory()``.
+    """
+    method = getattr(transport(proto).interface, 'memory_files_supported', None)
+    if method is None:
+        return False
+    return method()
+
+
 def last_inbox_time():
     """
     """
@@ -383,11 +394,11 @@ def inbox(info):
 #         if _Debug:
 #             lg.out(_DebugLevel - 4, "gateway.inbox ignoring input since _DoingShutdown ")
 #         return None
-    if info.filename == "" or not os.path.exists(info.filename):
+    if info.filename == "" or not tmpfile.exists(info.filename):
         lg.err("bad filename=" + info.filename)
         return None
     try:
-        data = bpio.ReadBinaryFile(info.filename)
+        data = tmpfile.read(info.filename)
     except:
         lg.err("gateway.inbox ERROR reading file " + info.filename)
         return None
@@ -523,6 +534,8 @@ def disconnect_from(proto, host):
 def send_file(remote_idurl, proto, host, filename, description='', pkt_out=None):
     """
     """
+    if tmpfile.is_memory(filename) and not memory_files_supported(proto):
+        tmpfile.flush_memory(filename)
     result_defer = transport(proto).call('send_file', remote_idurl, filename, host, description)
     callback.run_begin_file_sending_callbacks(result_defer, remote_idurl, proto, host, filename, description, pkt_out)
     return result_defer
@@ -531,6 +544,8 @@ def send_file(remote_idurl, proto, host, filename, description='', pkt_out=None)
 def send_file_single(remote_idurl, proto, host, filename, description='', pkt_out=None):
     """
     """
+    if tmpfile.is_memory(filename) and not memory_files_supported(proto):
+        tmpfile.flush_memory(filename)
     result_defer = transport(proto).call('send_file_single', remote_idurl, filename, host, description)
     callback.run_begin_file_sending_callbacks(result_defer, remote_idurl, proto, host, filename, description, pkt_out)
     return result_defer
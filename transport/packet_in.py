@@ -55,6 +55,7 @@ import os
 import time
 
 from twisted.internet import reactor
+from twisted.internet import threads
 
 #------------------------------------------------------------------------------
 
@@ -67,7 +68,6 @@ from automats import automat
 
 from lib import nameurl
 
-from system import bpio
 from system import tmpfile
 
 from contacts import contactsdb
@@ -86,6 +86,15 @@ _InboxItems = {}
 _PacketsCounter = 0
 _History = []
 
+_VerifyQueues = {}
+_VerifyInProgress = set()
+_VerifyMaxThreads = 4
+_VerifyCounters = {
+    'verified': 0,
+    'not_valid': 0,
+    'errors': 0,
+}
+
 #------------------------------------------------------------------------------
 
 
@@ -154,6 +163,30 @@ def history():
 #------------------------------------------------------------------------------
 
 
+def verify_queue_depth():
+    """
+    Returns number of incoming packets waiting for signature verification,
+    including those which are verified right now.
+    """
+    global _VerifyQueues
+    return sum(map(len, _VerifyQueues.values()))
+
+
+def verify_stats():
+    """
+    Returns a dictionary with info about signature verification stage.
+    """
+    global _VerifyCounters
+    global _VerifyInProgress
+    result = dict(_VerifyCounters)
+    result['queue_depth'] = verify_queue_depth()
+    result['in_progress'] = len(_VerifyInProgress)
+    result['max_threads'] = _VerifyMaxThreads
+    return result
+
+#------------------------------------------------------------------------------
+
+
 def process(newpacket, info):
     from p2p import p2p_service
     if not driver.is_on('service_p2p_hookups'):
@@ -187,13 +220,83 @@ def process(newpacket, info):
 
 
 def handle(newpacket, info):
-    from transport import packet_out
-    handled = False
-    # check that signed by a contact of ours
-    if not newpacket.Valid():
+    """
+    Put incoming packet into signature verification queue.
+
+    Signatures are verified in separate threads, so several packets can be
+    checked at once, but packets from same creator are always verified and
+    handled one by one in the order they were received.
+    """
+    global _VerifyQueues
+    if newpacket.CreatorID not in _VerifyQueues:
+        _VerifyQueues[newpacket.CreatorID] = []
+    _VerifyQueues[newpacket.CreatorID].append((newpacket, info, ))
+    _verify_next()
+    return None
+
+
+def _verify_next():
+    global _VerifyQueues
+    global _VerifyInProgress
+    for sender_idurl, queue in _VerifyQueues.items():
+        if len(_VerifyInProgress) >= _VerifyMaxThreads:
+            break
+        if sender_idurl in _VerifyInProgress:
+            continue
+        newpacket, info = queue[0]
+        # make sure identity is loaded into memory in the main thread,
+        # inside the thread it will be only read from the cache
+        contactsdb.get_contact_identity(sender_idurl)
+        _VerifyInProgress.add(sender_idurl)
+        d = threads.deferToThread(newpacket.Valid)
+        d.addCallback(_on_packet_verified, sender_idurl, newpacket, info)
+        d.addErrback(_on_packet_verify_failed, sender_idurl, newpacket, info)
+
+
+def _on_packet_verified(result, sender_idurl, newpacket, info):
+    global _VerifyCounters
+    _pop_verified_packet(sender_idurl)
+    if not result:
+        _VerifyCounters['not_valid'] += 1
         lg.warn('new packet from %s://%s is NOT VALID: %r' % (
             info.proto, info.host, newpacket))
-        return None
+    else:
+        _VerifyCounters['verified'] += 1
+        try:
+            handle_verified(newpacket, info)
+        except:
+            lg.exc()
+    _verify_next()
+    return None
+
+
+def _on_packet_verify_failed(err, sender_idurl, newpacket, info):
+    global _VerifyCounters
+    _pop_verified_packet(sender_idurl)
+    _VerifyCounters['errors'] += 1
+    lg.err('failed to verify new packet %r from %s://%s : %s' % (
+        newpacket, info.proto, info.host, str(err)))
+    _verify_next()
+    return None
+
+
+def _pop_verified_packet(sender_idurl):
+    global _VerifyQueues
+    global _VerifyInProgress
+    _VerifyInProgress.discard(sender_idurl)
+    queue = _VerifyQueues.get(sender_idurl)
+    if queue:
+        queue.pop(0)
+    if not queue:
+        _VerifyQueues.pop(sender_idurl, None)
+
+
+def handle_verified(newpacket, info):
+    """
+    Pass already verified incoming packet to the handlers.
+    """
+    from transport import packet_out
+    handled = False
     for p in packet_out.search_by_response_packet(newpacket, info.proto, info.host):
         p.automat('inbox-packet', (newpacket, info))
         handled = True
@@ -382,14 +485,14 @@ class PacketIn(automat.Automat):
             # net_misc.ConnectionFailed(None, proto, 'receiveStatusReport %s' % host)
             try:
                 fd, _ = tmpfile.make('error', extension='.inbox')
-                data = bpio.ReadBinaryFile(self.filename)
+                data = tmpfile.read(self.filename)
                 os.write(fd, 'from %s:%s %s\n' % (self.proto, self.host, self.status))
                 os.write(fd, str(data))
                 os.close(fd)
             except:
                 lg.exc()
             try:
-                os.remove(self.filename)
+                tmpfile.throw_out(self.filename, 'unserialize failed')
             except:
                 lg.exc()
             self.automat('unserialize-failed', None)
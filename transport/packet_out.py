@@ -78,6 +78,8 @@ from contacts import identitycache
 
 from userid import my_id
 
+from crypt import signed
+
 from main import settings
 from main import events
 
@@ -86,6 +88,10 @@ from transport import callback
 #------------------------------------------------------------------------------
 
 _OutboxQueue = []
+_OutboxByPacketID = {}
+_OutboxByRemoteIDURL = {}
+_OutboxByFilename = {}
+_OutboxByTransferID = {}
 _PacketsCounter = 0
 
 #------------------------------------------------------------------------------
@@ -119,16 +125,64 @@ def create(outpacket, wide, callbacks, target=None, route=None, response_timeout
             outpacket.Command, outpacket.PacketID, target, route, ))
     p = PacketOut(outpacket, wide, callbacks, target, route, response_timeout, keep_alive)
     queue().append(p)
+    _index_add(p)
     p.automat('run')
     return p
 
 #------------------------------------------------------------------------------
 
 
-def search(proto, host, filename, remote_idurl=None):
-    for p in queue():
-        if p.filename != filename:
+def _index_add(p):
+    """
+    Secondary indexes of the outbox queue are updated when packet_out() is
+    created, written to a file, started by transport or destroyed.
+    """
+    global _OutboxByPacketID
+    global _OutboxByRemoteIDURL
+    _OutboxByPacketID.setdefault(p.outpacket.PacketID, []).append(p)
+    _OutboxByRemoteIDURL.setdefault(p.remote_idurl, []).append(p)
+
+
+def _index_remove(p):
+    global _OutboxByPacketID
+    global _OutboxByRemoteIDURL
+    global _OutboxByFilename
+    for index, key in ((_OutboxByPacketID, p.outpacket.PacketID), (_OutboxByRemoteIDURL, p.remote_idurl), ):
+        items = index.get(key)
+        if items is None:
             continue
+        if p in items:
+            items.remove(p)
+        if not items:
+            index.pop(key)
+    if p.filename and _OutboxByFilename.get(p.filename) is p:
+        _OutboxByFilename.pop(p.filename)
+    for i in p.items:
+        _index_remove_transfer_id(i)
+
+
+def _index_set_filename(p):
+    global _OutboxByFilename
+    _OutboxByFilename[p.filename] = p
+
+
+def _index_set_transfer_id(p, work_item):
+    global _OutboxByTransferID
+    _OutboxByTransferID[work_item.transfer_id] = (p, work_item, )
+
+
+def _index_remove_transfer_id(work_item):
+    global _OutboxByTransferID
+    if work_item.transfer_id and work_item.transfer_id in _OutboxByTransferID:
+        if _OutboxByTransferID[work_item.transfer_id][1] is work_item:
+            _OutboxByTransferID.pop(work_item.transfer_id)
+
+#------------------------------------------------------------------------------
+
+
+def search(proto, host, filename, remote_idurl=None):
+    p = _OutboxByFilename.get(filename)
+    if p is not None:
         for i in p.items:
             if i.proto == proto:
                 if not remote_idurl:
@@ -167,7 +221,17 @@ def search_many(proto=None,
                 packet_id=None,
                 ):
     results = []
-    for p in queue():
+    candidates = None
+    if filename:
+        p = _OutboxByFilename.get(filename)
+        candidates = [p, ] if p else []
+    elif packet_id:
+        candidates = _OutboxByPacketID.get(packet_id, [])
+    elif remote_idurl:
+        candidates = _OutboxByRemoteIDURL.get(remote_idurl, [])
+    else:
+        candidates = queue()
+    for p in candidates:
         if remote_idurl and p.remote_idurl != remote_idurl:
             continue
         if filename and p.filename != filename:
@@ -190,11 +254,7 @@ def search_many(proto=None,
 
 
 def search_by_transfer_id(transfer_id):
-    for p in queue():
-        for i in p.items:
-            if i.transfer_id and i.transfer_id == transfer_id:
-                return p, i
-    return None, None
+    return _OutboxByTransferID.get(transfer_id, (None, None, ))
 
 
 def search_by_response_packet(newpacket, proto=None, host=None):
@@ -207,7 +267,7 @@ def search_by_response_packet(newpacket, proto=None, host=None):
             nameurl.GetName(incoming_owner_idurl), nameurl.GetName(incoming_creator_idurl), nameurl.GetName(incoming_remote_idurl),
             newpacket.Command, newpacket.PacketID, proto, host, ))
         lg.out(_DebugLevel, '    [%s]' % (','.join(map(lambda p: str(p.outpacket), queue()))))
-    for p in queue():
+    for p in list(_OutboxByPacketID.get(newpacket.PacketID, [])):
         if p.outpacket.PacketID != newpacket.PacketID:
             # PacketID of incoming packet not matching with that outgoing packet
             continue
@@ -567,16 +627,30 @@ class PacketOut(automat.Automat):
         """
         Action method.
         """
-        # serialize and write packet on disk
+        # serialize and write packet on disk,
+        # small packets are kept in memory until some transport needs a real file
         a_packet = self.outpacket
         if self.route:
             a_packet = self.route['packet']
         try:
-            fileno, self.filename = tmpfile.make('outbox', extension='.out')
-            self.packetdata = a_packet.Serialize()
-            os.write(fileno, self.packetdata)
-            os.close(fileno)
-            self.filesize = len(self.packetdata)
+            if signed.SupportsBinaryFormat(self.remote_identity):
+                # remote node can read binary format, Payload is written without copying
+                self.packetdata = None
+                parts = a_packet.SerializeParts()
+            else:
+                self.packetdata = a_packet.Serialize()
+                parts = [self.packetdata, ]
+            self.filesize = sum(map(len, parts))
+            if tmpfile.memory_available(self.filesize):
+                self.filename = tmpfile.make_memory('outbox', extension='.out')
+                for part in parts:
+                    tmpfile.write_memory(self.filename, part)
+            else:
+                fileno, self.filename = tmpfile.make('outbox', extension='.out')
+                for part in parts:
+                    os.write(fileno, part)
+                os.close(fileno)
+            _index_set_filename(self)
             if self.filesize < 1024 * 10:
                 self.timeout = 10
             elif self.filesize > 1024 * 1024:
@@ -608,6 +682,8 @@ class PacketOut(automat.Automat):
         """
         Action method.
         """
+        for i in self.items:
+            _index_remove_transfer_id(i)
         self.items = []
 
     def doSetTransferID(self, arg):
@@ -618,7 +694,9 @@ class PacketOut(automat.Automat):
         proto, host, filename, transfer_id = arg
         for i in xrange(len(self.items)):
             if self.items[i].proto == proto:  # and self.items[i].host == host:
+                _index_remove_transfer_id(self.items[i])
                 self.items[i].transfer_id = transfer_id
+                _index_set_transfer_id(self, self.items[i])
                 if _Debug:
                     lg.out(_DebugLevel, 'packet_out.doSetTransferID  %r:%r = %r' % (proto, host, transfer_id))
                 ok = True
@@ -749,6 +827,10 @@ class PacketOut(automat.Automat):
             lg.warn('packet_out not connected to the packet')
         else:
             self.outpacket.Packets.remove(self)
+        _index_remove(self)
+        if self.filename and tmpfile.is_memory(self.filename):
+            # nobody is going to resend that packet, release the memory now
+            tmpfile.throw_out(self.filename, 'packet finished')
         self.outpacket = None
         self.remote_identity = None
         if self.caching_deferred and not self.caching_deferred.called:
@@ -904,6 +986,7 @@ class PacketOut(automat.Automat):
             for i in self.items:
                 if i.transfer_id and i.transfer_id == transfer_id:
                     self.items.remove(i)
+                    _index_remove_transfer_id(i)
                     i.status = status
                     i.error_message = error_message
                     i.bytes_sent = size
@@ -915,6 +998,7 @@ class PacketOut(automat.Automat):
             for i in self.items:
                 if i.proto == proto and i.host == host:
                     self.items.remove(i)
+                    _index_remove_transfer_id(i)
                     i.status = 'failed'
                     i.error_message = err_msg
                     i.bytes_sent = size
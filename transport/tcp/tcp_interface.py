@@ -79,6 +79,14 @@ def proxy(instance=None):
             lg.out(4, 'tcp_interface.proxy created new gate instance: %d' % id(_GateProxy))
     return _GateProxy
 
+
+def is_local():
+    """
+    Return True if gateway is running in the same process,
+    so received files can be passed to it in memory.
+    """
+    return proxy() is not None and not isinstance(proxy(), xmlrpc.Proxy)
+
 #------------------------------------------------------------------------------
 
 
@@ -105,6 +113,11 @@ class GateInterface():
         proxy(False)
         return True
 
+    def memory_files_supported(self):
+        """
+        """
+        return is_local()
+
     def connect(self, options):
         """
         """
@@ -403,7 +403,12 @@ class InboxFile():
         self.stream = stream
         self.file_id = file_id
         self.size = file_size
-        self.fin, self.filename = tmpfile.make("tcp-in", extension='.tcp')
+        from transport.tcp import tcp_interface
+        if tcp_interface.is_local() and tmpfile.memory_available(self.size):
+            self.fin = None
+            self.filename = tmpfile.make_memory("tcp-in", extension='.tcp')
+        else:
+            self.fin, self.filename = tmpfile.make("tcp-in", extension='.tcp')
         self.bytes_received = 0
         self.started = time.time()
         self.last_block_time = time.time()
@@ -416,10 +421,11 @@ class InboxFile():
         if _Debug:
             lg.out(_DebugLevel, '<<<TCP-IN %s CLOSED with %s | %s' % (
                 self.file_id, self.stream.connection.peer_address, self.stream.connection.peer_external_address))
-        try:
-            os.close(self.fin)
-        except:
-            lg.exc()
+        if self.fin is not None:
+            try:
+                os.close(self.fin)
+            except:
+                lg.exc()
         self.fin = None
         self.stream = None
 
@@ -427,7 +433,10 @@ class InboxFile():
         return self.bytes_received
 
     def input_data(self, data):
-        os.write(self.fin, data)
+        if self.fin is None:
+            tmpfile.write_memory(self.filename, data)
+        else:
+            os.write(self.fin, data)
         self.bytes_received += len(data)
         self.stream.connection.total_bytes_received += len(data)
         self.last_block_time = time.time()
@@ -459,7 +468,7 @@ class OutboxFile():
         self.bytes_out = 0
         self.started = time.time()
         self.timeout = max(int(self.size / settings.SendingSpeedLimit()), 6)
-        self.fout = open(self.filename, 'rb')
+        self.fout = tmpfile.open_read(self.filename)
         self.sender = None
         if _Debug:
             lg.out(
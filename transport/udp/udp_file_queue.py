@@ -139,11 +139,11 @@ class FileQueue:
             # we have a queue of files to be sent
             # somehow file may be removed before we start sending it
             # so I check it here and skip not existed files
-            if not os.path.isfile(filename):
+            if not tmpfile.exists(filename):
                 self.on_failed_outbox_queue_item(filename, description, 'file not exist', result_defer, keep_alive)
                 continue
             try:
-                filesize = os.path.getsize(filename)
+                filesize = tmpfile.size(filename)
             except:
                 self.on_failed_outbox_queue_item(filename, description, 'can not get file size', result_defer, keep_alive)
                 continue
@@ -465,8 +465,13 @@ class InboxFile():
         self.queue = queue
         self.stream_callback = None
         self.stream_id = stream_id
-        self.fd, self.filename = tmpfile.make("udp-in", extension='.udp')
         self.size = size
+        from transport.udp import udp_interface
+        if udp_interface.is_local() and tmpfile.memory_available(self.size):
+            self.fd = None
+            self.filename = tmpfile.make_memory("udp-in", extension='.udp')
+        else:
+            self.fd, self.filename = tmpfile.make("udp-in", extension='.udp')
         self.bytes_received = 0
         self.started = time.time()
         self.cancelled = False
@@ -503,11 +508,15 @@ class InboxFile():
         self.stream_callback = None
 
     def close_file(self):
-        os.close(self.fd)
+        if self.fd is not None:
+            os.close(self.fd)
         self.fd = None
 
     def process(self, newdata):
-        os.write(self.fd, newdata)
+        if self.fd is None:
+            tmpfile.write_memory(self.filename, newdata)
+        else:
+            os.write(self.fd, newdata)
         self.bytes_received += len(newdata)
 
     def is_done(self):
@@ -548,7 +557,7 @@ class OutboxFile():
         self.status = None
         self.error_message = ''
         self.started = time.time()
-        self.fileobj = open(self.filename, 'rb')
+        self.fileobj = tmpfile.open_read(self.filename)
         if _Debug:
             lg.out(18, 'udp_file_queue.OutboxFile.__init__ {%s} [%d] to %s with %d bytes' % (
                 os.path.basename(self.filename), self.stream_id, str(self.queue.session.peer_address), self.size))
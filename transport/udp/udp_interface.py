@@ -64,6 +64,14 @@ def proxy():
     global _GateProxy
     return _GateProxy
 
+
+def is_local():
+    """
+    Return True if gateway is running in the same process,
+    so received files can be passed to it in memory.
+    """
+    return proxy() is not None and not isinstance(proxy(), xmlrpc.Proxy)
+
 #------------------------------------------------------------------------------
 
 
@@ -117,6 +125,11 @@ class GateInterface():
             _GateProxy = None
         return succeed(True)
 
+    def memory_files_supported(self):
+        """
+        """
+        return is_local()
+
     def connect(self, options):
         """
         """
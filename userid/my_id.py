@@ -545,6 +545,9 @@ def rebuildLocalIdentity(skip_transports=[]):
     vernum = bpio.ReadTextFile(settings.VersionNumberFile())
     repo, _ = misc.ReadRepoLocation()
     lid.version = (vernum.strip() + ' ' + repo.strip() + ' ' + bpio.osinfo().strip()).strip()
+    # let others know that I can read packets in binary format
+    from crypt import signed
+    lid.version = (lid.version + ' ' + signed.BINARY_FORMAT_TAG).strip()
     # generate signature with changed content
     lid.sign()
     new_xmlsrc = lid.serialize()